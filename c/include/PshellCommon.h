@@ -86,6 +86,15 @@ struct PshellMsg
 #define PSHELL_QUERY_TITLE          10  /* pshell client initiated */
 #define PSHELL_QUERY_PROMPT         11  /* pshell client initiated */
 #define PSHELL_CONTROL_COMMAND      12  /* control client initiated */
+#define PSHELL_QUERY_ALL            13  /* pshell client initiated, all server info and commands (JSON), Python server only */
+#define PSHELL_QUERY_CATALOG_VERSION 14 /* control client initiated, digest of the command catalog, Python server only */
+#define PSHELL_DISCOVER             15  /* control client initiated, usually broadcast, Python server only */
+#define PSHELL_BATCH                16  /* control client initiated, JSON list of commands, Python server only */
+#define PSHELL_CONDITIONAL          17  /* control client initiated, command with digest of last output, Python server only */
+#define PSHELL_NOT_MODIFIED         18  /* server reply to a conditional command whose output is unchanged */
+#define PSHELL_SUBSCRIBE            19  /* control client initiated, run a command periodically, Python server only */
+#define PSHELL_UNSUBSCRIBE          20  /* control client initiated, Python server only */
+#define PSHELL_SUBSCRIPTION_DATA    21  /* server initiated, pushed output of a subscribed command */
 
 #define PSHELL_COMMAND_DELIMETER "/"  /* delimits commands for queryCommands2 */
 
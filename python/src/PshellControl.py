@@ -44,18 +44,40 @@ module.
 
 Functions:
 
+discoverServers()      -- find all the UDP pshell servers that answer a broadcast query
 connectServer()        -- connect to a remote pshell server
+connectServers()       -- connect to a list of remote pshell servers in one call
+probeServers()         -- check that a set of servers are reachable with one request each
 disconnectServer()     -- disconnect from a remote pshell server
+reconnectServer()      -- reconnect a disconnected server, keeping its ServerId and statistics
 disconnectAllServers() -- disconnect from all connected remote pshell servers
+setSharedSocket()      -- use a single source socket for all subsequently connected servers
 setDefaultTimeout()    -- set the default server response timeout
+setDnsCacheTimeout()   -- set how long a resolved UDP server hostname is cached
+setConditionalRequests() -- only transfer command results that have changed since the last request
+setMulticastInterface() -- set the interface and TTL used to send to an IP multicast group
+getServerAddress()     -- return the address currently used to reach a server
 extractCommands()      -- extract all commands from remote server
+getCatalog()           -- return the cached command catalog of a remote server
+validateCommand()      -- resolve and validate a command against the cached catalog
+getCommandTimeout()    -- return the timeout to use for a command from the cached catalog
 addMulticast()         -- add a command keyword to a multicast group
 sendMulticast()        -- send a command to a multicast group
+sendGroupCommand()     -- send command to a broadcast or IP multicast group and gather the replies
 sendCommand1()         -- send command to server using default timeout, no results extracted
 sendCommand2()         -- send command to server using timeout override, no results extracted
 sendCommand3()         -- send command to server using default timeout, results extracted
 sendCommand4()         -- send command to server using timeout override, results extracted
+sendBatch()            -- send a list of commands to server in one request, results extracted
+subscribe()            -- have the server run a command periodically and push its results
+unsubscribe()          -- cancel a subscription made with subscribe
+getSubscriptionData()  -- return the results pushed by the server for our subscriptions
+send()                 -- send command to server without waiting for the response
+waitAny()              -- wait for the first response to a send from a set of servers
+waitAll()              -- wait for all the responses to a send from a set of servers
 getResponseString()    -- return the human readable form of one of the command response return codes
+getStats()             -- return the request/response statistics for one or all servers
+resetStats()           -- reset the request/response statistics for one or all servers
 setLogLevel()          -- set the internal log level for this module
 setLogFunction()       -- register a user function to receive all logs
 
@@ -84,6 +106,11 @@ Used if we cannot connect to a local UNIX socket
 
 INVALID_SID
 
+Use this as the "sid" identifier for the getStats and resetStats
+calls to operate on all connected servers
+
+ALL_SIDS
+
 Constants to let the host program set the internal debug log level,
 if the user of this API does not want to see any internal message
 printed out, set the debug log level to LOG_LEVEL_NONE, the default
@@ -126,6 +153,19 @@ import struct
 import random
 import fcntl
 import fnmatch
+import json
+import hashlib
+import threading
+import bisect
+try:
+  import selectors
+except ImportError:
+  try:
+    # python2 backport of the selectors module
+    import selectors2 as selectors
+  except ImportError:
+    # fall back to select.select
+    selectors = None
 from collections import OrderedDict
 from collections import namedtuple
 
@@ -170,6 +210,10 @@ MULTICAST_ALL = "__multicast_all__"
 # used if we cannot connect to a local UNIX socket
 INVALID_SID = -1
 
+# use this as the "sid" identifier for the getStats and resetStats
+# calls to operate on all connected servers
+ALL_SIDS = -2
+
 # constants to let the host program set the internal debug log level,
 # if the user of this API does not want to see any internal message
 # printed out, set the debug log level to LOG_LEVEL_NONE (0)
@@ -190,6 +234,29 @@ LOG_LEVEL_DEFAULT = LOG_LEVEL_ALL
 #
 #################################################################################
 
+#################################################################################
+#################################################################################
+def discoverServers(broadcastAddress, port, timeout = ONE_SEC, numPorts = 1):
+  """
+  Find the UDP pshell servers on a subnet, a single discovery request is sent
+  to the broadcast address (a unicast address can also be used) for each port
+  in the range and all the replies received within the timeout are collected.
+  The returned host and port are the address the server replied from, which
+  can be used directly in the connectServer call.  Servers that do not support
+  discovery are not reported
+
+    Args:
+        broadcastAddress (str) : Subnet broadcast address, e.g. 192.168.1.255
+        port (int)             : The first UDP port to query
+        timeout (int)          : How long to collect replies (in msec)
+        numPorts (int)         : The number of consecutive ports to query
+
+    Returns:
+        list : A dictionary for each server with the keys name, host, port,
+               title and version, sorted by host and port
+  """
+  return (_discoverServers(broadcastAddress, port, timeout, numPorts))
+
 #################################################################################
 #################################################################################
 def connectServer(controlName, remoteServer, port, defaultTimeout):
@@ -209,7 +276,10 @@ def connectServer(controlName, remoteServer, port, defaultTimeout):
   remoteServer must be either a valid hostname or IP address and a
   valid destination port must be provided, for a UNIX server, only
   a valid server name must be provided along with the identifier
-  PshellControl.UNIX for the 'port' parameter
+  PshellControl.UNIX for the 'port' parameter, a subnet broadcast
+  address or an IP multicast group address (224.0.0.0 to 239.255.255.255)
+  can also be used for a UDP remoteServer, in which case the commands
+  are fire-and-forget, use sendGroupCommand to collect the replies
 
   This function returns a Server ID (sid) handle which must be saved and
   used for all subsequent calls into this module
@@ -225,6 +295,55 @@ def connectServer(controlName, remoteServer, port, defaultTimeout):
   """
   return (_connectServer(controlName, remoteServer, port, defaultTimeout))
 
+#################################################################################
+#################################################################################
+def connectServers(servers, defaultTimeout):
+  """
+  Connect to a list of pshell servers in a single call, this is the same as
+  calling connectServer for each server, but the config file is only read
+  once and the hostnames of the UDP servers are resolved in parallel rather
+  than one after the other, which makes a large difference when connecting
+  to hundreds of servers, the connections are not checked, use probeServers
+  to find out which servers are reachable
+
+    Args:
+        servers (list)       : A (controlName, remoteServer, port) tuple for each
+                               server, as the arguments of connectServer
+        defaultTimeout (int) : The default timeout (in msec) for the remote server responses
+
+    Returns:
+        list: The ServerId (sid) handle of each server, in the same order, or
+              INVALID_SID for the servers that could not be connected
+  """
+  return (_connectServers(servers, defaultTimeout))
+
+#################################################################################
+#################################################################################
+def probeServers(sids, timeout, lock = None):
+  """
+  Check that a set of servers are reachable, a single small request is sent to
+  all the servers at once and their replies are waited on with a single
+  selector, so the time taken is that of the slowest server rather than the
+  sum of all the servers, the reply also tells us if the server's command
+  catalog is already cached on disk, in which case it is loaded, broadcast
+  and multicast servers are not probed.  A thread that probes the servers in
+  the background while other threads send them commands passes the lock those
+  threads hold, it is only held while the probes are sent and their replies
+  are read, not while waiting for them, a probe that is superseded by another
+  request to the same server is left out of the results
+
+    Args:
+        sids (list)   : The ServerIds as returned from the connectServer(s) call
+        timeout (int) : The time (in msec) to wait for all the replies
+        lock (Lock)   : The lock shared with the other threads that use this
+                        module, None if there are none
+
+    Returns:
+        dict: The return code for each probed ServerId, COMMAND_SUCCESS if the
+              server replied, otherwise SOCKET_SEND_FAILURE or SOCKET_TIMEOUT
+  """
+  return (_probeServers(sids, timeout, lock))
+
 #################################################################################
 #################################################################################
 def disconnectServer(sid):
@@ -240,6 +359,23 @@ def disconnectServer(sid):
   """
   _disconnectServer(sid)
 
+#################################################################################
+#################################################################################
+def reconnectServer(sid):
+  """
+  Reopen the connection of a server that was disconnected with disconnectServer,
+  the server keeps its ServerId, its settings and its statistics, so a client
+  that connects and disconnects servers on demand does not use a new ServerId
+  each time, nothing is sent to the server
+
+    Args:
+        sid (int) : The ServerId as returned from the connectServer call
+
+    Returns:
+        bool : True if the server is connected, False otherwise
+  """
+  return (_reconnectServer(sid))
+
 #################################################################################
 #################################################################################
 def disconnectAllServers():
@@ -258,6 +394,28 @@ def disconnectAllServers():
   """
   _disconnectAllServers()
 
+#################################################################################
+#################################################################################
+def setSharedSocket(enable):
+  """
+  Enable or disable the shared socket mode for all subsequent connectServer
+  calls, in shared mode all UDP servers are reached via a single UDP source
+  socket and all UNIX servers via a single UNIX source socket, rather than
+  one socket (and for UNIX, one lock file and socket file) per server, the
+  replies are demultiplexed by the server's address and the message seqNum,
+  this greatly reduces the number of file descriptors and the connect time
+  of a controller that talks to a large number of servers, the shared socket
+  is released when the last server that uses it is disconnected, the default
+  is disabled
+
+    Args:
+        enable (bool) : Use a shared source socket for subsequent connections
+
+    Returns:
+        none
+  """
+  _setSharedSocket(enable)
+
 #################################################################################
 #################################################################################
 def setDefaultTimeout(sid, defaultTimeout):
@@ -274,6 +432,83 @@ def setDefaultTimeout(sid, defaultTimeout):
   """
   _setDefaultTimeout(sid, defaultTimeout)
 
+#################################################################################
+#################################################################################
+def setDnsCacheTimeout(timeout):
+  """
+  Set how long the resolved address of a UDP server's hostname is cached
+  before it is resolved again, the hostname is resolved once at connect time
+  and whenever the cache timeout expires, it is also re-resolved on the next
+  command after a send failure or response timeout, a timeout value of 0 will
+  resolve the hostname for every command, the default is 60 seconds
+
+    Args:
+        timeout (int) : The hostname cache timeout (in msec)
+
+    Returns:
+        none
+  """
+  _setDnsCacheTimeout(timeout)
+
+#################################################################################
+#################################################################################
+def setConditionalRequests(enable):
+  """
+  Enable or disable conditional requests for the sendCommand3 and sendCommand4
+  functions, when enabled, the last successful results of each command are
+  cached per server and the digest of those results is sent with the next
+  request of the same command, the server still runs the command but replies
+  with a small 'not modified' message when the output is unchanged, and the
+  cached results are returned, this is transparent to the caller and reduces
+  the reply traffic of status commands that are polled, servers that do not
+  support conditional requests are detected and sent plain commands, the
+  default is disabled
+
+    Args:
+        enable (bool) : Enable/disable conditional requests
+
+    Returns:
+        none
+  """
+  _setConditionalRequests(enable)
+
+#################################################################################
+#################################################################################
+def setMulticastInterface(interface, ttl = 1):
+  """
+  Set the local interface that commands to an IP multicast group are sent out
+  of and how many router hops they may cross, the default is the interface of
+  the default route and a TTL of 1 (i.e. the local subnet), commands are always
+  looped back to any group members on this host, this must be called before
+  the connectServer call for the group
+
+    Args:
+        interface (str) : Local interface address, use LOCALHOST for loopback
+        ttl (int)       : The multicast time-to-live
+
+    Returns:
+        none
+  """
+  _setMulticastInterface(interface, ttl)
+
+#################################################################################
+#################################################################################
+def getServerAddress(sid):
+  """
+  Return the destination address that is currently being used to reach the
+  remote server, for a UDP server this is the resolved IP address and port
+  of the server's hostname, for a UNIX server this is the server's socket path,
+  prefixed with '@' if the server is bound in the abstract namespace
+
+    Args:
+        sid (int) : The ServerId as returned from the connectServer call
+
+    Returns:
+        str : The server address in the format <ipAddress>:<port> (UDP) or
+              <path> (UNIX), or an empty string for an invalid sid
+  """
+  return (_getServerAddress(sid))
+
 #################################################################################
 #################################################################################
 def extractCommands(sid, includeName = True):
@@ -292,6 +527,73 @@ def extractCommands(sid, includeName = True):
   """
   return (_extractCommands(sid, includeName))
 
+#################################################################################
+#################################################################################
+def getCatalog(sid):
+  """
+  Return the command catalog of a remote server, i.e. a list of dictionaries
+  with the keys name, description, usage, minArgs, maxArgs and showUsage for
+  each registered command.  The catalog is fetched once per server and cached,
+  it is also persisted under /tmp/.pshell keyed by the catalog version reported
+  by the server, so subsequent clients only need to query the catalog version.
+  An empty list is returned if the server does not support catalog queries
+
+    Args:
+        sid (int) : The ServerId as returned from the connectServer call
+
+    Returns:
+        list : The remote server's command catalog
+  """
+  return (_getCatalog(sid))
+
+#################################################################################
+#################################################################################
+def validateCommand(sid, command):
+  """
+  Resolve a command against the remote server's cached catalog without sending
+  it to the server.  The command keyword may be abbreviated, the same as when
+  typed at the server, the returned command has the keyword expanded.  If the
+  command is not found, is ambiguous, has the wrong number of arguments or is
+  a request for the usage, results contains the text the server would have
+  replied with and the command should not be sent.  If no catalog is available
+  the command is returned unchanged with COMMAND_SUCCESS and empty results
+
+    Args:
+        sid (int)     : The ServerId as returned from the connectServer call
+        command (str) : The command to validate
+
+    Returns:
+        int : One of the following return codes:
+                COMMAND_SUCCESS
+                COMMAND_NOT_FOUND
+                COMMAND_INVALID_ARG_COUNT
+        str : The command with the keyword expanded
+        str : The locally generated results, empty if the command should be sent
+  """
+  return (_validateCommand(sid, command))
+
+#################################################################################
+#################################################################################
+def getCommandTimeout(sid, command, timeout):
+  """
+  Return the timeout that would be used to wait for the reply to the given
+  command, this is derived from the expected duration the command was
+  registered with in the server's cached catalog, scaled by a safety factor,
+  the passed timeout is returned unchanged if no catalog is cached, the command
+  has no expected duration, or the timeout is NO_WAIT.  This is useful for
+  callers that send commands with the send function and wait for the replies
+  themselves
+
+    Args:
+        sid (int)     : The ServerId as returned from the connectServer call
+        command (str) : The command that will be sent
+        timeout (int) : The wait timeout to use if there is no better one
+
+    Returns:
+        int : The wait timeout in msec
+  """
+  return (_getServerCommandTimeout(sid, command, timeout))
+
 #################################################################################
 #################################################################################
 def addMulticast(sid, keyword = MULTICAST_ALL):
@@ -330,13 +632,36 @@ def sendMulticast(command):
   """
   _sendMulticast(command)
 
+#################################################################################
+#################################################################################
+def sendGroupCommand(sid, timeoutOverride, command, maxReplies = 0):
+  """
+  Send a command to a server that was connected with a subnet broadcast address
+  or an IP multicast group address, a single datagram reaches every server in the
+  group, the replies are gathered until the timeout expires or maxReplies replies
+  have been received, a timeout of 0 will not request any reply from the servers
+
+    Args:
+        sid (int)             : The ServerId as returned from the connectServer call
+        timeoutOverride (int) : How long to gather the replies (in msec)
+        command (str)         : The command to send to the remote servers
+        maxReplies (int)      : Stop gathering after this many replies, 0 for no limit
+
+    Returns:
+        list : A dictionary for each server that replied, in the order the replies
+               arrived, with the keys host, port, retCode and results
+  """
+  return (_sendGroupCommand(sid, timeoutOverride, command, maxReplies))
+
 #################################################################################
 #################################################################################
 def sendCommand1(sid, command):
   """
   Send a command using the default timeout setup in the connectServer call,
   if the default timeout is 0, the server will not reply with a response and
-  this function will not wait for one
+  this function will not wait for one, if the server's catalog has been cached
+  (see getCatalog) and the command advertises an expected duration, the
+  timeout is based on that duration instead of the default
 
     Args:
         sid (int)     : The ServerId as returned from the connectServer call
@@ -388,7 +713,9 @@ def sendCommand3(sid, command):
   Send a command using the default timeout setup in the connectServer call and
   return any results received in the payload, if the default timeout is 0, the
   server will not reply with a response and this function will not wait for one,
-  and no results will be extracted
+  and no results will be extracted, if the server's catalog has been cached (see
+  getCatalog) and the command advertises an expected duration, the timeout is
+  based on that duration instead of the default
 
     Args:
         sid (int)     : The ServerId as returned from the connectServer call
@@ -438,6 +765,167 @@ def sendCommand4(sid, timeoutOverride, command):
   """
   return (_sendCommand4(sid, timeoutOverride, command))
 
+#################################################################################
+#################################################################################
+def sendBatch(sid, commands):
+  """
+  Send a list of commands to a server in a single request, the server runs them
+  in order and returns all their results in a single reply, the timeout is the
+  sum of the timeouts the commands would have if they were sent one at a time,
+  a long list or one with a lot of output may take more than one request, a
+  command whose output is too big for a batch reply is run again on its own,
+  if the server does not support batches, or the default timeout is 0, the
+  commands are sent one at a time
+
+    Args:
+        sid (int)       : The ServerId as returned from the connectServer call
+        commands (list) : The commands to send to the remote server
+
+    Returns:
+        list: A (results, retCode) tuple for each command, in the same order,
+              as returned from the sendCommand4 function
+  """
+  return (_sendBatch(sid, commands))
+
+#################################################################################
+#################################################################################
+def subscribe(sid, command, interval, lease = ONE_MINUTE, changesOnly = False):
+  """
+  Ask the server to run a command every interval msec and push its results to
+  us until we unsubscribe or the lease expires, rather than polling it with a
+  request per interval, the server runs the command once per interval no
+  matter how many clients are subscribed to the same command and interval,
+  the pushed results are collected with the getSubscriptionData function,
+  which also renews the lease, if changesOnly is set the results are only
+  pushed when they differ from the last ones sent to us
+
+    Args:
+        sid (int)          : The ServerId as returned from the connectServer call
+        command (str)      : The command to run on the remote server
+        interval (int)     : How often (in msec) the server runs the command
+        lease (int)        : How long (in msec) the subscription lasts if not renewed
+        changesOnly (bool) : Only push the results when they have changed
+
+    Returns:
+        str: The current results of the command, as returned from the
+             sendCommand4 function
+        int: Return code result of the command, as returned from the
+             sendCommand4 function, COMMAND_NOT_FOUND if the server
+             does not support subscriptions
+  """
+  return (_subscribe(sid, command, interval, lease, changesOnly))
+
+#################################################################################
+#################################################################################
+def unsubscribe(sid, command, interval):
+  """
+  Cancel a subscription made with the subscribe function, all subscriptions
+  are also cancelled when the server is disconnected
+
+    Args:
+        sid (int)      : The ServerId as returned from the connectServer call
+        command (str)  : The command that was subscribed to
+        interval (int) : The interval that was subscribed to
+
+    Returns:
+        int: Return code result of the request, as returned from the
+             sendCommand1 function
+  """
+  return (_unsubscribe(sid, command, interval))
+
+#################################################################################
+#################################################################################
+def getSubscriptionData(sid, timeout):
+  """
+  Return all the results the server has pushed for our subscriptions since the
+  last call, waiting up to the timeout for some to arrive if there are none,
+  the leases of the subscriptions are renewed as needed, so this must be
+  called at least as often as half the shortest lease
+
+    Args:
+        sid (int)     : The ServerId as returned from the connectServer call
+        timeout (int) : How long (in msec) to wait for results
+
+    Returns:
+        list: A dictionary for each pushed result, in the order received,
+              with the keys 'command', 'interval', 'retCode' and 'results'
+  """
+  return (_getSubscriptionData(sid, timeout))
+
+#################################################################################
+#################################################################################
+def send(sid, command):
+  """
+  Send a command to the server without waiting for the response, the response
+  is collected with a subsequent call to waitAny or waitAll, this allows a
+  controller to have requests outstanding to several servers at the same time,
+  only one request can be outstanding per server, sending a new request to a
+  server supersedes any outstanding one, no response is requested from a
+  broadcast server
+
+    Args:
+        sid (int)     : The ServerId as returned from the connectServer call
+        command (str) : The command to send to the remote server
+
+    Returns:
+        int: Return code result of the send:
+               COMMAND_SUCCESS
+               SOCKET_SEND_FAILURE
+               SOCKET_NOT_CONNECTED
+  """
+  return (_send(sid, command))
+
+#################################################################################
+#################################################################################
+def waitAny(sids, timeout):
+  """
+  Wait for the first response to arrive for any of the requests previously
+  issued with the send function to the given servers, all the servers are
+  waited on with a single selector (i.e. epoll on Linux), servers with no
+  outstanding request are ignored, a request whose response did not arrive
+  within the timeout remains outstanding and can be waited on again.  The
+  responses are returned in the order they were read from their sockets, the
+  responses that are found waiting on several sockets at once are read in no
+  particular order, as their order of arrival is not known
+
+    Args:
+        sids (list)   : The ServerIds as returned from the connectServer call
+        timeout (int) : The time (in msec) to wait for a response
+
+    Returns:
+        int: The ServerId of the responding server or INVALID_SID on timeout
+        str: The human readable results of the command response
+        int: Return code result of the command:
+               COMMAND_SUCCESS
+               COMMAND_NOT_FOUND
+               COMMAND_INVALID_ARG_COUNT
+               SOCKET_RECEIVE_FAILURE
+               SOCKET_TIMEOUT
+  """
+  return (_waitAny(sids, timeout))
+
+#################################################################################
+#################################################################################
+def waitAll(sids, timeout):
+  """
+  Wait for the responses to all the requests previously issued with the send
+  function to the given servers, all the servers are waited on with a single
+  selector (i.e. epoll on Linux), so the total wait time is bounded by the
+  slowest server rather than the sum of all the servers, servers with no
+  outstanding request are ignored, requests whose response did not arrive
+  within the timeout are cancelled and reported as SOCKET_TIMEOUT
+
+    Args:
+        sids (list)   : The ServerIds as returned from the connectServer call
+        timeout (int) : The time (in msec) to wait for all the responses
+
+    Returns:
+        dict: The (results, retCode) tuple for each waited on ServerId, where
+              results is the human readable results of the command response
+              and retCode is one of the return codes listed for waitAny
+  """
+  return (_waitAll(sids, timeout))
+
 #################################################################################
 #################################################################################
 def getResponseString(retCode):
@@ -453,6 +941,66 @@ def getResponseString(retCode):
   """
   return (_getResponseString(retCode))
 
+#################################################################################
+#################################################################################
+def getStats(sid = ALL_SIDS):
+  """
+  Return the request/response statistics that have been collected for a given
+  server, or the aggregate statistics of all connected servers, the statistics
+  consist of the number of requests issued, a count of each return code, the
+  number of bytes sent and received, and the response latency (in msec) along
+  with the log-linear latency histogram the percentiles are derived from, the
+  latency is only measured for requests that received a response, the run of
+  requests the server did not reply to tells whether it is reachable
+
+    Args:
+        sid (int) : The ServerId as returned from the connectServer call,
+                    if no sid is supplied, the aggregate statistics of all
+                    connected servers will be returned
+
+    Returns:
+        dict: The statistics of the server(s) with the following keys:
+                requests      (int)  : Number of requests sent
+                retCodes      (dict) : Count of each return code, keyed by
+                                       the getResponseString value
+                bytesSent     (int)  : Number of bytes sent
+                bytesReceived (int)  : Number of bytes received
+                latency       (dict) : count, min, max, mean, last, p50, p90,
+                                       p99 (in msec)
+                histogram     (list) : Non-empty latency buckets as a tuple of
+                                       (lower, upper, count), bounds in usec
+                failures      (int)  : Number of requests the server did not
+                                       reply to, i.e. any SOCKET_ return code
+                consecutiveFailures (int) : Number of requests in a row the
+                                       server did not reply to
+                reachable     (bool) : False if the server has not replied to
+                                       the last few requests, or has never
+                                       replied, True otherwise, None if no
+                                       request has been sent yet
+                lastReplyTime (float): Time of the last reply, None if none
+                lastError     (str)  : The getResponseString value of the last
+                                       unsuccessful request, None if none
+                lastErrorTime (float): Time of the last unsuccessful request
+  """
+  return (_getStats(sid))
+
+#################################################################################
+#################################################################################
+def resetStats(sid = ALL_SIDS):
+  """
+  Reset the request/response statistics of a given server, or of all connected
+  servers
+
+    Args:
+        sid (int) : The ServerId as returned from the connectServer call,
+                    if no sid is supplied, the statistics of all connected
+                    servers will be reset
+
+    Returns:
+        none
+  """
+  _resetStats(sid)
+
 #################################################################################
 #################################################################################
 def setLogLevel(level):
@@ -504,39 +1052,41 @@ def setLogFunction(function):
 
 #################################################################################
 #################################################################################
-def _connectServer(controlName_, remoteServer_, port_, defaultTimeout_):
+def _connectServer(controlName_, remoteServer_, port_, defaultTimeout_, config_ = None, resolve_ = True):
   global _gPshellControl
   global _gUnixSocketPath
   global _gLockFileExtension
   global _gPshellMsgPayloadLength
   isBroadcastAddress = False
   sid = INVALID_SID
-  _cleanupUnixResources()
-  (remoteServer_, port_, defaultTimeout_) = _loadConfigFile(controlName_, remoteServer_, port_, defaultTimeout_)
+  (remoteServer_, port_, defaultTimeout_) = _loadConfigFile(controlName_, remoteServer_, port_, defaultTimeout_, config_)
   if (port_.lower() == "unix"):
     # UNIX domain socket
-    socketFd = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
-    # bind our source socket so we can get replies
-    sourceAddress = _gUnixSocketPath+remoteServer_+"-control"+str(random.randrange(1000))
-    lockFile = sourceAddress+_gLockFileExtension
-    bound = False
-    while (not bound):
-      try:
-        lockFd = open((lockFile), "w+")
-        fcntl.flock(lockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        socketFd.bind(sourceAddress)
-        bound = True
-      except Exception as e:
-        sourceAddress = _gUnixSocketPath+remoteServer_+"-control"+str(random.randrange(1000))
-        lockFile = sourceAddress+_gLockFileExtension
+    (socketFd, lockFd, sourceAddress, isShared) = _getSocket("unix", remoteServer_)
+    if (socketFd == None):
+      return (INVALID_SID)
+    destAddress = _gUnixSocketPath+remoteServer_
+    if (not os.path.exists(destAddress)):
+      # no socket file, assume the server is bound in the abstract namespace
+      destAddress = "\0"+destAddress
     _gPshellControl.append({"socket":socketFd,
+                            "isShared":isShared,
                             "timeout":defaultTimeout_,
                             "serverType":"unix",
                             "isBroadcastAddress":isBroadcastAddress,
                             "lockFd":lockFd,
                             "sourceAddress":sourceAddress,
-                            "destAddress":_gUnixSocketPath+remoteServer_,
+                            "destAddress":destAddress,
                             "remoteServer":controlName_+"[unix]",
+                            "stats":_createStats(),
+                            "pending":None,
+                            "reply":None,
+                            "catalog":None,
+                            "batch":True,
+                            "conditional":True,
+                            "outputs":OrderedDict(),
+                            "subscriptions":{},
+                            "subscriptionData":[],
                             "pshellMsg":OrderedDict([("msgType",0),
                                                      ("respNeeded",True),
                                                      ("dataNeeded",True),
@@ -547,7 +1097,7 @@ def _connectServer(controlName_, remoteServer_, port_, defaultTimeout_):
     sid = len(_gPshellControl)-1
   else:
     # IP domain socket
-    socketFd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    (socketFd, lockFd, sourceAddress, isShared) = _getSocket("udp", remoteServer_)
     ipAddrOctets = remoteServer_.split(".")
     # if we are trying to use a subnet broadcast address, set our socket option
     if ((len(ipAddrOctets) == 4) and (ipAddrOctets[3] == "255")):
@@ -555,47 +1105,353 @@ def _connectServer(controlName_, remoteServer_, port_, defaultTimeout_):
       isBroadcastAddress = True
       defaultTimeout_ = NO_WAIT
       socketFd.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    # bind our source socket so we can get replies
-    socketFd.bind(("", 0))
+    elif (_isMulticastAddress(ipAddrOctets)):
+      # IP multicast group, treated the same as a broadcast address, one
+      # datagram reaches all the servers that have joined the group
+      isBroadcastAddress = True
+      defaultTimeout_ = NO_WAIT
+      _setMulticastOptions(socketFd)
     _gPshellControl.append({"socket":socketFd,
+                            "isShared":isShared,
                             "timeout":defaultTimeout_,
                             "serverType":"udp",
                             "isBroadcastAddress":isBroadcastAddress,
-                            "lockFd":None,
-                            "sourceAddress":None,
+                            "lockFd":lockFd,
+                            "sourceAddress":sourceAddress,
+                            "destHost":remoteServer_,
+                            "destPort":int(port_),
+                            "resolveTime":None,
                             "destAddress":(remoteServer_, int(port_)),
                             "remoteServer":controlName_+"["+remoteServer_+"]",
+                            "stats":_createStats(),
+                            "pending":None,
+                            "reply":None,
+                            "catalog":None,
+                            "batch":True,
+                            "conditional":True,
+                            "outputs":OrderedDict(),
+                            "subscriptions":{},
+                            "subscriptionData":[],
                             "pshellMsg":OrderedDict([("msgType",0),
                                                      ("respNeeded",True),
                                                      ("dataNeeded",True),
                                                      ("pad",0),
                                                      ("seqNum",0),
                                                      ("payload","")])})
+    # resolve the hostname once up front rather than on every sendto, unless
+    # the caller resolves the hostnames of several servers together
+    if (resolve_):
+      _resolveDestAddress(_gPshellControl[-1])
     # return the newly appended list entry as the SID
     sid = len(_gPshellControl)-1
   return (sid)
 
 #################################################################################
 #################################################################################
-def _disconnectServer(sid_):
-  control = _getControl(sid_)
-  if (control != None):
-    _removeControl(control)
-
-#################################################################################
-#################################################################################
-def _disconnectAllServers():
-  global _gPshellControl
-  for control in _gPshellControl:
-    _removeControl(control)
-  _gPshellControl = []
+def _getSocket(serverType_, remoteServer_):
+  global _gSharedSocket
+  global _gSharedSockets
+  if (not _gSharedSocket):
+    (socketFd, lockFd, sourceAddress) = _createSocket(serverType_, remoteServer_)
+    return (socketFd, lockFd, sourceAddress, False)
+  if (serverType_ not in _gSharedSockets):
+    (socketFd, lockFd, sourceAddress) = _createSocket(serverType_, "shared")
+    if (socketFd == None):
+      return (None, None, None, False)
+    _gSharedSockets[serverType_] = {"socket":socketFd,
+                                    "lockFd":lockFd,
+                                    "sourceAddress":sourceAddress,
+                                    "refCount":0,
+                                    "seqNum":0}
+  shared = _gSharedSockets[serverType_]
+  shared["refCount"] += 1
+  return (shared["socket"], shared["lockFd"], shared["sourceAddress"], True)
 
 #################################################################################
 #################################################################################
-def _setDefaultTimeout(sid_, defaultTimeout_):
-  control = _getControl(sid_)
-  if (control != None):
-    control["timeout"] = defaultTimeout_
+def _createSocket(serverType_, remoteServer_):
+  global _gUnixSocketPath
+  global _gLockFileExtension
+  global _gUnixAutobind
+  global _gMaxBindAttempts
+  if (serverType_ == "unix"):
+    socketFd = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    # bind our source socket so we can get replies
+    if (_gUnixAutobind):
+      try:
+        # let the kernel pick a unique name in the abstract namespace, there is
+        # no filesystem entry so there is no lock file and nothing to clean up
+        socketFd.bind("")
+        return (socketFd, None, socketFd.getsockname())
+      except Exception as e:
+        _printWarning("Could not autobind unix socket, error: {}, using filesystem".format(str(e)))
+    _cleanupUnixResources()
+    for attempt in range(_gMaxBindAttempts):
+      sourceAddress = _gUnixSocketPath+remoteServer_+"-control"+str(random.randrange(_gMaxBindAttempts))
+      lockFile = sourceAddress+_gLockFileExtension
+      lockFd = None
+      try:
+        lockFd = open((lockFile), "w+")
+        fcntl.flock(lockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        socketFd.bind(sourceAddress)
+        return (socketFd, lockFd, sourceAddress)
+      except Exception as e:
+        if (lockFd != None):
+          lockFd.close()
+    _printError("Could not bind unix socket after {} attempts".format(_gMaxBindAttempts))
+    socketFd.close()
+    return (None, None, None)
+  else:
+    socketFd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # bind our source socket so we can get replies
+    socketFd.bind(("", 0))
+    return (socketFd, None, None)
+
+#################################################################################
+#################################################################################
+def _disconnectServer(sid_):
+  control = _getControl(sid_)
+  if (control != None):
+    _removeControl(control)
+    # the entry is kept so its sid is never reused, and so reconnectServer can
+    # reopen it with its statistics, but its cached catalog, outputs and last
+    # reply are released, they are only used while connected
+    control["catalog"] = None
+    control["outputs"] = OrderedDict()
+    control["subscriptionData"] = []
+    control["pshellMsg"]["payload"] = ""
+    if (control["lockFd"] != None):
+      # filesystem bound source socket, sweep any stale socket files
+      _cleanupUnixResources()
+
+#################################################################################
+#################################################################################
+def _disconnectAllServers():
+  global _gPshellControl
+  isFileSystemBound = False
+  for control in _gPshellControl:
+    _removeControl(control)
+    isFileSystemBound = (isFileSystemBound or (control["lockFd"] != None))
+  _gPshellControl = []
+  if (isFileSystemBound):
+    _cleanupUnixResources()
+
+#################################################################################
+#################################################################################
+def _setSharedSocket(enable_):
+  global _gSharedSocket
+  _gSharedSocket = enable_
+
+#################################################################################
+#################################################################################
+def _setDefaultTimeout(sid_, defaultTimeout_):
+  control = _getControl(sid_)
+  if (control != None):
+    control["timeout"] = defaultTimeout_
+
+#################################################################################
+#################################################################################
+def _setDnsCacheTimeout(timeout_):
+  global _gDnsCacheTimeout
+  _gDnsCacheTimeout = timeout_
+
+#################################################################################
+#################################################################################
+def _setConditionalRequests(enable_):
+  global _gConditionalRequests
+  _gConditionalRequests = enable_
+
+#################################################################################
+#################################################################################
+def _setMulticastInterface(interface_, ttl_):
+  global _gMulticastInterface
+  global _gMulticastTtl
+  if (interface_ == LOCALHOST):
+    interface_ = "127.0.0.1"
+  _gMulticastInterface = interface_
+  _gMulticastTtl = ttl_
+
+#################################################################################
+#################################################################################
+def _isMulticastAddress(ipAddrOctets_):
+  return ((len(ipAddrOctets_) == 4) and
+          ipAddrOctets_[0].isdigit() and
+          (int(ipAddrOctets_[0]) >= 224) and
+          (int(ipAddrOctets_[0]) <= 239))
+
+#################################################################################
+#################################################################################
+def _setMulticastOptions(socket_):
+  global _gMulticastInterface
+  global _gMulticastTtl
+  socket_.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, _gMulticastTtl)
+  # servers on our own host that joined the group must also get the command
+  socket_.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+  if (_gMulticastInterface != None):
+    socket_.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(socket.gethostbyname(_gMulticastInterface)))
+
+#################################################################################
+#################################################################################
+def _getServerAddress(sid_):
+  control = _getControl(sid_)
+  if (control == None):
+    return ("")
+  elif (control["serverType"] == "udp"):
+    return ("%s:%d" % control["destAddress"])
+  elif (control["destAddress"][0] == "\0"):
+    # abstract namespace, displayed with the conventional leading '@'
+    return ("@"+control["destAddress"][1:])
+  else:
+    return (control["destAddress"])
+
+#################################################################################
+#################################################################################
+def _resolveDestAddress(control_):
+  _setDestAddress(control_, _lookupHost(control_["destHost"]))
+
+#################################################################################
+#################################################################################
+def _resolveDestAddresses(controls_):
+  global _gMaxResolveThreads
+  # hostname lookups block, so the distinct hostnames are looked up by a pool
+  # of threads rather than one after the other
+  hosts = list(set([control["destHost"] for control in controls_]))
+  addresses = {}
+  lock = threading.Lock()
+  def resolve():
+    while (True):
+      with lock:
+        if (len(hosts) == 0):
+          return
+        host = hosts.pop()
+      address = _lookupHost(host)
+      with lock:
+        addresses[host] = address
+  threads = [threading.Thread(target=resolve) for index in range(min(len(hosts), _gMaxResolveThreads))]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  for control in controls_:
+    _setDestAddress(control, addresses[control["destHost"]])
+
+#################################################################################
+#################################################################################
+def _lookupHost(host_):
+  # returns the IPv4 address of the host, or the exception if the lookup failed
+  try:
+    return (socket.getaddrinfo(host_, None, socket.AF_INET, socket.SOCK_DGRAM)[0][4][0])
+  except Exception as error:
+    return (error)
+
+#################################################################################
+#################################################################################
+def _setDestAddress(control_, address_):
+  if (isinstance(address_, Exception)):
+    # leave the resolve time unset so we try again on the next command, the
+    # sendto will fall back to resolving the raw hostname itself
+    _printWarning("Could not resolve host: %s, %s" % (control_["destHost"], address_))
+    control_["destAddress"] = (control_["destHost"], control_["destPort"])
+    control_["resolveTime"] = None
+  else:
+    destAddress = (address_, control_["destPort"])
+    if ((control_["destAddress"][0] != control_["destHost"]) and (destAddress != control_["destAddress"])):
+      # only note a change of a previously resolved address
+      _printInfo("Server: %s, using address: %s:%d" % (control_["remoteServer"], destAddress[0], destAddress[1]))
+    control_["destAddress"] = destAddress
+    control_["resolveTime"] = time.time()
+
+#################################################################################
+#################################################################################
+def _connectServers(servers_, defaultTimeout_):
+  global _gPshellControl
+  config = _readConfigFile()
+  sids = []
+  for (controlName, remoteServer, port) in servers_:
+    sids.append(_connectServer(controlName, remoteServer, str(port), defaultTimeout_, config, False))
+  _resolveDestAddresses([_gPshellControl[sid] for sid in sids if ((sid != INVALID_SID) and (_gPshellControl[sid]["serverType"] == "udp"))])
+  return (sids)
+
+#################################################################################
+#################################################################################
+def _probeServers(sids_, timeout_, lock_):
+  global _gMsgTypes
+  results = {}
+  probes = []
+  deadline = time.time()+float(timeout_)/float(1000.0)
+  isShared = (lock_ != None)
+  if (not isShared):
+    # nobody else uses our controls, a lock of our own keeps the code the same
+    lock_ = threading.RLock()
+  with lock_:
+    for sid in sids_:
+      control = _getControl(sid)
+      if ((control == None) or (control["socket"] == None) or control["isBroadcastAddress"]):
+        continue
+      # the catalog version has the smallest reply of all the queries, an older
+      # server that does not know it still replies, which is all we need to know
+      retCode = _sendRequest(control, _gMsgTypes["queryCatalogVersion"], "queryCatalogVersion")
+      if (retCode == COMMAND_SUCCESS):
+        probes.append((sid, control, control["pending"]["seqNum"]))
+      else:
+        results[sid] = retCode
+  while (True):
+    with lock_:
+      controls = [(sid, control) for (sid, control, seqNum) in probes if _isProbePending(control, seqNum)]
+      if (not isShared):
+        # no other thread, wait for all the replies in one go
+        _waitReplies(controls, deadline, False)
+      else:
+        # only read the replies that have already arrived
+        _waitReplies(controls, time.time(), False)
+      sockets = [control["socket"] for (sid, control) in controls if (control["reply"] == None)]
+    if ((len(sockets) == 0) or (time.time() >= deadline)):
+      break
+    _waitReadable(sockets, deadline)
+  with lock_:
+    for (sid, control, seqNum) in probes:
+      if (not _isProbePending(control, seqNum)):
+        # superseded by another thread's request, or disconnected
+        continue
+      elif (control["reply"] != None):
+        (sid, payload, retCode) = _completeRequest(sid, control)
+        if ((retCode == COMMAND_SUCCESS) and (control["catalog"] == None)):
+          control["catalog"] = _loadCatalog(payload)
+        results[sid] = retCode
+      else:
+        # the caller reports the unreachable servers, so no error is logged here
+        _cancelRequest(control)
+        if (control["serverType"] == "udp"):
+          control["resolveTime"] = None
+        _addRetCode(control["stats"], SOCKET_TIMEOUT)
+        results[sid] = SOCKET_TIMEOUT
+  return (results)
+
+#################################################################################
+def _isProbePending(control_, seqNum_):
+  return ((control_["socket"] != None) and
+          (control_["pending"] != None) and
+          (control_["pending"]["seqNum"] == seqNum_))
+
+#################################################################################
+def _waitReadable(sockets_, deadline_):
+  # wait until one of the sockets has something to read, without reading it,
+  # another thread may get to it first, or close the socket, either way our
+  # caller looks again
+  timeout = max(deadline_-time.time(), 0)
+  try:
+    if (selectors != None):
+      selector = selectors.DefaultSelector()
+      try:
+        for socketFd in sockets_:
+          selector.register(socketFd, selectors.EVENT_READ)
+        selector.select(timeout)
+      finally:
+        selector.close()
+    else:
+      select.select(sockets_, [], [], timeout)
+  except:
+    None
 
 #################################################################################
 #################################################################################
@@ -670,48 +1526,311 @@ def _extractPrompt(sid_):
       results = control["pshellMsg"]["payload"]
   return (results)
 
+#################################################################################
+#################################################################################
+def _extractAll(sid_):
+  global _gMsgTypes
+  control = _getControl(sid_)
+  if ((control != None) and (control["timeout"] > NO_WAIT)):
+    control["pshellMsg"]["dataNeeded"] = True
+    # an older server does not know this msgType, the 'C' server replies with an
+    # error string and the Python server dispatches the payload as a command, so
+    # we send a payload that will not match any command and only accept a reply
+    # that is our JSON encoded server information, the caller falls back to the
+    # individual queries if we return None
+    if (_sendCommand(control, _gMsgTypes["queryAll"], "queryAll", control["timeout"]) == COMMAND_SUCCESS):
+      try:
+        serverInfo = _loadJson(control["pshellMsg"]["payload"])
+        if (isinstance(serverInfo, dict) and ("commands" in serverInfo)):
+          # we got the catalog for free, so cache it
+          control["catalog"] = serverInfo["commands"]
+          _saveCatalog(serverInfo.get("catalogVersion"), serverInfo["commands"])
+          return (serverInfo)
+      except:
+        None
+  return (None)
+
+#################################################################################
+#################################################################################
+def _getCatalog(sid_):
+  global _gMsgTypes
+  control = _getControl(sid_)
+  if ((control == None) or (control["timeout"] == NO_WAIT)):
+    # we cannot get a reply without waiting for one, so there is nothing to
+    # validate against
+    return ([])
+  if (control["catalog"] == None):
+    # see if we already have this version of the catalog on disk, the version
+    # query has a much smaller reply than fetching the whole catalog
+    control["pshellMsg"]["dataNeeded"] = True
+    retCode = _sendCommand(control, _gMsgTypes["queryCatalogVersion"], "queryCatalogVersion", control["timeout"])
+    if (retCode == COMMAND_SUCCESS):
+      control["catalog"] = _loadCatalog(control["pshellMsg"]["payload"])
+      if (control["catalog"] == None):
+        _extractAll(sid_)
+    elif (_isFailure(retCode)):
+      # the server did not answer, leave the catalog unset so we ask again
+      # on the next command
+      return ([])
+    if (control["catalog"] == None):
+      # an older server, don't keep asking on every command, we ask again
+      # if the server ever tells us a command is not found
+      control["catalog"] = []
+  return (control["catalog"])
+
+#################################################################################
+#################################################################################
+def _getCatalogFile(catalogVersion_):
+  global _gUnixSocketPath
+  global _gCatalogFileExtension
+  # the version is a hex digest from the server, don't use anything else as a filename
+  if ((catalogVersion_ == None) or
+      (len(catalogVersion_) == 0) or
+      (len(catalogVersion_.strip("0123456789abcdef")) > 0)):
+    return (None)
+  return (_gUnixSocketPath+catalogVersion_+_gCatalogFileExtension)
+
+#################################################################################
+#################################################################################
+def _loadCatalog(catalogVersion_):
+  catalogFile = _getCatalogFile(catalogVersion_)
+  if (catalogFile != None):
+    try:
+      file = open(catalogFile, "r")
+      try:
+        catalog = _loadJson(file.read())
+      finally:
+        file.close()
+      if (isinstance(catalog, list)):
+        # the catalogs that are still in use are the last to be pruned
+        try:
+          os.utime(catalogFile, None)
+        except:
+          None
+        return (catalog)
+    except:
+      None
+  return (None)
+
+#################################################################################
+#################################################################################
+def _saveCatalog(catalogVersion_, catalog_):
+  catalogFile = _getCatalogFile(catalogVersion_)
+  if ((catalogFile == None) or os.path.isfile(catalogFile)):
+    return
+  # write to a temp file and rename it so a concurrent reader never sees a
+  # partially written catalog
+  tempFile = catalogFile+"."+str(os.getpid())
+  try:
+    file = open(tempFile, "w")
+    try:
+      file.write(json.dumps(catalog_))
+    finally:
+      file.close()
+    os.chmod(tempFile, 0o666)
+    os.rename(tempFile, catalogFile)
+  except Exception as error:
+    _printWarning("Could not save catalog: {}, error: {}".format(catalogFile, error))
+    try:
+      os.unlink(tempFile)
+    except:
+      None
+  _pruneCatalogs()
+
+#################################################################################
+#################################################################################
+def _pruneCatalogs():
+  global _gUnixSocketPath
+  global _gCatalogFileExtension
+  global _gMaxCatalogFiles
+  # every new catalog version leaves a file behind, e.g. each time a server is
+  # restarted with different commands, so only the most recently used ones are
+  # kept, loading a catalog refreshes its modification time
+  try:
+    catalogFiles = [_gUnixSocketPath+file for file in fnmatch.filter(os.listdir(_gUnixSocketPath), "*"+_gCatalogFileExtension)]
+  except:
+    return
+  if (len(catalogFiles) <= _gMaxCatalogFiles):
+    return
+  mtimes = {}
+  for catalogFile in catalogFiles:
+    try:
+      mtimes[catalogFile] = os.path.getmtime(catalogFile)
+    except:
+      # removed by another client
+      None
+  for catalogFile in sorted(mtimes, key=lambda catalogFile: mtimes[catalogFile])[:-_gMaxCatalogFiles]:
+    try:
+      os.unlink(catalogFile)
+    except:
+      None
+
+#################################################################################
+#################################################################################
+def _findCommands(catalog_, keyword_):
+  # same matching rules as the server, any command the keyword is a prefix of
+  # is a match, so an exact match can still be ambiguous
+  return ([command for command in catalog_ if (command["name"][:len(keyword_)] == keyword_)])
+
+#################################################################################
+#################################################################################
+def _getCommandTimeout(control_, command_, timeout_):
+  global _gExpectedDurationFactor
+  global _gMinCommandTimeout
+  # only use a catalog that is already cached, we never fetch one just to pick
+  # a timeout, and we never turn a fire-and-forget command into one that waits
+  if ((timeout_ == NO_WAIT) or (not control_["catalog"]) or (len(command_.split()) == 0)):
+    return (timeout_)
+  matches = _findCommands(control_["catalog"], command_.split()[0])
+  if ((len(matches) == 1) and (matches[0].get("expectedDuration") != None)):
+    return (max(int(matches[0]["expectedDuration"]*_gExpectedDurationFactor), _gMinCommandTimeout))
+  return (timeout_)
+
+#################################################################################
+#################################################################################
+def _getServerCommandTimeout(sid_, command_, timeout_):
+  control = _getControl(sid_)
+  if (control == None):
+    return (timeout_)
+  return (_getCommandTimeout(control, command_, timeout_))
+
+#################################################################################
+#################################################################################
+def _validateCommand(sid_, command_):
+  global _gCommandHelp
+  catalog = _getCatalog(sid_)
+  args = command_.split()
+  if ((len(catalog) == 0) or (len(args) == 0)):
+    return (COMMAND_SUCCESS, command_, "")
+  matches = _findCommands(catalog, args[0])
+  if (len(matches) == 0):
+    return (COMMAND_NOT_FOUND, command_, "PSHELL_ERROR: Command: '%s' not found\n" % args[0])
+  elif (len(matches) > 1):
+    return (COMMAND_NOT_FOUND, command_, "PSHELL_ERROR: Ambiguous command abbreviation: '%s'\n" % args[0])
+  command = matches[0]
+  args[0] = command["name"]
+  if (command["usage"] != None):
+    usage = "Usage: %s %s\n" % (command["name"], command["usage"])
+  else:
+    usage = "Usage: %s\n" % command["name"]
+  if ((len(args) == 2) and (args[1] in _gCommandHelp)):
+    if (command["showUsage"] == True):
+      return (COMMAND_SUCCESS, " ".join(args), usage)
+  elif ((len(args)-1 < command["minArgs"]) or (len(args)-1 > command["maxArgs"])):
+    return (COMMAND_INVALID_ARG_COUNT, " ".join(args), usage)
+  return (COMMAND_SUCCESS, " ".join(args), "")
+
+#################################################################################
+#################################################################################
+def _loadJson(payload_):
+  return (_convertJson(json.loads(payload_)))
+
+#################################################################################
+#################################################################################
+def _convertJson(value_):
+  # python2 json gives us unicode strings, convert them back to native strings
+  # so they can be used anywhere a string received from the server is used
+  if (isinstance(value_, dict)):
+    return (dict([(_convertJson(key), _convertJson(value)) for (key, value) in value_.items()]))
+  elif (isinstance(value_, list)):
+    return ([_convertJson(value) for value in value_])
+  elif ((sys.version_info[0] < 3) and isinstance(value_, unicode)):
+    return (value_.encode("utf-8"))
+  else:
+    return (value_)
+
 #################################################################################
 #################################################################################
 def _addMulticast(sid_, keyword_):
   global _gPshellControl
   global _gPshellMulticast
+  global _gMulticastKeywords
   if (sid_ <  len(_gPshellControl)):
-    multicastFound = False
-    for multicast in _gPshellMulticast:
-      if (multicast["keyword"] == keyword_):
-        multicastFound = True
-        sidList = multicast["sidList"]
-        break
-    if (not multicastFound):
+    multicast = _gPshellMulticast.get(keyword_)
+    if (multicast == None):
       # multicast entry not found for this keyword, add a new one
-      _gPshellMulticast.append({"keyword":keyword_, "sidList":[]})
-      sidList = _gPshellMulticast[-1]["sidList"]
-    sidFound = False
-    for sid in sidList:
-      if (sid == sid_):
-        sidFound = True
-        break
-    if (not sidFound):
-      # sid not found for this multicast group, add it for this group
-      sidList.append(sid_)
+      multicast = {"keyword":keyword_, "sids":OrderedDict()}
+      _gPshellMulticast[keyword_] = multicast
+      if (keyword_ != MULTICAST_ALL):
+        bisect.insort(_gMulticastKeywords, keyword_)
+    # a sid that is already in the group is not added again
+    multicast["sids"][sid_] = None
 
 #################################################################################
 #################################################################################
-def _sendMulticast(command_):
+def _getMulticastSids(keyword_):
   global _gPshellMulticast
+  global _gMulticastKeywords
+  # the sids of the MULTICAST_ALL group and of every group whose keyword the
+  # command keyword abbreviates, a sid in more than one of these groups is
+  # only returned once, None if there are no such groups
+  multicasts = []
+  if (MULTICAST_ALL in _gPshellMulticast):
+    multicasts.append(_gPshellMulticast[MULTICAST_ALL])
+  index = bisect.bisect_left(_gMulticastKeywords, keyword_)
+  while ((index < len(_gMulticastKeywords)) and (_gMulticastKeywords[index].startswith(keyword_))):
+    multicasts.append(_gPshellMulticast[_gMulticastKeywords[index]])
+    index += 1
+  if (len(multicasts) == 0):
+    return (None)
+  elif (len(multicasts) == 1):
+    return (multicasts[0]["sids"])
+  sids = OrderedDict()
+  for multicast in multicasts:
+    sids.update(multicast["sids"])
+  return (sids)
+
+#################################################################################
+#################################################################################
+def _sendMulticast(command_):
+  global _gMsgTypes
   global NO_WAIT
-  keywordFound = False
-  for multicast in _gPshellMulticast:
-    command = command_.split()[0]
-    if ((multicast["keyword"] == MULTICAST_ALL) or (command == multicast["keyword"][:len(command)])):
-      keywordFound = True
-      for sid in multicast["sidList"]:
-        control = _getControl(sid)
-        if (control != None):
-          control["dataNeeded"] = False
-          _sendCommand(control, _gMsgTypes["controlCommand"], command_, NO_WAIT)
-  if not keywordFound:
+  command = command_.split()[0]
+  sids = _getMulticastSids(command)
+  if (sids == None):
     _printError("Multicast command: '%s', not found" % command)
+    return
+  for sid in sids:
+    control = _getControl(sid)
+    if (control != None):
+      control["pshellMsg"]["dataNeeded"] = False
+      _sendCommand(control, _gMsgTypes["controlCommand"], command_, NO_WAIT)
+
+#################################################################################
+#################################################################################
+def _sendGroupCommand(sid_, timeoutOverride_, command_, maxReplies_):
+  global _gMsgTypes
+  global _gPshellMsgHeaderFormat
+  global NO_WAIT
+  replies = OrderedDict()
+  control = _getControl(sid_)
+  if (control == None):
+    return ([])
+  control["pshellMsg"]["dataNeeded"] = True
+  startTime = time.time()
+  (sentSize, seqNum) = _sendMsg(control, _gMsgTypes["controlCommand"], command_, (timeoutOverride_ > NO_WAIT))
+  if (sentSize == 0):
+    _getRetCode(control, command_, SOCKET_SEND_FAILURE)
+    return ([])
+  if (timeoutOverride_ > NO_WAIT):
+    # the replies are gathered as a batch so there is no per reply latency to record
+    for (pshellMsg, address) in _gatherReplies(control["socket"], startTime+float(timeoutOverride_)/1000.0, maxReplies_):
+      if (_dispatchReply(control["socket"], pshellMsg, address)):
+        # belongs to a send request of another server sharing our socket
+        continue
+      if ((pshellMsg["seqNum"] != seqNum) or (address in replies)):
+        # late reply to a previous group command, toss it
+        continue
+      retCode = pshellMsg["msgType"]
+      if (retCode == _gMsgTypes["commandComplete"]):
+        retCode = COMMAND_SUCCESS
+      control["stats"]["bytesReceived"] += len(pshellMsg["payload"])+struct.calcsize(_gPshellMsgHeaderFormat)
+      _addRetCode(control["stats"], retCode)
+      replies[address] = {"host":address[0],
+                          "port":address[1],
+                          "retCode":retCode,
+                          "results":pshellMsg["payload"]}
+  return (list(replies.values()))
 
 #################################################################################
 #################################################################################
@@ -721,7 +1840,7 @@ def _sendCommand1(sid_, command_):
   control = _getControl(sid_)
   if (control != None):
     control["pshellMsg"]["dataNeeded"] = False
-    retCode = _sendCommand(control, _gMsgTypes["controlCommand"], command_, control["timeout"])
+    retCode = _sendCommand(control, _gMsgTypes["controlCommand"], command_, _getCommandTimeout(control, command_, control["timeout"]))
   return (retCode)
 
 #################################################################################
@@ -746,7 +1865,7 @@ def _sendCommand3(sid_, command_):
     # for a broadcast server,our default timeout will beforced to NO_WAIT,
     # so no need to force it here
     control["pshellMsg"]["dataNeeded"] = (control["timeout"] > NO_WAIT)
-    retCode = _sendCommand(control, _gMsgTypes["controlCommand"], command_, control["timeout"])
+    retCode = _sendCommand(control, _gMsgTypes["controlCommand"], command_, _getCommandTimeout(control, command_, control["timeout"]))
     # only try to extract data if not talking to a broadcast address
     if (control["isBroadcastAddress"] == False):
       if (not control["pshellMsg"]["dataNeeded"]):
@@ -777,6 +1896,71 @@ def _sendCommand4(sid_, timeoutOverride_, command_):
         results = control["pshellMsg"]["payload"]
   return (results, retCode)
 
+#################################################################################
+#################################################################################
+def _sendBatch(sid_, commands_):
+  global _gMsgTypes
+  global NO_WAIT
+  results = []
+  control = _getControl(sid_)
+  if (control == None):
+    return ([("", SOCKET_NOT_CONNECTED)]*len(commands_))
+  commands = list(commands_)
+  while ((len(commands) > 0) and
+         (control["batch"] == True) and
+         (control["isBroadcastAddress"] == False) and
+         (control["timeout"] > NO_WAIT)):
+    batch = _getBatch(commands)
+    timeout = 0
+    for command in batch:
+      timeout += _getCommandTimeout(control, command, control["timeout"])
+    control["pshellMsg"]["dataNeeded"] = True
+    retCode = _sendCommand(control, _gMsgTypes["batch"], json.dumps(batch), timeout)
+    if (retCode != COMMAND_SUCCESS):
+      results.extend([("", retCode)]*len(batch))
+      del commands[:len(batch)]
+      continue
+    try:
+      replies = _loadJson(control["pshellMsg"]["payload"])
+    except:
+      replies = None
+    if ((not isinstance(replies, list)) or (len(replies) == 0)):
+      # an older server dispatched our batch as a single unknown command, go
+      # back to one command at a time for this server
+      control["batch"] = False
+      break
+    # the server may not have run the whole batch if the outputs got too big
+    for (command, reply) in zip(batch, replies):
+      if (reply.get("resend") == True):
+        # its output was too big to fit in the batch reply, it is sent on its
+        # own, where its output does not need to be JSON encoded
+        results.append(_sendCommand4(sid_, _getCommandTimeout(control, command, control["timeout"]), command))
+        continue
+      control["pshellMsg"]["payload"] = reply["results"]
+      retCode = _getRetCode(control, command, reply["retCode"])
+      if (retCode == COMMAND_SUCCESS):
+        results.append((reply["results"], retCode))
+      else:
+        results.append(("", retCode))
+    del commands[:len(replies)]
+  for command in commands:
+    results.append(_sendCommand4(sid_, _getCommandTimeout(control, command, control["timeout"]), command))
+  return (results)
+
+#################################################################################
+#################################################################################
+def _getBatch(commands_):
+  global _gMaxBatchSize
+  # as many commands as will fit in one request, but always at least one
+  batch = [str(commands_[0])]
+  size = len(json.dumps(batch))
+  for command in commands_[1:]:
+    size += len(json.dumps(str(command)))+2
+    if (size > _gMaxBatchSize):
+      break
+    batch.append(str(command))
+  return (batch)
+
 #################################################################################
 #################################################################################
 def _sendCommand(control_, commandType_, command_, timeout_):
@@ -790,57 +1974,539 @@ def _sendCommand(control_, commandType_, command_, timeout_):
       # if talking to a broadcast address, force our wait time to 0
       # because we do not request or expecet a response
       timeout_ = NO_WAIT
-    control_["pshellMsg"]["msgType"] = commandType_
-    control_["pshellMsg"]["respNeeded"] = (timeout_ > NO_WAIT)
-    control_["pshellMsg"]["seqNum"] += 1
-    seqNum = control_["pshellMsg"]["seqNum"]
-    control_["pshellMsg"]["payload"] = str(command_)
-    try:
-      sentSize = control_["socket"].sendto(struct.pack(_gPshellMsgHeaderFormat+str(len(control_["pshellMsg"]["payload"]))+"s",
-                                           *control_["pshellMsg"].values()),
-                                           control_["destAddress"])
-    except:
-      sentSize = 0
+    startTime = time.time()
+    output = _getCachedOutput(control_, commandType_, command_, timeout_)
+    if (output != None):
+      (sentSize, seqNum) = _sendMsg(control_, _gMsgTypes["conditional"], json.dumps({"digest":output["digest"], "command":command_}), True)
+    else:
+      (sentSize, seqNum) = _sendMsg(control_, commandType_, command_, (timeout_ > NO_WAIT))
     if (sentSize == 0):
       retCode = SOCKET_SEND_FAILURE
     elif (timeout_ > NO_WAIT):
-      while (True):
-        try:
-          inputready, outputready, exceptready = select.select([control_["socket"]], [], [], float(timeout_)/float(1000.0))
-        except:
-          inputready = []
-        if (len(inputready) > 0):
-          control_["pshellMsg"], addr = control_["socket"].recvfrom(_gPshellMsgPayloadLength)
-          control_["pshellMsg"] = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(control_["pshellMsg"])-struct.calcsize(_gPshellMsgHeaderFormat))+"s", control_["pshellMsg"])))
-          if (seqNum > control_["pshellMsg"]["seqNum"]):
-            # make sure we have the correct response, this condition can happen if we had
-            # a very short timeout for the previous call and missed the response, in which
-            # case the response to the previous call will be queued in the socket ahead of
-            # our current expected response, when we detect that condition, we read the
-            # socket until we either find the correct response or timeout, we toss any previous
-            # unmatched responses
-            _printWarning("Received seqNum: %d, does not match sent seqNum: %d" % (control_["pshellMsg"]["seqNum"], seqNum))
-          else:
-            retCode = control_["pshellMsg"]["msgType"]
-            break
-        else:
-          retCode = SOCKET_TIMEOUT
-          break
+      retCode = _receiveReply(control_, seqNum, startTime+float(timeout_)/float(1000.0))
+      if ((retCode != SOCKET_TIMEOUT) and (retCode != SOCKET_RECEIVE_FAILURE)):
+        _addLatency(control_["stats"], time.time()-startTime)
       control_["pshellMsg"]["seqNum"] = seqNum
+      if ((output != None) and (retCode == _gMsgTypes["commandComplete"])):
+        # an older server does not know the conditional msgType, it replied with
+        # an error string, send it plain commands from now on
+        control_["conditional"] = False
+        return (_sendCommand(control_, commandType_, command_, timeout_))
+      elif (retCode == _gMsgTypes["notModified"]):
+        control_["pshellMsg"]["payload"] = output["payload"]
+        retCode = COMMAND_SUCCESS
+      elif (((commandType_ == _gMsgTypes["subscribe"]) or (commandType_ == _gMsgTypes["unsubscribe"])) and
+            (retCode == _gMsgTypes["commandComplete"])):
+        # an older server does not know the subscription msgTypes, it replied
+        # with an error string, report it the same as an unknown command
+        _printWarning("Server: %s does not support subscriptions" % control_["remoteServer"])
+        control_["pshellMsg"]["payload"] = ""
+        _addRetCode(control_["stats"], COMMAND_NOT_FOUND)
+        return (COMMAND_NOT_FOUND)
+      elif ((retCode == COMMAND_SUCCESS) and _gConditionalRequests and (commandType_ == _gMsgTypes["controlCommand"])):
+        _setCachedOutput(control_, command_, control_["pshellMsg"]["payload"])
+    if ((control_["serverType"] == "udp") and
+        ((retCode == SOCKET_SEND_FAILURE) or (retCode == SOCKET_TIMEOUT))):
+      # the server may have moved, force the hostname to be resolved again
+      # on the next command
+      control_["resolveTime"] = None
   else:
     retCode = SOCKET_NOT_CONNECTED
+  return (_getRetCode(control_, command_, retCode))
+
+#################################################################################
+#################################################################################
+def _subscribe(sid_, command_, interval_, lease_, changesOnly_):
+  global _gMsgTypes
+  global NO_WAIT
+  results = ""
+  retCode = SOCKET_NOT_CONNECTED
+  control = _getControl(sid_)
+  if (control != None):
+    request = json.dumps({"command":command_,
+                          "interval":interval_,
+                          "lease":lease_,
+                          "changesOnly":changesOnly_,
+                          "renew":False})
+    control["pshellMsg"]["dataNeeded"] = True
+    retCode = _sendCommand(control, _gMsgTypes["subscribe"], request, control["timeout"])
+    if (retCode == COMMAND_SUCCESS):
+      # the lease is renewed halfway through so a late renewal is not fatal
+      control["subscriptions"][(command_, interval_)] = {"request":json.dumps({"command":command_,
+                                                                               "interval":interval_,
+                                                                               "lease":lease_,
+                                                                               "changesOnly":changesOnly_,
+                                                                               "renew":True}),
+                                                         "renewInterval":float(lease_)/2000.0,
+                                                         "renewTime":time.time()+float(lease_)/2000.0}
+      if ((control["isBroadcastAddress"] == False) and (control["timeout"] > NO_WAIT)):
+        results = control["pshellMsg"]["payload"]
+  return (results, retCode)
+
+#################################################################################
+#################################################################################
+def _unsubscribe(sid_, command_, interval_):
+  global _gMsgTypes
+  control = _getControl(sid_)
+  if (control == None):
+    return (SOCKET_NOT_CONNECTED)
+  control["subscriptions"].pop((command_, interval_), None)
+  control["pshellMsg"]["dataNeeded"] = False
+  return (_sendCommand(control, _gMsgTypes["unsubscribe"], json.dumps({"command":command_, "interval":interval_}), control["timeout"]))
+
+#################################################################################
+#################################################################################
+def _getSubscriptionData(sid_, timeout_):
+  control = _getControl(sid_)
+  if ((control == None) or (control["socket"] == None)):
+    return ([])
+  deadline = time.time()+float(timeout_)/1000.0
+  while (True):
+    _renewSubscriptions(control)
+    # collect everything that has already arrived before deciding to wait
+    while (_receiveSubscriptionData(control, 0)):
+      None
+    if ((len(control["subscriptionData"]) > 0) or (time.time() >= deadline)):
+      break
+    renewTimes = [subscription["renewTime"] for subscription in control["subscriptions"].values()]
+    _receiveSubscriptionData(control, min([deadline]+renewTimes))
+  data = control["subscriptionData"]
+  control["subscriptionData"] = []
+  return (data)
+
+#################################################################################
+#################################################################################
+def _renewSubscriptions(control_):
+  global _gMsgTypes
+  now = time.time()
+  for subscription in control_["subscriptions"].values():
+    if (now >= subscription["renewTime"]):
+      _sendNotification(control_, _gMsgTypes["subscribe"], subscription["request"])
+      subscription["renewTime"] = now+subscription["renewInterval"]
+
+#################################################################################
+#################################################################################
+def _receiveSubscriptionData(control_, deadline_):
+  global _gPshellMsgPayloadLength
+  global _gPshellMsgHeaderFormat
+  # wait for a single message, anything that is not the results of a subscription
+  # is either handed off to its owner or is a late reply that is tossed, returns
+  # False if nothing arrived before the deadline, this is where a subscriber
+  # spends its time so a SystemExit from a signal handler is let through
+  try:
+    inputready, outputready, exceptready = select.select([control_["socket"]], [], [], max(deadline_-time.time(), 0))
+  except Exception:
+    inputready = []
+  if (len(inputready) == 0):
+    return (False)
+  try:
+    (pshellMsg, addr) = control_["socket"].recvfrom(_gPshellMsgPayloadLength)
+    pshellMsg = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(pshellMsg)-struct.calcsize(_gPshellMsgHeaderFormat))+"s", pshellMsg)))
+  except Exception:
+    return (True)
+  if (not _dispatchReply(control_["socket"], pshellMsg, addr)):
+    _dispatchSharedSubscriptionData(control_["socket"], pshellMsg, addr)
+  return (True)
+
+#################################################################################
+#################################################################################
+def _dispatchSharedSubscriptionData(socket_, pshellMsg_, address_):
+  global _gPshellControl
+  global _gMsgTypes
+  # find the server that sent the results among all those using the socket,
+  # results for a subscription we no longer have are tossed
+  if (pshellMsg_["msgType"] != _gMsgTypes["subscriptionData"]):
+    return (False)
+  for control in _gPshellControl:
+    if ((control["socket"] is socket_) and (len(control["subscriptions"]) > 0) and _isReplyFrom(control, address_)):
+      control["stats"]["bytesReceived"] += len(pshellMsg_["payload"])+struct.calcsize(_gPshellMsgHeaderFormat)
+      return (_dispatchSubscriptionData(control, pshellMsg_))
+  return (True)
+
+#################################################################################
+#################################################################################
+def _dispatchSubscriptionData(control_, pshellMsg_):
+  global _gMsgTypes
+  global _gMaxSubscriptionData
+  if (pshellMsg_["msgType"] != _gMsgTypes["subscriptionData"]):
+    return (False)
+  try:
+    data = _loadJson(pshellMsg_["payload"])
+  except:
+    return (True)
+  control_["subscriptionData"].append(data)
+  if (len(control_["subscriptionData"]) > _gMaxSubscriptionData):
+    # nobody is collecting the results, keep only the most recent ones
+    control_["subscriptionData"].pop(0)
+  return (True)
+
+#################################################################################
+#################################################################################
+def _getCachedOutput(control_, commandType_, command_, timeout_):
+  global _gConditionalRequests
+  global _gMsgTypes
+  global NO_WAIT
+  # only a command whose results are extracted can be sent conditionally
+  if ((not _gConditionalRequests) or
+      (not control_["conditional"]) or
+      (commandType_ != _gMsgTypes["controlCommand"]) or
+      (not control_["pshellMsg"]["dataNeeded"]) or
+      (timeout_ == NO_WAIT)):
+    return (None)
+  return (control_["outputs"].get(command_))
+
+#################################################################################
+#################################################################################
+def _setCachedOutput(control_, command_, payload_):
+  global _gMaxCachedOutputs
+  # the least recently updated output is dropped when the cache is full
+  control_["outputs"].pop(command_, None)
+  control_["outputs"][command_] = {"digest":_getDigest(payload_), "payload":payload_}
+  if (len(control_["outputs"]) > _gMaxCachedOutputs):
+    control_["outputs"].popitem(last=False)
+
+#################################################################################
+#################################################################################
+def _getDigest(payload_):
+  if (not isinstance(payload_, bytes)):
+    payload_ = payload_.encode()
+  return (hashlib.sha1(payload_).hexdigest())
+
+#################################################################################
+#################################################################################
+def _getRetCode(control_, command_, retCode_):
+  global _gMsgTypes
+  global _gSupressInvalidArgCountMessage
+  if ((retCode_ == COMMAND_NOT_FOUND) and (control_ != None)):
+    # our cached catalog is out of date, fetch it again the next time it is needed
+    control_["catalog"] = None
   # the suppress flag is used as a backdoor for the pshell.py client to allow
   # a remote server to pass the command usage back to the local server that
   # is run by the client
-  if ((_gSupressInvalidArgCountMessage == True) and (retCode == COMMAND_INVALID_ARG_COUNT)):
-    retCode = COMMAND_SUCCESS
-  elif ((len(control_["pshellMsg"]["payload"]) > 0) and (retCode > COMMAND_SUCCESS) and (retCode < SOCKET_SEND_FAILURE)):
-    _printError("Remote pshell command: '%s', server: %s, %s" % (command_, control_["remoteServer"], _getResponseString(retCode)))
-  elif ((retCode != COMMAND_SUCCESS) and (retCode != _gMsgTypes["commandComplete"])):
-    _printError("Remote pshell command: '%s', server: %s, %s" % (command_, control_["remoteServer"], _getResponseString(retCode)))
+  if ((_gSupressInvalidArgCountMessage == True) and (retCode_ == COMMAND_INVALID_ARG_COUNT)):
+    retCode_ = COMMAND_SUCCESS
+  elif ((len(control_["pshellMsg"]["payload"]) > 0) and (retCode_ > COMMAND_SUCCESS) and (retCode_ < SOCKET_SEND_FAILURE)):
+    _printError("Remote pshell command: '%s', server: %s, %s" % (command_, control_["remoteServer"], _getResponseString(retCode_)))
+  elif ((retCode_ != COMMAND_SUCCESS) and (retCode_ != _gMsgTypes["commandComplete"])):
+    _printError("Remote pshell command: '%s', server: %s, %s" % (command_, control_["remoteServer"], _getResponseString(retCode_)))
   else:
-    retCode = COMMAND_SUCCESS
-  return (retCode)
+    retCode_ = COMMAND_SUCCESS
+  if (control_ != None):
+    _addRetCode(control_["stats"], retCode_)
+  return (retCode_)
+
+#################################################################################
+#################################################################################
+def _sendMsg(control_, commandType_, command_, respNeeded_):
+  # any outstanding request from the send function is superseded by this one
+  _cancelRequest(control_)
+  control_["pshellMsg"]["msgType"] = commandType_
+  control_["pshellMsg"]["respNeeded"] = respNeeded_
+  seqNum = _getNextSeqNum(control_)
+  control_["pshellMsg"]["payload"] = str(command_)
+  if ((control_["serverType"] == "udp") and
+      ((control_["resolveTime"] == None) or
+       (time.time() > control_["resolveTime"]+float(_gDnsCacheTimeout)/1000.0))):
+    _resolveDestAddress(control_)
+  control_["stats"]["requests"] += 1
+  try:
+    sentSize = control_["socket"].sendto(struct.pack(_gPshellMsgHeaderFormat+str(len(control_["pshellMsg"]["payload"]))+"s",
+                                         *control_["pshellMsg"].values()),
+                                         control_["destAddress"])
+  except:
+    sentSize = 0
+  control_["stats"]["bytesSent"] += sentSize
+  return (sentSize, seqNum)
+
+#################################################################################
+#################################################################################
+def _sendNotification(control_, msgType_, payload_):
+  global _gPshellMsgHeaderFormat
+  # a request with no response, sent outside the seqNum space of the control so
+  # it does not disturb any outstanding request of the send function
+  try:
+    sentSize = control_["socket"].sendto(struct.pack(_gPshellMsgHeaderFormat+str(len(payload_))+"s",
+                                                     msgType_, False, False, 0, 0, payload_),
+                                         control_["destAddress"])
+  except:
+    sentSize = 0
+  control_["stats"]["bytesSent"] += sentSize
+  return (sentSize)
+
+#################################################################################
+#################################################################################
+def _send(sid_, command_):
+  control = _getControl(sid_)
+  if (control == None):
+    return (SOCKET_NOT_CONNECTED)
+  return (_sendRequest(control, _gMsgTypes["controlCommand"], command_))
+
+#################################################################################
+#################################################################################
+def _sendRequest(control_, commandType_, command_):
+  global _gPendingRequests
+  control_["pshellMsg"]["dataNeeded"] = True
+  respNeeded = (control_["isBroadcastAddress"] == False)
+  startTime = time.time()
+  (sentSize, seqNum) = _sendMsg(control_, commandType_, command_, respNeeded)
+  if (sentSize == 0):
+    if (control_["serverType"] == "udp"):
+      control_["resolveTime"] = None
+    return (_getRetCode(control_, command_, SOCKET_SEND_FAILURE))
+  elif (respNeeded):
+    control_["pending"] = {"seqNum":seqNum, "startTime":startTime, "command":command_}
+    _gPendingRequests[(control_["socket"].fileno(), seqNum)] = control_
+  return (COMMAND_SUCCESS)
+
+#################################################################################
+#################################################################################
+def _cancelRequest(control_):
+  global _gPendingRequests
+  if (control_["pending"] != None):
+    _gPendingRequests.pop((control_["socket"].fileno(), control_["pending"]["seqNum"]), None)
+  control_["pending"] = None
+  control_["reply"] = None
+
+#################################################################################
+#################################################################################
+def _dispatchReply(socket_, pshellMsg_, address_):
+  # deliver a reply to the outstanding request of the send function that it
+  # belongs to, returns False if there is no such request
+  global _gPendingRequests
+  global _gNumRepliesReceived
+  control = _gPendingRequests.get((socket_.fileno(), pshellMsg_["seqNum"]))
+  if ((control == None) or (not _isReplyFrom(control, address_))):
+    return (False)
+  del _gPendingRequests[(socket_.fileno(), pshellMsg_["seqNum"])]
+  control["stats"]["bytesReceived"] += len(pshellMsg_["payload"])+struct.calcsize(_gPshellMsgHeaderFormat)
+  _addLatency(control["stats"], time.time()-control["pending"]["startTime"])
+  # remember the order the replies were read in, so waitAny returns the one
+  # we have held the longest first
+  _gNumRepliesReceived += 1
+  control["pending"]["arrival"] = _gNumRepliesReceived
+  control["reply"] = pshellMsg_
+  return (True)
+
+#################################################################################
+#################################################################################
+def _getWaitControls(sids_):
+  controls = []
+  for sid in sids_:
+    control = _getControl(sid)
+    if ((control != None) and (control["pending"] != None)):
+      controls.append((sid, control))
+  return (controls)
+
+#################################################################################
+#################################################################################
+def _completeRequest(sid_, control_):
+  command = control_["pending"]["command"]
+  control_["pshellMsg"] = control_["reply"]
+  control_["pending"] = None
+  control_["reply"] = None
+  retCode = _getRetCode(control_, command, control_["pshellMsg"]["msgType"])
+  if (retCode == COMMAND_SUCCESS):
+    return (sid_, control_["pshellMsg"]["payload"], retCode)
+  else:
+    return (sid_, "", retCode)
+
+#################################################################################
+#################################################################################
+def _waitAny(sids_, timeout_):
+  controls = _getWaitControls(sids_)
+  _waitReplies(controls, time.time()+float(timeout_)/float(1000.0), True)
+  replies = [(control["pending"]["arrival"], sid, control) for (sid, control) in controls if (control["reply"] != None)]
+  if (len(replies) > 0):
+    (arrival, sid, control) = min(replies, key=lambda reply: reply[0])
+    return (_completeRequest(sid, control))
+  return (INVALID_SID, "", SOCKET_TIMEOUT)
+
+#################################################################################
+#################################################################################
+def _waitAll(sids_, timeout_):
+  controls = _getWaitControls(sids_)
+  _waitReplies(controls, time.time()+float(timeout_)/float(1000.0), False)
+  results = {}
+  for (sid, control) in controls:
+    if (control["reply"] != None):
+      (sid, payload, retCode) = _completeRequest(sid, control)
+      results[sid] = (payload, retCode)
+    else:
+      command = control["pending"]["command"]
+      _cancelRequest(control)
+      if (control["serverType"] == "udp"):
+        control["resolveTime"] = None
+      results[sid] = ("", _getRetCode(control, command, SOCKET_TIMEOUT))
+  return (results)
+
+#################################################################################
+#################################################################################
+def _waitReplies(controls_, deadline_, waitAny_):
+  sockets = {}
+  for (sid, control) in controls_:
+    if (control["reply"] == None):
+      sockets[control["socket"].fileno()] = control["socket"]
+  if (selectors != None):
+    selector = selectors.DefaultSelector()
+    for socketFd in sockets.values():
+      selector.register(socketFd, selectors.EVENT_READ)
+  while (True):
+    numReplies = sum(1 for (sid, control) in controls_ if (control["reply"] != None))
+    if ((numReplies == len(controls_)) or (waitAny_ and (numReplies > 0))):
+      break
+    # once the deadline has passed we still read the replies that have already
+    # arrived, without waiting for any more
+    timeout = max(deadline_-time.time(), 0)
+    if (selectors != None):
+      inputready = [key.fileobj for (key, events) in selector.select(timeout)]
+    else:
+      try:
+        inputready, outputready, exceptready = select.select(list(sockets.values()), [], [], timeout)
+      except:
+        inputready = []
+    if ((len(inputready) == 0) and (time.time() >= deadline_)):
+      break
+    for socketFd in inputready:
+      try:
+        (pshellMsg, addr) = socketFd.recvfrom(_gPshellMsgPayloadLength)
+      except:
+        continue
+      pshellMsg = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(pshellMsg)-struct.calcsize(_gPshellMsgHeaderFormat))+"s", pshellMsg)))
+      if ((not _dispatchReply(socketFd, pshellMsg, addr)) and
+          (not _dispatchSharedSubscriptionData(socketFd, pshellMsg, addr))):
+        _printWarning("Received unexpected seqNum: %d, no outstanding request" % pshellMsg["seqNum"])
+  if (selectors != None):
+    selector.close()
+
+#################################################################################
+#################################################################################
+def _getNextSeqNum(control_):
+  global _gSharedSockets
+  if (control_["isShared"]):
+    # the seqNum space is per socket so replies from different servers that
+    # share our source socket can never be mistaken for each other
+    shared = _gSharedSockets[control_["serverType"]]
+    shared["seqNum"] += 1
+    control_["pshellMsg"]["seqNum"] = shared["seqNum"]
+  else:
+    control_["pshellMsg"]["seqNum"] += 1
+  return (control_["pshellMsg"]["seqNum"])
+
+#################################################################################
+#################################################################################
+def _receiveReply(control_, seqNum_, deadline_):
+  while (True):
+    try:
+      inputready, outputready, exceptready = select.select([control_["socket"]], [], [], max(deadline_-time.time(), 0))
+    except:
+      inputready = []
+    if (len(inputready) == 0):
+      return (SOCKET_TIMEOUT)
+    try:
+      (pshellMsg, addr) = control_["socket"].recvfrom(_gPshellMsgPayloadLength)
+    except:
+      return (SOCKET_RECEIVE_FAILURE)
+    pshellMsg = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(pshellMsg)-struct.calcsize(_gPshellMsgHeaderFormat))+"s", pshellMsg)))
+    if (_dispatchReply(control_["socket"], pshellMsg, addr) or
+        _dispatchSharedSubscriptionData(control_["socket"], pshellMsg, addr)):
+      # response to an outstanding request of the send function, or results of
+      # a subscription, from another server that shares our socket, it has been
+      # handed off to that server
+      continue
+    control_["stats"]["bytesReceived"] += len(pshellMsg["payload"])+struct.calcsize(_gPshellMsgHeaderFormat)
+    if (not _isReplyFrom(control_, addr)):
+      # reply from a different server on our shared socket, this can only be
+      # a late response to a request that has already timed out, toss it
+      _printWarning("Received seqNum: %d from an unexpected server, expected server: %s" % (pshellMsg["seqNum"], control_["remoteServer"]))
+    elif (_dispatchSubscriptionData(control_, pshellMsg)):
+      continue
+    elif (seqNum_ > pshellMsg["seqNum"]):
+      # make sure we have the correct response, this condition can happen if we had
+      # a very short timeout for the previous call and missed the response, in which
+      # case the response to the previous call will be queued in the socket ahead of
+      # our current expected response, when we detect that condition, we read the
+      # socket until we either find the correct response or timeout, we toss any previous
+      # unmatched responses
+      _printWarning("Received seqNum: %d, does not match sent seqNum: %d" % (pshellMsg["seqNum"], seqNum_))
+    else:
+      control_["pshellMsg"] = pshellMsg
+      return (pshellMsg["msgType"])
+
+#################################################################################
+#################################################################################
+def _discoverServers(broadcastAddress_, port_, timeout_, numPorts_):
+  global _gMsgTypes
+  global _gPshellMsgHeaderFormat
+  try:
+    socketFd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    socketFd.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    socketFd.bind(("", 0))
+  except Exception as error:
+    _printError("Could not create discovery socket, error: {}".format(error))
+    return ([])
+  # an older server does not know this msgType, we send a payload that will
+  # not match any of its commands and ignore its non-JSON reply
+  pshellMsg = OrderedDict([("msgType",_gMsgTypes["discover"]),
+                           ("respNeeded",True),
+                           ("dataNeeded",True),
+                           ("pad",0),
+                           ("seqNum",0),
+                           ("payload","discover")])
+  message = struct.pack(_gPshellMsgHeaderFormat+str(len(pshellMsg["payload"]))+"s", *pshellMsg.values())
+  for port in range(int(port_), int(port_)+numPorts_):
+    try:
+      socketFd.sendto(message, (broadcastAddress_, port))
+    except Exception as error:
+      _printError("Could not send discovery request to: {}:{}, error: {}".format(broadcastAddress_, port, error))
+  servers = {}
+  for (pshellMsg, address) in _gatherReplies(socketFd, time.time()+float(timeout_)/1000.0):
+    try:
+      serverInfo = _loadJson(pshellMsg["payload"])
+    except:
+      continue
+    if (isinstance(serverInfo, dict)):
+      # keyed by address since a server can hear the same broadcast more than once
+      servers[address] = {"name":serverInfo.get("name"),
+                          "host":address[0],
+                          "port":address[1],
+                          "title":serverInfo.get("title"),
+                          "version":serverInfo.get("version")}
+  socketFd.close()
+  return ([servers[address] for address in sorted(servers)])
+
+#################################################################################
+#################################################################################
+def _gatherReplies(socket_, deadline_, maxReplies_ = 0):
+  global _gPshellMsgPayloadLength
+  global _gPshellMsgHeaderFormat
+  # collect every reply that arrives on the socket until the deadline, this is
+  # used when we do not know how many servers will answer a request
+  replies = []
+  while ((maxReplies_ == 0) or (len(replies) < maxReplies_)):
+    try:
+      inputready, outputready, exceptready = select.select([socket_], [], [], max(deadline_-time.time(), 0))
+    except:
+      inputready = []
+    if (len(inputready) == 0):
+      return (replies)
+    try:
+      (pshellMsg, address) = socket_.recvfrom(_gPshellMsgPayloadLength)
+      pshellMsg = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(pshellMsg)-struct.calcsize(_gPshellMsgHeaderFormat))+"s", pshellMsg)))
+    except:
+      continue
+    replies.append((pshellMsg, address))
+  return (replies)
+
+#################################################################################
+#################################################################################
+def _isReplyFrom(control_, address_):
+  if (not control_["isShared"]):
+    return (True)
+  elif ((control_["serverType"] == "udp") and (control_["resolveTime"] == None)):
+    # we could not resolve the server's hostname, so just match on the port
+    return (address_[1] == control_["destAddress"][1])
+  else:
+    return (address_ == control_["destAddress"])
 
 #################################################################################
 #################################################################################
@@ -851,14 +2517,189 @@ def _getResponseString(retCode):
   else:
     return ("PSHELL_UNKNOWN_RESPONSE: %d" % retCode)
 
+#################################################################################
+#################################################################################
+def _createStats():
+  return ({"requests":0,
+           "retCodes":{},
+           "bytesSent":0,
+           "bytesReceived":0,
+           "latencyCount":0,
+           "latencyTotal":0,
+           "latencyMin":None,
+           "latencyMax":0,
+           "latencyLast":0,
+           "histogram":[0]*_gNumLatencyBuckets,
+           "lastReplyTime":None,
+           "lastFailureTime":None,
+           "consecutiveFailures":0,
+           "lastError":None,
+           "lastErrorTime":None})
+
+#################################################################################
+#################################################################################
+def _isFailure(retCode_):
+  # the server did not reply, as opposed to a reply with an error
+  return ((retCode_ >= SOCKET_SEND_FAILURE) and (retCode_ <= SOCKET_NOT_CONNECTED))
+
+#################################################################################
+#################################################################################
+def _addRetCode(stats_, retCode_):
+  stats_["retCodes"][retCode_] = stats_["retCodes"].get(retCode_, 0) + 1
+  now = time.time()
+  if (_isFailure(retCode_)):
+    stats_["lastFailureTime"] = now
+    stats_["consecutiveFailures"] += 1
+  else:
+    stats_["lastReplyTime"] = now
+    stats_["consecutiveFailures"] = 0
+  if (retCode_ != COMMAND_SUCCESS):
+    stats_["lastError"] = retCode_
+    stats_["lastErrorTime"] = now
+
+#################################################################################
+#################################################################################
+def _addLatency(stats_, latency_):
+  # latency is tracked in usec, the histogram buckets are log-linear, i.e. each
+  # power-of-2 range is split into _gLatencySubBuckets linear sub-buckets, this
+  # bounds the relative error of the derived percentiles while keeping the cost
+  # of an update to a couple of integer operations
+  usec = max(int(latency_*1000000), 0)
+  stats_["latencyCount"] += 1
+  stats_["latencyTotal"] += usec
+  stats_["latencyLast"] = usec
+  stats_["latencyMax"] = max(stats_["latencyMax"], usec)
+  if ((stats_["latencyMin"] == None) or (usec < stats_["latencyMin"])):
+    stats_["latencyMin"] = usec
+  stats_["histogram"][min(_getLatencyBucket(usec), _gNumLatencyBuckets-1)] += 1
+
+#################################################################################
+#################################################################################
+def _getLatencyBucket(usec_):
+  if (usec_ < _gLatencySubBuckets):
+    return (usec_)
+  exponent = usec_.bit_length()-1
+  shift = exponent-_gLatencySubBucketBits
+  return ((exponent-_gLatencySubBucketBits+1)*_gLatencySubBuckets +
+          (usec_ >> shift) - _gLatencySubBuckets)
+
+#################################################################################
+#################################################################################
+def _getLatencyBucketBounds(bucket_):
+  if (bucket_ < _gLatencySubBuckets):
+    return (bucket_, bucket_+1)
+  shift = bucket_//_gLatencySubBuckets - 1
+  lower = (_gLatencySubBuckets + bucket_%_gLatencySubBuckets) << shift
+  return (lower, lower + (1 << shift))
+
+#################################################################################
+#################################################################################
+def _getLatencyPercentile(histogram_, count_, percentile_):
+  # return the upper bound of the bucket containing the requested percentile,
+  # i.e. the reported value is never less than the actual value
+  if (count_ == 0):
+    return (0.0)
+  target = max(int(count_*percentile_/100.0 + 0.5), 1)
+  total = 0
+  for bucket, numEntries in enumerate(histogram_):
+    total += numEntries
+    if (total >= target):
+      return (float(_getLatencyBucketBounds(bucket)[1])/1000.0)
+  return (float(_getLatencyBucketBounds(len(histogram_)-1)[1])/1000.0)
+
+#################################################################################
+#################################################################################
+def _mergeStats(stats_, total_):
+  for key in ("requests", "bytesSent", "bytesReceived", "latencyCount", "latencyTotal"):
+    total_[key] += stats_[key]
+  for retCode, count in stats_["retCodes"].items():
+    total_["retCodes"][retCode] = total_["retCodes"].get(retCode, 0) + count
+  if ((stats_["latencyMin"] != None) and
+      ((total_["latencyMin"] == None) or (stats_["latencyMin"] < total_["latencyMin"]))):
+    total_["latencyMin"] = stats_["latencyMin"]
+  total_["latencyMax"] = max(total_["latencyMax"], stats_["latencyMax"])
+  if (stats_["latencyCount"] > 0):
+    total_["latencyLast"] = stats_["latencyLast"]
+  for bucket, numEntries in enumerate(stats_["histogram"]):
+    total_["histogram"][bucket] += numEntries
+  for key in ("lastReplyTime", "lastFailureTime"):
+    if ((stats_[key] != None) and ((total_[key] == None) or (stats_[key] > total_[key]))):
+      total_[key] = stats_[key]
+  total_["consecutiveFailures"] = max(total_["consecutiveFailures"], stats_["consecutiveFailures"])
+  if ((stats_["lastErrorTime"] != None) and
+      ((total_["lastErrorTime"] == None) or (stats_["lastErrorTime"] > total_["lastErrorTime"]))):
+    total_["lastError"] = stats_["lastError"]
+    total_["lastErrorTime"] = stats_["lastErrorTime"]
+
+#################################################################################
+#################################################################################
+def _getStats(sid_):
+  global _gPshellControl
+  if (sid_ == ALL_SIDS):
+    stats = _createStats()
+    for control in _gPshellControl:
+      _mergeStats(control["stats"], stats)
+  else:
+    control = _getControl(sid_)
+    if (control == None):
+      return (None)
+    stats = control["stats"]
+  count = stats["latencyCount"]
+  # a single missed reply, e.g. to a command that ran longer than its timeout,
+  # does not make a server that has been replying unreachable
+  reachable = None
+  if (stats["lastReplyTime"] != None):
+    reachable = (stats["consecutiveFailures"] < _gMaxConsecutiveFailures)
+  elif (stats["lastFailureTime"] != None):
+    reachable = False
+  lastError = None
+  if (stats["lastError"] != None):
+    lastError = _getResponseString(stats["lastError"])
+  histogram = []
+  for bucket, numEntries in enumerate(stats["histogram"]):
+    if (numEntries > 0):
+      (lower, upper) = _getLatencyBucketBounds(bucket)
+      histogram.append((lower, upper, numEntries))
+  return ({"requests":stats["requests"],
+           "retCodes":dict((_getResponseString(retCode), numEntries) for (retCode, numEntries) in stats["retCodes"].items()),
+           "bytesSent":stats["bytesSent"],
+           "bytesReceived":stats["bytesReceived"],
+           "latency":{"count":count,
+                      "min":float(stats["latencyMin"] or 0)/1000.0,
+                      "max":float(stats["latencyMax"])/1000.0,
+                      "mean":(float(stats["latencyTotal"])/count/1000.0 if count > 0 else 0.0),
+                      "last":float(stats["latencyLast"])/1000.0,
+                      "p50":_getLatencyPercentile(stats["histogram"], count, 50),
+                      "p90":_getLatencyPercentile(stats["histogram"], count, 90),
+                      "p99":_getLatencyPercentile(stats["histogram"], count, 99)},
+           "histogram":histogram,
+           "failures":sum(numEntries for (retCode, numEntries) in stats["retCodes"].items() if _isFailure(retCode)),
+           "consecutiveFailures":stats["consecutiveFailures"],
+           "reachable":reachable,
+           "lastReplyTime":stats["lastReplyTime"],
+           "lastError":lastError,
+           "lastErrorTime":stats["lastErrorTime"]})
+
+#################################################################################
+#################################################################################
+def _resetStats(sid_):
+  global _gPshellControl
+  if (sid_ == ALL_SIDS):
+    for control in _gPshellControl:
+      control["stats"] = _createStats()
+  else:
+    control = _getControl(sid_)
+    if (control != None):
+      control["stats"] = _createStats()
+
 #################################################################################
 #################################################################################
 def _cleanupUnixResources():
   global _gUnixSocketPath
   global _gLockFileExtension
   if not os.path.isdir(_gUnixSocketPath):
-    os.system("mkdir %s" % _gFileSystemPath)
-    os.system("chmod 777 %s" % _gFileSystemPath)
+    os.system("mkdir %s" % _gUnixSocketPath)
+    os.system("chmod 777 %s" % _gUnixSocketPath)
   lockFiles = fnmatch.filter(os.listdir(_gUnixSocketPath), "*"+_gLockFileExtension)
   for file in lockFiles:
     try:
@@ -880,11 +2721,67 @@ def _cleanupUnixResources():
       None
 
 #################################################################################
+#################################################################################
+def _reconnectServer(sid_):
+  global _gUnixSocketPath
+  control = _getControl(sid_)
+  if (control == None):
+    return (False)
+  elif (control["socket"] != None):
+    # still connected
+    return (True)
+  if (control["serverType"] == "unix"):
+    remoteServer = control["destAddress"].lstrip("\0")[len(_gUnixSocketPath):]
+  else:
+    remoteServer = control["destHost"]
+  (socketFd, lockFd, sourceAddress, isShared) = _getSocket(control["serverType"], remoteServer)
+  if (socketFd == None):
+    return (False)
+  if (control["serverType"] == "unix"):
+    # the server may have been restarted in the other namespace
+    control["destAddress"] = _gUnixSocketPath+remoteServer
+    if (not os.path.exists(control["destAddress"])):
+      control["destAddress"] = "\0"+control["destAddress"]
+  elif (control["isBroadcastAddress"]):
+    if (_isMulticastAddress(remoteServer.split("."))):
+      _setMulticastOptions(socketFd)
+    else:
+      socketFd.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+  control["socket"] = socketFd
+  control["lockFd"] = lockFd
+  control["sourceAddress"] = sourceAddress
+  control["isShared"] = isShared
+  return (True)
+
 #################################################################################
 def _removeControl(control_):
   global _gPshellControl
+  global _gSharedSockets
+  if (control_["socket"] == None):
+    # already disconnected
+    return
+  _cancelRequest(control_)
+  for (command, interval) in list(control_["subscriptions"].keys()):
+    # let the server stop running the command now rather than when the lease expires
+    _sendNotification(control_, _gMsgTypes["unsubscribe"], json.dumps({"command":command, "interval":interval}))
+  control_["subscriptions"] = {}
+  if (control_["isShared"]):
+    shared = _gSharedSockets[control_["serverType"]]
+    shared["refCount"] -= 1
+    if (shared["refCount"] == 0):
+      # last user of the shared socket, release it
+      _closeSocket(control_)
+      del _gSharedSockets[control_["serverType"]]
+  else:
+    _closeSocket(control_)
+  control_["socket"] = None
+
+#################################################################################
+#################################################################################
+def _closeSocket(control_):
   global _gLockFileExtension
-  if (control_["serverType"] == "unix"):
+  if ((control_["serverType"] == "unix") and (control_["lockFd"] != None)):
+    # filesystem bound source socket, autobound sockets have nothing to remove
     try:
       os.unlink(control_["sourceAddress"])
     except:
@@ -893,7 +2790,6 @@ def _removeControl(control_):
       os.unlink(control_["sourceAddress"]+_gLockFileExtension)
     except:
       None
-  _cleanupUnixResources()
   control_["socket"].close()
 
 #################################################################################
@@ -908,7 +2804,37 @@ def _getControl(sid_):
 
 #################################################################################
 #################################################################################
-def _loadConfigFile(controlName_, remoteServer_, port_, defaultTimeout_):
+def _loadConfigFile(controlName_, remoteServer_, port_, defaultTimeout_, config_ = None):
+  if (config_ == None):
+    config_ = _readConfigFile()
+  isUnix = False
+  for (controlName, option, value) in config_:
+    if (controlName_ == controlName):
+      if (option == "udp"):
+        remoteServer_ = value.strip()
+      elif (option == "unix"):
+        remoteServer_ = value.strip()
+        port_ = "unix"
+        isUnix = True
+      elif (option == "port"):
+        port_ = value.strip()
+      elif (option == "timeout"):
+        if (value.lower().strip() == "none"):
+          defaultTimeout_ = 0
+        else:
+          defaultTimeout_ = int(value.strip())
+  # make this check in case they changed the server
+  # from udp to unix and forgot to comment out the
+  # port
+  if (isUnix):
+    port_ = "unix"
+  return (remoteServer_, port_, defaultTimeout_)
+
+#################################################################################
+#################################################################################
+def _readConfigFile():
+  # returns a (controlName, option, value) tuple for each setting in the config
+  # file, an empty list if there is no config file
   configFile1 = ""
   configPath = os.getenv('PSHELL_CONFIG_DIR')
   if (configPath != None):
@@ -922,36 +2848,19 @@ def _loadConfigFile(controlName_, remoteServer_, port_, defaultTimeout_):
   elif (os.path.isfile(configFile3)):
     file = open(configFile3, 'r')
   else:
-    return (remoteServer_, port_, defaultTimeout_)
+    return ([])
   # found a config file, process it
-  isUnix = False
+  config = []
   for line in file:
     # skip comments
     if (line[0] != "#"):
       option = line.split("=")
       if (len(option) == 2):
         control = option[0].split(".")
-        if ((len(control) == 2) and (controlName_ == control[0])):
-          if (control[1].lower() == "udp"):
-            remoteServer_ = option[1].strip()
-          elif (control[1].lower() == "unix"):
-            remoteServer_ = option[1].strip()
-            port_ = "unix"
-            isUnix = True
-          elif (control[1].lower() == "port"):
-            port_ = option[1].strip()
-          elif (control[1].lower() == "timeout"):
-            if (option[1].lower().strip() == "none"):
-              defaultTimeout_ = 0
-            else:
-              defaultTimeout_ = int(option[1].strip())
+        if (len(control) == 2):
+          config.append((control[0], control[1].lower(), option[1]))
   file.close()
-  # make this check in case they changed the server
-  # from udp to unix and forgot to comment out the
-  # port
-  if (isUnix):
-    port_ = "unix"
-  return (remoteServer_, port_, defaultTimeout_)
+  return (config)
 
 #################################################################################
 #################################################################################
@@ -1000,19 +2909,56 @@ def _printLog(message_):
 # list of dictionaries that contains a control structure for each control client
 _gPshellControl = []
 
-# list of dictionaries that contains multicast group information
-_gPshellMulticast = []
+# dictionary that contains the multicast group information keyed by keyword, the
+# sids of a group are an ordered set, i.e. an OrderedDict with no values, the
+# keywords are also kept sorted, except for MULTICAST_ALL, so the keywords that
+# a command abbreviates are found with a binary search, they are all adjacent
+_gPshellMulticast = {}
+_gMulticastKeywords = []
+
+# how long (in msec) a resolved UDP server hostname is used before resolving it again
+_gDnsCacheTimeout = ONE_MINUTE
+
+# maximum number of threads used to resolve hostnames in parallel by connectServers
+_gMaxResolveThreads = 32
+
+# outgoing interface (None for the default route) and TTL of IP multicast group commands
+_gMulticastInterface = None
+_gMulticastTtl = 1
+
+# when set, all UDP servers share a single source socket, as do all UNIX servers,
+# the replies are demultiplexed by the server's source address and the seqNum
+_gSharedSocket = False
+_gSharedSockets = {}
+
+# outstanding requests issued by the send function, keyed by the source
+# socket's file descriptor and the request's seqNum
+_gPendingRequests = {}
+_gNumRepliesReceived = 0
+
+# maximum number of pushed subscription results queued per server until
+# they are collected with getSubscriptionData
+_gMaxSubscriptionData = 1000
 
 # path of unix domain socket handle for client sockets
 _gUnixSocketPath = "/tmp/.pshell/"
 _gLockFileExtension = ".lock"
+_gCatalogFileExtension = ".catalog"
+# the number of catalog files that are kept, the least recently used go first
+_gMaxCatalogFiles = 64
+
+# on Linux the client unix sockets are autobound in the abstract namespace,
+# otherwise we fall back to a randomly named socket file with an associated lock
+# file, this is the number of names we try before giving up
+_gUnixAutobind = sys.platform.startswith("linux")
+_gMaxBindAttempts = 1000
 _PSHELL_CONFIG_DIR = "/etc/pshell/config"
 _PSHELL_CONFIG_FILE = "pshell-control.conf"
 
 # these are the valid types we recognize in the msgType field of the pshellMsg structure,
 # that structure is the message passed between the pshell client and server, these values
 # must match their corresponding #define definitions in the C file PshellCommon.h
-_gMsgTypes = {"queryName":3, "queryCommands":4, "commandComplete":8, "queryBanner":9, "queryTitle":10, "queryPrompt":11, "controlCommand":12}
+_gMsgTypes = {"queryName":3, "queryCommands":4, "commandComplete":8, "queryBanner":9, "queryTitle":10, "queryPrompt":11, "controlCommand":12, "queryAll":13, "queryCatalogVersion":14, "discover":15, "batch":16, "conditional":17, "notModified":18, "subscribe":19, "unsubscribe":20, "subscriptionData":21}
 
 # fields of PshellMsg, we use this definition to unpack the received PshellMsg response
 # from the server into a corresponding OrderedDict in the PshellControl entry
@@ -1042,6 +2988,35 @@ _gPshellControlResponse = {COMMAND_SUCCESS:"PSHELL_COMMAND_SUCCESS",
 # is run by the client
 _gSupressInvalidArgCountMessage = False
 
+# when a command advertises its expected duration in the server's catalog, the
+# sendCommand1 and sendCommand3 functions wait this many times that duration
+# for the response instead of the default timeout, but never less than the
+# minimum timeout (in msec)
+_gExpectedDurationFactor = 2
+_gMinCommandTimeout = ONE_MSEC*500
+
+# these are the arguments that request the usage of a command
+_gCommandHelp = ('?', '-h', '--h', '-help', '--help')
+
+# maximum size of the JSON encoded command list of a single batch request
+_gMaxBatchSize = 1024*32
+
+# when set, the last results of each command are cached per server and the
+# command is sent with their digest so the server can reply 'not modified'
+_gConditionalRequests = False
+_gMaxCachedOutputs = 100
+
+# latency histogram layout, each power-of-2 usec range is split into 2^N linear
+# sub-buckets, 128 buckets covers latencies up to ~2 hours with a worst case
+# bucket width of 1/4 of its lower bound
+_gLatencySubBucketBits = 2
+_gLatencySubBuckets = 1 << _gLatencySubBucketBits
+_gNumLatencyBuckets = 128
+
+# a server that has replied before is only reported as unreachable once it has
+# missed this many replies in a row
+_gMaxConsecutiveFailures = 3
+
 # log level and log print function
 _gLogLevel = LOG_LEVEL_DEFAULT
 _gLogFunction = None
@@ -289,18 +289,28 @@ def _setIdleTimeout(idleTimeout_):
 #################################################################################
 def _addTabCompletion(keyword_):
   global _gTabCompletions
+  global _gTabCompletionKeywords
   global _gMaxTabCompletionKeywordLength
   global _gMaxCompletionsPerLine
   global _gTabSpacing
   global _gTabColumns
-  for keyword in _gTabCompletions:
-    if (keyword == keyword_):
-      # duplicate keyword found, return
-      return
+  if (keyword_.strip() in _gTabCompletionKeywords):
+    # duplicate keyword found, return
+    return
   if (len(keyword_)+_gTabSpacing > _gMaxTabCompletionKeywordLength):
     _gMaxTabCompletionKeywordLength = len(keyword_)+_gTabSpacing
     _gMaxCompletionsPerLine = _gTabColumns/_gMaxTabCompletionKeywordLength
   _gTabCompletions.append(keyword_.strip())
+  _gTabCompletionKeywords.add(keyword_.strip())
+
+#################################################################################
+#################################################################################
+def _removeTabCompletion(keyword_):
+  global _gTabCompletions
+  global _gTabCompletionKeywords
+  if (keyword_ in _gTabCompletionKeywords):
+    _gTabCompletions.remove(keyword_)
+    _gTabCompletionKeywords.remove(keyword_)
 
 #################################################################################
 #################################################################################
@@ -728,6 +738,7 @@ _gSerialType = TTY
 _gInFd = sys.stdin
 _gOutFd = sys.stdout
 _gTabCompletions = []
+_gTabCompletionKeywords = set()
 _gMaxTabCompletionKeywordLength = 0
 _gMaxCompletionsPerLine = 0
 _gMaxMatchKeywordLength = 0
@@ -57,6 +57,12 @@ Function to allow a parent application to call it's own PSHELL function
 
 runCommand() -- run a registered command from the parent (i.e. registering) program
 
+Functions to control how the server socket is bound
+
+setPortRange()         -- set the range of ports tried when binding a UDP/TCP server
+setAbstractNamespace() -- bind UNIX servers without a socket file or lock file
+joinMulticastGroup()   -- also receive commands sent to an IP multicast group (UDP only)
+
 Functions to allow extraction of internal log messages from parent application
 
 setLogLevel()    -- set the internal log level for this module
@@ -152,6 +158,7 @@ demo program pshellServerDemo.py.
 # import all our necessary modules
 import sys
 import os
+import errno
 import time
 import select
 import socket
@@ -160,6 +167,9 @@ import random
 import thread
 import fcntl
 import fnmatch
+import json
+import hashlib
+import bisect
 from collections import OrderedDict
 from collections import namedtuple
 import PshellReadline
@@ -222,27 +232,30 @@ RADIX_ANY = 2
 
 #################################################################################
 #################################################################################
-def addCommand(function, command, description, usage = None, minArgs = 0, maxArgs = 0, showUsage = True):
+def addCommand(function, command, description, usage = None, minArgs = 0, maxArgs = 0, showUsage = True, expectedDuration = None):
   """
   Register callback commands to our PSHELL server.  If the command takes no
   arguments, the default parameters can be provided.  If the command takes
   an exact number of parameters, set minArgs and maxArgs to be the same.  If
   the user wants the callback function to handle all help initiated usage,
-  set the showUsage parameter to False.
+  set the showUsage parameter to False.  If an expectedDuration is given, it
+  is published to the control clients so they can pick a response timeout
+  for the command, and a warning is logged whenever the command takes longer.
 
     Args:
-        function (ptr)    : User callback function
-        command (str)     : Command to dispatch the function (single keyword only)
-        description (str) : One line description of command
-        usage (str)       : One line command usage (Unix style preferred)
-        minArgs (int)     : Minimum number of required arguments
-        maxArgs (int)     : Maximum number of required arguments
-        showUsage (bool)  : Show registered usage on a '?' or '-h'
+        function (ptr)         : User callback function
+        command (str)          : Command to dispatch the function (single keyword only)
+        description (str)      : One line description of command
+        usage (str)            : One line command usage (Unix style preferred)
+        minArgs (int)          : Minimum number of required arguments
+        maxArgs (int)          : Maximum number of required arguments
+        showUsage (bool)       : Show registered usage on a '?' or '-h'
+        expectedDuration (int) : Expected execution time of the command (in msec)
 
     Returns:
         none
   """
-  _addCommand(function, command, description, usage, minArgs,  maxArgs,  showUsage)
+  _addCommand(function, command, description, usage, minArgs,  maxArgs,  showUsage, expectedDuration_ = expectedDuration)
 
 #################################################################################
 #################################################################################
@@ -337,6 +350,71 @@ def setLogFunction(function):
   """
   _setLogFunction(function)
 
+#################################################################################
+#################################################################################
+def setPortRange(numPorts, ephemeralFallback = False):
+  """
+  Set the number of ports, starting at the requested port, that are tried when
+  binding a UDP or TCP server, the default is 1000.  Ports already claimed by
+  other servers of the same type on this host are skipped without attempting
+  a bind.  If ephemeralFallback is True and no port in the range is available,
+  the server is bound to a port assigned by the kernel, the assigned port is
+  published in the server registry so it can be found via 'pshell -s'.  This
+  must be called before startServer.
+
+    Args:
+        numPorts (int)           : Number of ports to try, starting at the requested port
+        ephemeralFallback (bool) : Use an ephemeral port if the range is exhausted
+
+    Returns:
+        None
+  """
+  _setPortRange(numPorts, ephemeralFallback)
+
+#################################################################################
+#################################################################################
+def setAbstractNamespace(enable):
+  """
+  Bind UNIX servers in the Linux abstract namespace rather than as a socket file
+  under /tmp/.pshell.  An abstract server has no socket file or lock file to
+  create or cleanup, it is found by the clients via the server registry file
+  /tmp/.pshell/pshell.registry.  This must be called before startServer, it can
+  also be set on a per serverName basis via the pshell-server.conf config file
+  with the '<serverName>.abstract=true' option.
+
+    Args:
+        enable (bool) : Enable/disable abstract namespace UNIX servers
+
+    Returns:
+        None
+  """
+  _setAbstractNamespace(enable)
+
+#################################################################################
+#################################################################################
+def joinMulticastGroup(groupAddress, port, interface = ANYHOST):
+  """
+  Have a UDP server also receive the commands that a control client sends to
+  an IP multicast group, a single datagram from the client then reaches every
+  server that has joined the group.  The group port is shared by all the servers
+  on a host that join the group, it is separate from the server's own port.
+  Replies are always sent from the server's own port, and are not sent at all
+  for a group command when the client does not request a response.  This must
+  be called before startServer, it can also be set on a per serverName basis
+  via the pshell-server.conf config file with the option
+  '<serverName>.multicast=<groupAddress>:<port>[:<interface>]'.
+
+    Args:
+        groupAddress (str) : IP multicast group address, e.g. 239.255.1.1
+        port (int)         : UDP port the group commands are sent to
+        interface (str)    : Local interface address to join the group on,
+                             use LOCALHOST to join on the loopback interface
+
+    Returns:
+        None
+  """
+  _joinMulticastGroup(groupAddress, port, interface)
+
 #################################################################################
 #
 # The following public functions should only be called from within a
@@ -888,8 +966,11 @@ def _addCommand(function_,
                 minArgs_,
                 maxArgs_,
                 showUsage_,
-                prepend_ = False):
+                prepend_ = False,
+                expectedDuration_ = None):
   global _gCommandList
+  global _gCommandNames
+  global _gCommandIndex
   global _gMaxLength
   global _gServerType
   global _gPshellClient
@@ -909,8 +990,10 @@ def _addCommand(function_,
     _printError("NULL function, command: '%s' not added" % command_)
     return
 
-  # if they provided no usage for a function with arguments
-  if (((maxArgs_ > 0) or (minArgs_ > 0)) and (command_ != "quit") and ((usage_ == None) or (len(usage_) == 0))):
+  # if they provided no usage for a function with arguments, the pshell client
+  # is exempt because it mirrors the remote commands with the command name
+  # counted as an argument, so a remote command with no usage may have one
+  if (((maxArgs_ > 0) or (minArgs_ > 0)) and (command_ != "quit") and (_gPshellClient == False) and ((usage_ == None) or (len(usage_) == 0))):
     _printError("NULL usage for command that takes arguments, command: '%s' not added" % command_)
     return
 
@@ -922,11 +1005,10 @@ def _addCommand(function_,
     return
 
   # see if it is a duplicate command
-  for command in _gCommandList:
-    if (command["name"] == command_):
-      # command name already exists, don't add it again
-      _printError("Command: %s already exists, not adding command" % command_)
-      return
+  if (command_ in _gCommandIndex):
+    # command name already exists, don't add it again
+    _printError("Command: %s already exists, not adding command" % command_)
+    return
 
   if len(command_.split()) > 1:
     # we do not allow any commands with whitespace, single keyword commands only
@@ -944,22 +1026,50 @@ def _addCommand(function_,
   if (len(command_) > _gMaxLength):
     _gMaxLength = len(command_)
 
+  command = {"function":function_,
+             "name":command_,
+             "description":description_,
+             "usage":usage_,
+             "minArgs":minArgs_,
+             "maxArgs":maxArgs,
+             "showUsage":showUsage_,
+             "expectedDuration":expectedDuration_,
+             "overruns":0}
+
   if (prepend_ == True):
-    _gCommandList.insert(0, {"function":function_,
-                             "name":command_,
-                             "description":description_,
-                             "usage":usage_,
-                             "minArgs":minArgs_,
-                             "maxArgs":maxArgs,
-                             "showUsage":showUsage_})
+    _gCommandList.insert(0, command)
   else:
-    _gCommandList.append({"function":function_,
-                          "name":command_,
-                          "description":description_,
-                          "usage":usage_,
-                          "minArgs":minArgs_,
-                          "maxArgs":maxArgs,
-                          "showUsage":showUsage_})
+    _gCommandList.append(command)
+
+  # the sorted names let the dispatcher find all the commands an abbreviation
+  # matches without scanning the whole list
+  _gCommandIndex[command_] = command
+  bisect.insort(_gCommandNames, command_)
+
+  # a command added after we have started, e.g. by the pshellAggregator, gets
+  # its TAB completion here, the rest get theirs when we start
+  _addTabCompletion(command_)
+
+#################################################################################
+#################################################################################
+def _removeCommand(command_):
+  global _gCommandList
+  global _gCommandNames
+  global _gCommandIndex
+  global _gServerType
+  global _gRunning
+  # used by the pshellAggregator to drop the command of a removed server
+  if (command_ not in _gCommandIndex):
+    return (False)
+  del _gCommandIndex[command_]
+  del _gCommandNames[bisect.bisect_left(_gCommandNames, command_)]
+  for index, command in enumerate(_gCommandList):
+    if (command["name"] == command_):
+      del _gCommandList[index]
+      if (((_gServerType == LOCAL) or (_gServerType == TCP)) and (_gRunning == True)):
+        PshellReadline._removeTabCompletion(command_)
+      return (True)
+  return (False)
 
 #################################################################################
 #################################################################################
@@ -971,7 +1081,6 @@ def _startServer(serverName_, serverType_, serverMode_, hostnameOrIpAddr_, port_
   global _gPort
   global _gRunning
   global _gPrompt
-  _cleanupFileSystemResources()
   if (_gRunning == False):
     _gServerName = serverName_
     _gServerType = serverType_
@@ -979,6 +1088,11 @@ def _startServer(serverName_, serverType_, serverMode_, hostnameOrIpAddr_, port_
     _gHostnameOrIpAddr = hostnameOrIpAddr_
     _gPort = port_
     _loadConfigFile()
+    if (_isAbstractServer()):
+      # abstract UNIX servers leave nothing in the filesystem to sweep
+      _createFileSystemPath()
+    else:
+      _cleanupFileSystemResources()
     _loadStartupFile()
     if _gPrompt[-1] != " ":
       _gPrompt = _gPrompt + " "
@@ -998,15 +1112,42 @@ def _serverThread():
 
 #################################################################################
 #################################################################################
-def _cleanupFileSystemResources():
+def _createFileSystemPath():
   global _gFileSystemPath
-  global _gLockFileExtension
-  global _gUnixLockFileId
   if not os.path.isdir(_gFileSystemPath):
     os.system("mkdir %s" % _gFileSystemPath)
     os.system("chmod 777 %s" % _gFileSystemPath)
+
+#################################################################################
+#################################################################################
+def _cleanupFileSystemResources():
+  # the stale socket and lock files are removed while looking for the servers
+  _getActiveServers()
+
+#################################################################################
+#################################################################################
+def _getActiveServers():
+  global _gFileSystemPath
+  global _gLockFileExtension
+  global _gUnixLockFileId
+  # return all the servers running on this host, used by the pshell and
+  # pshellAggregator clients, servers that publish themselves in the registry
+  # are read in one operation, we only need to probe the lock files of the
+  # servers that do not (e.g. 'C' servers), abstract namespace UNIX servers are
+  # only found in the registry, any stale socket and lock files are removed
+  _createFileSystemPath()
+  servers = []
+  registeredFiles = []
+  for server in _readRegistry():
+    servers.append({"name":server["name"], "type":server["type"], "host":server["host"], "port":server["port"], "pid":server["pid"], "role":server["role"]})
+    if (server["type"] == UNIX):
+      registeredFiles.append(server["name"]+"-unix"+_gLockFileExtension)
+    else:
+      registeredFiles.append("-".join([server["name"], server["type"], server["host"], server["port"]])+_gLockFileExtension)
   lockFiles = fnmatch.filter(os.listdir(_gFileSystemPath), "*"+_gLockFileExtension)
   for file in lockFiles:
+    if (file in registeredFiles):
+      continue
     try:
       fd = open(_gFileSystemPath+file, "r")
       try:
@@ -1024,9 +1165,18 @@ def _cleanupFileSystemResources():
         except:
           None
       except:
-        None
+        # file handle is in use and locked by another process, unless it is a
+        # control client, it belongs to a running server
+        if ("-control" not in file):
+          server = file[:-len(_gLockFileExtension)].split("-")
+          if (len(server) == 2):
+            servers.append({"name":server[0], "type":server[1], "host":"N/A", "port":"N/A", "pid":None, "role":None})
+          elif (len(server) == 4):
+            servers.append({"name":server[0], "type":server[1], "host":server[2], "port":server[3], "pid":None, "role":None})
+      fd.close()
     except:
       None
+  return (servers)
 
 #################################################################################
 #################################################################################
@@ -1041,8 +1191,26 @@ def _bindSocket(address_):
   global _gLockFile
   global _gLockFileExtension
   global _gFileSystemPath
+  global _gAbstractNamespace
+  global _gPortRange
+  global _gEphemeralPort
   global _MAX_BIND_ATTEMPTS
-  if _gServerType == UNIX:
+  if ((_gServerType == UNIX) and (_gAbstractNamespace == True)):
+    # Unix domain socket in the abstract namespace, the kernel releases the
+    # name when the socket is closed, so there is no lock file to manage
+    for attempt in range(1,_MAX_BIND_ATTEMPTS+1):
+      try:
+        _gSocketFd.bind(("\0"+_gUnixSourceAddress))
+        if attempt > 1:
+          _gServerName = _gServerName + str(attempt-1)
+        return
+      except Exception as error:
+        if attempt == 1:
+          # only print message on first attemps
+          _printWarning("Could not bind to UNIX address: {}, looking for first available address".format(_gServerName))
+        _gUnixSourceAddress = address_ + str(attempt)
+    _printError("Could not find available address after {} attempts".format(_MAX_BIND_ATTEMPTS))
+  elif _gServerType == UNIX:
     # Unix domain socket
     _gLockFile = _gUnixSourceAddress+"-unix"+_gLockFileExtension
     for attempt in range(1,_MAX_BIND_ATTEMPTS+1):
@@ -1061,29 +1229,88 @@ def _bindSocket(address_):
         _gLockFile = _gUnixSourceAddress+"-unix"+_gLockFileExtension
     _printError("Could not find available address after {} attempts".format(_MAX_BIND_ATTEMPTS))
   else:
-    # IP domain socket
-    port = _gPort
-    for attempt in range(1,_MAX_BIND_ATTEMPTS+1):
+    # IP domain socket, we skip over any ports in our range that are already
+    # claimed by another server of our type so we only attempt a bind on the
+    # candidates that are likely to be free
+    error = None
+    usedPorts = _getUsedPorts()
+    requestedPort = _gPort
+    for port in range(requestedPort, min(requestedPort+_gPortRange, _MAX_PORT+1)):
+      if ((port not in usedPorts) or (port == 0)):
+        try:
+          _gSocketFd.bind((address_, port))
+          _gPort = _gSocketFd.getsockname()[1]
+          _lockPort()
+          return
+        except Exception as e:
+          error = e
+      if (port == requestedPort):
+        # only print message on first attemps
+        _printWarning("Could not bind to requested port: {}, looking for first available port".format(requestedPort))
+    if (_gEphemeralPort == True):
+      # let the kernel pick a port, the clients can find it via 'pshell -s'
+      # since it is published in the registry along with the lock file
       try:
-        _gSocketFd.bind((address_, port))
-        _gLockFile = _gFileSystemPath + _gServerName + "-" + _gServerType + "-" + _gHostnameOrIpAddr + "-" + str(port) + _gLockFileExtension
-        _gLockFd = open((_gLockFile), "w+")
-        fcntl.flock(_gLockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _gSocketFd.bind((address_, 0))
+        _gPort = _gSocketFd.getsockname()[1]
+        _printWarning("No port available in range: {}-{}, using ephemeral port: {}".format(requestedPort, requestedPort+_gPortRange-1, _gPort))
+        _lockPort()
         return
-      except Exception as error:
-        if attempt == 1:
-          # only print message on first attemps
-          _printWarning("Could not bind to requested port: {}, looking for first available port".format(_gPort))
-        port = _gPort + attempt
-        _gPort = port
-    _printError("Could not find available port after {} attempts".format(_MAX_BIND_ATTEMPTS))
+      except Exception as e:
+        error = e
+    if (error == None):
+      error = "All ports in range: {}-{} are in use".format(requestedPort, requestedPort+_gPortRange-1)
+    _printError("Could not find available port after {} attempts".format(_gPortRange))
   raise Exception(error)
 
+#################################################################################
+#################################################################################
+def _getUsedPorts():
+  global _gServerType
+  global _gFileSystemPath
+  global _gLockFileExtension
+  # collect all the ports claimed by the other servers of our type from a single
+  # listing of the lock files plus the registry, the lock file name format for IP
+  # servers is name-type-host-port.lock
+  usedPorts = set()
+  try:
+    lockFiles = fnmatch.filter(os.listdir(_gFileSystemPath), "*-"+_gServerType+"-*"+_gLockFileExtension)
+  except:
+    lockFiles = []
+  for file in lockFiles:
+    server = file[:-len(_gLockFileExtension)].split("-")
+    if ((len(server) == 4) and (server[1] == _gServerType) and (server[3].isdigit())):
+      usedPorts.add(int(server[3]))
+  for server in _readRegistry():
+    if ((server["type"] == _gServerType) and (server["port"].isdigit())):
+      usedPorts.add(int(server["port"]))
+  return (usedPorts)
+
+#################################################################################
+#################################################################################
+def _lockPort():
+  global _gServerName
+  global _gServerType
+  global _gHostnameOrIpAddr
+  global _gPort
+  global _gLockFd
+  global _gLockFile
+  global _gLockFileExtension
+  global _gFileSystemPath
+  _gLockFile = _gFileSystemPath + _gServerName + "-" + _gServerType + "-" + _gHostnameOrIpAddr + "-" + str(_gPort) + _gLockFileExtension
+  try:
+    _gLockFd = open((_gLockFile), "w+")
+    fcntl.flock(_gLockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except Exception as error:
+    # we own the port, so this is not fatal, but 'pshell -s' may not show us
+    _printWarning("Could not lock file: {}, error: {}".format(_gLockFile, error))
+
 #################################################################################
 #################################################################################
 def _createSocket():
   global _gServerName
   global _gServerType
+  global _gMulticastGroup
   global _gHostnameOrIpAddr
   global _gPort
   global _gSocketFd
@@ -1109,6 +1336,8 @@ def _createSocket():
         _bindSocket(_gHostnameOrIpAddr)
       else:
         _bindSocket(_gHostnameOrIpAddr)
+      if (_gMulticastGroup != None):
+        _createMulticastSocket()
     elif (_gServerType == TCP):
       # IP domain socket (TCP)
       _gSocketFd = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -1126,6 +1355,7 @@ def _createSocket():
       _gSocketFd = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
       _gUnixSourceAddress = _gFileSystemPath+_gServerName
       _bindSocket(_gUnixSourceAddress)
+    _registerServer()
     return (True)
   except Exception as error:
     _printError("{}".format(error))
@@ -1343,21 +1573,38 @@ def _getDisplayBanner():
 #################################################################################
 def _addTabCompletions():
   global _gCommandList
+  for command in _gCommandList:
+    _addTabCompletion(command["name"])
+
+#################################################################################
+#################################################################################
+def _addTabCompletion(command_):
   global _gServerType
   global _gRunning
   if (((_gServerType == LOCAL) or (_gServerType == TCP)) and (_gRunning  == True)):
-    for command in _gCommandList:
-      PshellReadline.addTabCompletion(command["name"])
+    PshellReadline.addTabCompletion(command_)
 
 #################################################################################
 #################################################################################
 def _receiveDGRAM():
   global _gPshellMsg
   global _gSocketFd
+  global _gMulticastSocketFd
+  global _gMulticastRequest
   global _gPshellMsgPayloadLength
   global _gPshellMsgHeaderFormat
   global _gFromAddr
-  (_gPshellMsg, _gFromAddr) = _gSocketFd.recvfrom(_gPshellMsgPayloadLength)
+  _runSubscriptions()
+  sockets = [_gSocketFd]
+  if (_gMulticastSocketFd != None):
+    sockets.append(_gMulticastSocketFd)
+  inputready, outputready, exceptready = select.select(sockets, [], [], _getSubscriptionTimeout())
+  if (len(inputready) == 0):
+    # nothing received before the next subscription was due
+    return
+  socketFd = inputready[0]
+  _gMulticastRequest = (socketFd == _gMulticastSocketFd)
+  (_gPshellMsg, _gFromAddr) = socketFd.recvfrom(_gPshellMsgPayloadLength)
   _gPshellMsg = _PshellMsg._asdict(_PshellMsg._make(struct.unpack(_gPshellMsgHeaderFormat+str(len(_gPshellMsg)-struct.calcsize(_gPshellMsgHeaderFormat))+"s", _gPshellMsg)))
   _processCommand(_gPshellMsg["payload"])
 
@@ -1380,22 +1627,11 @@ def _receiveTCP():
 #################################################################################
 #################################################################################
 def _processCommand(command_):
-  global _gCommandList
-  global _gMaxLength
-  global _gCommandHelp
-  global _gListHelp
   global _gMsgTypes
   global _gPshellMsg
-  global _gServerType
-  global _gArgs
-  global _gFirstArgPos
-  global _gFoundCommand
-  global _gCommandDispatched
-  global _gPshellClient
-  global _gClientTimeoutOverride
-  global _gPshellClientTimeout
 
   _gPshellMsg["payload"] = ""
+  retCode = _gMsgTypes["commandSuccess"]
   if (_gPshellMsg["msgType"] == _gMsgTypes["queryVersion"]):
     _processQueryVersion()
   elif (_gPshellMsg["msgType"] == _gMsgTypes["queryPayloadSize"]):
@@ -1412,48 +1648,314 @@ def _processCommand(command_):
     _processQueryCommands1()
   elif (_gPshellMsg["msgType"] == _gMsgTypes["queryCommands2"]):
     _processQueryCommands2()
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["queryAll"]):
+    _processQueryAll()
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["queryCatalogVersion"]):
+    _processQueryCatalogVersion()
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["discover"]):
+    _processDiscover()
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["batch"]):
+    _processBatch(command_)
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["conditional"]):
+    retCode = _processConditional(command_)
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["subscribe"]):
+    retCode = _processSubscribe(command_)
+  elif (_gPshellMsg["msgType"] == _gMsgTypes["unsubscribe"]):
+    retCode = _processUnsubscribe(command_)
   else:
-    _gCommandDispatched = True
-    _gClientTimeoutOverride = None
-    if _gPshellClient and "-t" in command_.split()[0]:
-      _gClientTimeoutOverride = command_.split()[0]
-      command_ = ' '.join(command_.split()[1:])
-      if len(command_) == 0:
-        if len(_gClientTimeoutOverride) > 2:
-          _gPshellClientTimeout = int(_gClientTimeoutOverride[2:])
-          printf("PSHELL_INFO: Setting server response timeout to: %d seconds" % _gPshellClientTimeout)
-        else:
-          printf("PSHELL_INFO: Current server response timeout: %d seconds" % _gPshellClientTimeout)
-        return
-    _gArgs = command_.split()[_gFirstArgPos:]
-    command_ = command_.split()[0]
-    numMatches = 0
-    if ((command_ == "?") or (command_ == "help")):
-      _help(_gArgs)
-      _gCommandDispatched = False
+    retCode = _dispatchCommand(command_)
+    if (retCode == None):
       return
-    else:
-      for command in _gCommandList:
-        if (isSubString(command_, command["name"], len(command_))):
-          _gFoundCommand = command
-          numMatches += 1
-    if (numMatches == 0):
-      printf("PSHELL_ERROR: Command: '%s' not found" % command_)
-    elif (numMatches > 1):
-      printf("PSHELL_ERROR: Ambiguous command abbreviation: '%s'" % command_)
-    else:
-      if (isHelp()):
-        if (_gFoundCommand["showUsage"] == True):
-          showUsage()
-        else:
-          _gFoundCommand["function"](_gArgs)
-      elif (not _isValidArgCount()):
+  if (((_gPshellMsg["msgType"] == _gMsgTypes["subscribe"]) or
+       (_gPshellMsg["msgType"] == _gMsgTypes["unsubscribe"])) and
+      (not _gPshellMsg["respNeeded"])):
+    # a lease renewal or an unsubscribe at client exit, nobody is waiting
+    return
+  if ((_gPshellMsg["msgType"] == _gMsgTypes["controlCommand"]) or
+      (_gPshellMsg["msgType"] == _gMsgTypes["conditional"]) or
+      (_gPshellMsg["msgType"] == _gMsgTypes["subscribe"]) or
+      (_gPshellMsg["msgType"] == _gMsgTypes["unsubscribe"])):
+    # a control client gets the command's return code, the same as from the 'C' server
+    _gPshellMsg["msgType"] = retCode
+  else:
+    _gPshellMsg["msgType"] = _gMsgTypes["commandComplete"]
+  _reply()
+
+#################################################################################
+#################################################################################
+def _dispatchCommand(command_):
+  global _gCommandNames
+  global _gCommandIndex
+  global _gMsgTypes
+  global _gArgs
+  global _gFirstArgPos
+  global _gFoundCommand
+  global _gCommandDispatched
+  global _gPshellClient
+  global _gClientTimeoutOverride
+  global _gPshellClientTimeout
+  # returns the command's return code, or None if no reply is to be sent
+  retCode = _gMsgTypes["commandSuccess"]
+  _gCommandDispatched = True
+  _gClientTimeoutOverride = None
+  if _gPshellClient and "-t" in command_.split()[0]:
+    _gClientTimeoutOverride = command_.split()[0]
+    command_ = ' '.join(command_.split()[1:])
+    if len(command_) == 0:
+      if len(_gClientTimeoutOverride) > 2:
+        _gPshellClientTimeout = int(_gClientTimeoutOverride[2:])
+        printf("PSHELL_INFO: Setting server response timeout to: %d seconds" % _gPshellClientTimeout)
+      else:
+        printf("PSHELL_INFO: Current server response timeout: %d seconds" % _gPshellClientTimeout)
+      _gCommandDispatched = False
+      return (None)
+  _gArgs = command_.split()[_gFirstArgPos:]
+  command_ = command_.split()[0]
+  numMatches = 0
+  if ((command_ == "?") or (command_ == "help")):
+    _help(_gArgs)
+    _gCommandDispatched = False
+    return (None)
+  else:
+    # all the names the abbreviation matches sort together starting at the
+    # abbreviation itself, we only need to know if there are zero, one or many
+    index = bisect.bisect_left(_gCommandNames, command_)
+    while ((index < len(_gCommandNames)) and (numMatches < 2) and
+           isSubString(command_, _gCommandNames[index], len(command_))):
+      _gFoundCommand = _gCommandIndex[_gCommandNames[index]]
+      numMatches += 1
+      index += 1
+  if (numMatches == 0):
+    printf("PSHELL_ERROR: Command: '%s' not found" % command_)
+    retCode = _gMsgTypes["commandNotFound"]
+  elif (numMatches > 1):
+    printf("PSHELL_ERROR: Ambiguous command abbreviation: '%s'" % command_)
+    retCode = _gMsgTypes["commandNotFound"]
+  else:
+    if (isHelp()):
+      if (_gFoundCommand["showUsage"] == True):
         showUsage()
       else:
         _gFoundCommand["function"](_gArgs)
+    elif (not _isValidArgCount()):
+      showUsage()
+      retCode = _gMsgTypes["invalidArgCount"]
+    else:
+      startTime = time.time()
+      _gFoundCommand["function"](_gArgs)
+      _checkDuration(_gFoundCommand, time.time()-startTime)
   _gCommandDispatched = False
-  _gPshellMsg["msgType"] = _gMsgTypes["commandComplete"]
-  _reply()
+  return (retCode)
+
+#################################################################################
+#################################################################################
+def _processBatch(batch_):
+  global _gMsgTypes
+  global _gPshellMsg
+  global _gPshellMsgPayloadLength
+  global _gPshellMsgHeaderFormat
+  global _gMaxDatagramSize
+  # the payload is a JSON encoded list of commands, they are dispatched in order
+  # and their outputs and return codes are all sent back in a single reply, the
+  # encoded size of each output is counted, so the reply always fits in one
+  # datagram, we don't run another command once the reply is half full, the
+  # client sends the commands that were not run in another batch
+  try:
+    commands = json.loads(batch_)
+  except:
+    commands = None
+  if (not isinstance(commands, list)):
+    printf("PSHELL_ERROR: Invalid batch request")
+    return
+  maxReplySize = min(_gPshellMsgPayloadLength, _gMaxDatagramSize)-struct.calcsize(_gPshellMsgHeaderFormat)
+  results = []
+  replySize = len("[]")
+  for command in commands:
+    _gPshellMsg["payload"] = ""
+    retCode = None
+    if (len(str(command).split()) > 0):
+      retCode = _dispatchCommand(str(command))
+    if (retCode == None):
+      retCode = _gMsgTypes["commandSuccess"]
+    result = {"retCode":retCode, "results":_gPshellMsg["payload"]}
+    resultSize = len(json.dumps(result))+len(", ")
+    if (replySize+resultSize > maxReplySize):
+      # the output does not fit in what is left of the reply, the client sends
+      # this command again on its own, where its output is not JSON encoded,
+      # so the command is run twice
+      results.append({"retCode":retCode, "results":"", "resend":True})
+      break
+    results.append(result)
+    replySize += resultSize
+    if (replySize > maxReplySize/2):
+      break
+  _gPshellMsg["payload"] = json.dumps(results)
+
+#################################################################################
+#################################################################################
+def _processConditional(request_):
+  global _gMsgTypes
+  global _gPshellMsg
+  # the client sends the digest of the last output it got for the command, the
+  # command is always run, but if its output has not changed we only send back
+  # a notModified reply rather than the whole output again
+  try:
+    request = json.loads(request_)
+    command = str(request["command"])
+    digest = request["digest"]
+  except:
+    printf("PSHELL_ERROR: Invalid conditional request")
+    return (_gMsgTypes["commandNotFound"])
+  retCode = None
+  if (len(command.split()) > 0):
+    retCode = _dispatchCommand(command)
+  if (retCode == None):
+    retCode = _gMsgTypes["commandSuccess"]
+  if ((retCode == _gMsgTypes["commandSuccess"]) and (_getDigest(_gPshellMsg["payload"]) == digest)):
+    _gPshellMsg["payload"] = ""
+    retCode = _gMsgTypes["notModified"]
+  return (retCode)
+
+#################################################################################
+#################################################################################
+def _processSubscribe(request_):
+  global _gMsgTypes
+  global _gPshellMsg
+  global _gFromAddr
+  global _gSubscriptions
+  global _MIN_SUBSCRIPTION_INTERVAL
+  # the client asks for a command to be run every interval msec and its output
+  # pushed to the client's address until it unsubscribes or its lease expires,
+  # all the clients of the same command and interval share one execution
+  try:
+    request = json.loads(request_)
+    command = str(request["command"])
+    interval = max(int(request["interval"]), _MIN_SUBSCRIPTION_INTERVAL)
+    lease = max(int(request["lease"]), 2*interval)
+    changesOnly = bool(request.get("changesOnly", False))
+    renew = bool(request.get("renew", False))
+  except:
+    printf("PSHELL_ERROR: Invalid subscribe request")
+    return (_gMsgTypes["commandNotFound"])
+  key = (command, interval)
+  if (renew and (key in _gSubscriptions) and (_gFromAddr in _gSubscriptions[key]["subscribers"])):
+    # just extend the lease, the command is not run
+    _gSubscriptions[key]["subscribers"][_gFromAddr]["expires"] = time.time()+float(lease)/1000.0
+    return (_gMsgTypes["commandSuccess"])
+  # run the command now, it is validated and its output is the reply
+  retCode = None
+  if (len(command.split()) > 0):
+    retCode = _dispatchCommand(command)
+  if (retCode == None):
+    retCode = _gMsgTypes["commandSuccess"]
+  if (retCode == _gMsgTypes["commandSuccess"]):
+    if (key not in _gSubscriptions):
+      _gSubscriptions[key] = {"command":command,
+                              "interval":interval,
+                              "nextTime":time.time()+float(interval)/1000.0,
+                              "subscribers":{}}
+    _gSubscriptions[key]["subscribers"][_gFromAddr] = {"expires":time.time()+float(lease)/1000.0,
+                                                       "changesOnly":changesOnly,
+                                                       "digest":_getDigest(_gPshellMsg["payload"])}
+  return (retCode)
+
+#################################################################################
+#################################################################################
+def _processUnsubscribe(request_):
+  global _gMsgTypes
+  global _gFromAddr
+  global _gSubscriptions
+  try:
+    request = json.loads(request_)
+    key = (str(request["command"]), max(int(request["interval"]), _MIN_SUBSCRIPTION_INTERVAL))
+  except:
+    printf("PSHELL_ERROR: Invalid unsubscribe request")
+    return (_gMsgTypes["commandNotFound"])
+  if (key in _gSubscriptions):
+    _gSubscriptions[key]["subscribers"].pop(_gFromAddr, None)
+    if (len(_gSubscriptions[key]["subscribers"]) == 0):
+      del _gSubscriptions[key]
+  return (_gMsgTypes["commandSuccess"])
+
+#################################################################################
+#################################################################################
+def _getSubscriptionTimeout():
+  global _gSubscriptions
+  # how long the server can wait for a request before a subscription is due,
+  # None if there are no subscriptions, i.e. wait forever
+  if (len(_gSubscriptions) == 0):
+    return (None)
+  return (max(min([subscription["nextTime"] for subscription in _gSubscriptions.values()])-time.time(), 0))
+
+#################################################################################
+#################################################################################
+def _runSubscriptions():
+  global _gSubscriptions
+  global _gPshellMsg
+  global _gMsgTypes
+  now = time.time()
+  for key in list(_gSubscriptions.keys()):
+    subscription = _gSubscriptions[key]
+    for address in list(subscription["subscribers"].keys()):
+      if (subscription["subscribers"][address]["expires"] < now):
+        del subscription["subscribers"][address]
+    if (len(subscription["subscribers"]) == 0):
+      del _gSubscriptions[key]
+    elif (subscription["nextTime"] <= now):
+      # schedule from now rather than from the missed time so a slow
+      # command does not get run back to back to catch up
+      subscription["nextTime"] = now+float(subscription["interval"])/1000.0
+      _gPshellMsg = OrderedDict([("msgType",_gMsgTypes["subscriptionData"]),
+                                 ("respNeeded",False),
+                                 ("dataNeeded",True),
+                                 ("pad",0),
+                                 ("seqNum",0),
+                                 ("payload","")])
+      retCode = _dispatchCommand(subscription["command"])
+      if (retCode == None):
+        retCode = _gMsgTypes["commandSuccess"]
+      _publishSubscription(subscription, retCode, _gPshellMsg["payload"])
+
+#################################################################################
+#################################################################################
+def _publishSubscription(subscription_, retCode_, results_):
+  global _gSocketFd
+  global _gMsgTypes
+  global _gPshellMsgHeaderFormat
+  digest = _getDigest(results_)
+  payload = json.dumps({"command":subscription_["command"],
+                        "interval":subscription_["interval"],
+                        "retCode":retCode_,
+                        "results":results_})
+  message = struct.pack(_gPshellMsgHeaderFormat+str(len(payload))+"s",
+                        _gMsgTypes["subscriptionData"], False, True, 0, 0, payload)
+  for address in list(subscription_["subscribers"].keys()):
+    subscriber = subscription_["subscribers"][address]
+    if (subscriber["changesOnly"] and (subscriber["digest"] == digest)):
+      continue
+    subscriber["digest"] = digest
+    try:
+      _gSocketFd.sendto(message, address)
+    except:
+      # the client has gone away without unsubscribing
+      del subscription_["subscribers"][address]
+
+#################################################################################
+#################################################################################
+def _getDigest(payload_):
+  if (not isinstance(payload_, bytes)):
+    payload_ = payload_.encode()
+  return (hashlib.sha1(payload_).hexdigest())
+
+#################################################################################
+#################################################################################
+def _checkDuration(command_, duration_):
+  # the clients base their response timeout on the advertised duration, so a
+  # command that overruns it is likely to have timed out at the client
+  if ((command_["expectedDuration"] != None) and (duration_*1000 > command_["expectedDuration"])):
+    command_["overruns"] += 1
+    _printWarning("Command: '%s' took %d msec, expected duration: %d msec, overruns: %d" %
+                  (command_["name"], int(duration_*1000), command_["expectedDuration"], command_["overruns"]))
 
 #################################################################################
 #################################################################################
@@ -1517,6 +2019,66 @@ def _processQueryCommands2():
   for command in _gCommandList:
     printf("%s%s" % (command["name"], "/"), newline=False)
 
+#################################################################################
+#################################################################################
+def _processQueryAll():
+  global _gServerName
+  global _gTitle
+  global _gBanner
+  global _gPrompt
+  global _gServerVersion
+  global _gPshellMsgPayloadLength
+  global _gCommandList
+  # everything the pshell client needs to present a remote server, all in a
+  # single JSON encoded reply rather than one query per item
+  commands = _getCatalog()
+  printf(json.dumps({"name":_gServerName,
+                     "title":_gTitle,
+                     "banner":_gBanner,
+                     "prompt":_gPrompt,
+                     "version":_gServerVersion,
+                     "payloadSize":_gPshellMsgPayloadLength,
+                     "catalogVersion":_getCatalogVersion(commands),
+                     "commands":commands}), newline=False)
+
+#################################################################################
+#################################################################################
+def _processQueryCatalogVersion():
+  printf(_getCatalogVersion(_getCatalog()), newline=False)
+
+#################################################################################
+#################################################################################
+def _processDiscover():
+  global _gServerName
+  global _gTitle
+  global _gServerVersion
+  # the client gets our host and port from the address we reply from
+  printf(json.dumps({"name":_gServerName,
+                     "title":_gTitle,
+                     "version":_gServerVersion}), newline=False)
+
+#################################################################################
+#################################################################################
+def _getCatalog():
+  global _gCommandList
+  commands = []
+  for command in _gCommandList:
+    commands.append({"name":command["name"],
+                     "description":command["description"],
+                     "usage":command["usage"],
+                     "minArgs":command["minArgs"],
+                     "maxArgs":command["maxArgs"],
+                     "showUsage":command["showUsage"],
+                     "expectedDuration":command["expectedDuration"]})
+  return (commands)
+
+#################################################################################
+#################################################################################
+def _getCatalogVersion(commands_):
+  # the version is a digest of the catalog contents, so a client can tell if
+  # its cached copy is still current without fetching the whole catalog
+  return (hashlib.sha1(json.dumps(commands_, sort_keys=True).encode()).hexdigest())
+
 #################################################################################
 #################################################################################
 def _batch(command_):
@@ -1713,9 +2275,13 @@ def _reply():
   global _gPshellMsg
   global _gServerType
   global _gPshellMsgHeaderFormat
+  global _gMulticastRequest
   # only issue a reply for a 'datagram' oriented remote server, TCP
   # uses a character stream and is not message based and LOCAL uses
   # no client app
+  if (_gMulticastRequest and not _gPshellMsg["respNeeded"]):
+    # every server in the group would answer a fire-and-forget group command
+    return
   if ((_gServerType == UDP) or (_gServerType == UNIX)):
     try:
       _gSocketFd.sendto(struct.pack(_gPshellMsgHeaderFormat+str(len(_gPshellMsg["payload"]))+"s", *_gPshellMsg.values()), _gFromAddr)
@@ -1728,21 +2294,199 @@ def _cleanupResources():
   global _gUnixSourceAddress
   global _gLockFile
   global _gSocketFd
-  if (_gUnixSourceAddress != None):
+  global _gMulticastSocketFd
+  if ((_gUnixSourceAddress != None) and (not _isAbstractServer())):
     try:
       os.unlink(_gUnixSourceAddress)
     except:
       None
-  try:
-    os.unlink(_gLockFile)
-  except:
-    None
-  _cleanupFileSystemResources()
+  if (_gLockFile != None):
+    try:
+      os.unlink(_gLockFile)
+    except:
+      None
+  _unregisterServer()
+  if (not _isAbstractServer()):
+    _cleanupFileSystemResources()
   if (_gSocketFd != None):
     try:
       _gSocketFd.close()
     except:
       None
+  if (_gMulticastSocketFd != None):
+    try:
+      _gMulticastSocketFd.close()
+    except:
+      None
+
+#################################################################################
+#################################################################################
+def _setPortRange(numPorts_, ephemeralFallback_):
+  global _gPortRange
+  global _gEphemeralPort
+  _gPortRange = max(numPorts_, 1)
+  _gEphemeralPort = ephemeralFallback_
+
+#################################################################################
+#################################################################################
+def _setAbstractNamespace(enable_):
+  global _gAbstractNamespace
+  _gAbstractNamespace = enable_
+
+#################################################################################
+#################################################################################
+def _joinMulticastGroup(groupAddress_, port_, interface_):
+  global _gMulticastGroup
+  global _gMulticastPort
+  global _gMulticastInterface
+  _gMulticastGroup = groupAddress_
+  _gMulticastPort = int(port_)
+  _gMulticastInterface = interface_
+
+#################################################################################
+#################################################################################
+def _createMulticastSocket():
+  global _gServerName
+  global _gMulticastGroup
+  global _gMulticastPort
+  global _gMulticastInterface
+  global _gMulticastSocketFd
+  if (_gMulticastInterface == ANYHOST):
+    interface = "0.0.0.0"
+  elif (_gMulticastInterface == LOCALHOST):
+    interface = "127.0.0.1"
+  else:
+    interface = socket.gethostbyname(_gMulticastInterface)
+  _gMulticastSocketFd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  # every server on this host that joins the group binds the same port
+  _gMulticastSocketFd.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  _gMulticastSocketFd.bind(("", _gMulticastPort))
+  _gMulticastSocketFd.setsockopt(socket.IPPROTO_IP,
+                                 socket.IP_ADD_MEMBERSHIP,
+                                 struct.pack("4s4s", socket.inet_aton(_gMulticastGroup), socket.inet_aton(interface)))
+  _printInfo("UDP Server: %s Joined Multicast Group: %s, Port: %d" % (_gServerName, _gMulticastGroup, _gMulticastPort))
+
+#################################################################################
+#################################################################################
+def _isAbstractServer():
+  global _gServerType
+  global _gAbstractNamespace
+  return ((_gServerType == UNIX) and (_gAbstractNamespace == True))
+
+#################################################################################
+#################################################################################
+def _registerServer():
+  global _gServerName
+  global _gServerType
+  global _gHostnameOrIpAddr
+  global _gPort
+  global _gPshellClient
+  if (_gServerType == UNIX):
+    entry = [_gServerName, _gServerType, "N/A", "N/A"]
+  else:
+    entry = [_gServerName, _gServerType, _gHostnameOrIpAddr, str(_gPort)]
+  # a pshell client that is also a server, i.e. the pshellAggregator, says so
+  # in its entry so it is not aggregated as a plain server
+  if (_gPshellClient == True):
+    _updateRegistry(entry, "client")
+  else:
+    _updateRegistry(entry)
+
+#################################################################################
+#################################################################################
+def _unregisterServer():
+  global _gRegistered
+  if (_gRegistered == True):
+    _updateRegistry(None)
+
+#################################################################################
+#################################################################################
+def _updateRegistry(entry_, role_ = None):
+  global _gRegistryFile
+  global _gRegistered
+  _createFileSystemPath()
+  try:
+    fd = os.open(_gRegistryFile, os.O_RDWR | os.O_CREAT, 0o666)
+  except Exception as error:
+    _printWarning("Could not open registry: {}, error: {}".format(_gRegistryFile, error))
+    return
+  try:
+    # the registry is shared by all servers on the host, so we hold an exclusive
+    # lock for the whole read/modify/write, entries belonging to this process or
+    # to a process that no longer exists are dropped before adding our own
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    pid = os.getpid()
+    servers = [server for server in _parseRegistry(fd) if (server["pid"] != pid)]
+    lines = [":".join([server["name"], server["type"], server["host"], server["port"], str(server["pid"])] +
+                      ([server["role"]] if (server["role"] != None) else [])) for server in servers]
+    if (entry_ != None):
+      lines.append(":".join(entry_ + [str(pid)] + ([role_] if (role_ != None) else [])))
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.ftruncate(fd, 0)
+    if (len(lines) > 0):
+      os.write(fd, ("\n".join(lines)+"\n").encode())
+    _gRegistered = (entry_ != None)
+  except Exception as error:
+    _printWarning("Could not update registry: {}, error: {}".format(_gRegistryFile, error))
+  finally:
+    os.close(fd)
+
+#################################################################################
+#################################################################################
+def _readRegistry():
+  global _gRegistryFile
+  try:
+    fd = os.open(_gRegistryFile, os.O_RDONLY)
+  except:
+    return ([])
+  try:
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return (_parseRegistry(fd))
+  except:
+    return ([])
+  finally:
+    os.close(fd)
+
+#################################################################################
+#################################################################################
+def _parseRegistry(fd_):
+  # read the whole registry in one operation, each entry is of the format
+  # name:type:host:port:pid[:role], only entries whose process is still alive
+  # are returned
+  os.lseek(fd_, 0, os.SEEK_SET)
+  contents = b""
+  while (True):
+    data = os.read(fd_, 65536)
+    if (len(data) == 0):
+      break
+    contents += data
+  if (not isinstance(contents, str)):
+    contents = contents.decode()
+  servers = []
+  for line in contents.splitlines():
+    role = None
+    (head, separator, tail) = line.rpartition(":")
+    if ((len(separator) > 0) and (not tail.isdigit())):
+      (line, role) = (head, tail)
+    entry = line.rsplit(":", 4)
+    if ((len(entry) == 5) and entry[4].isdigit() and _isProcessAlive(int(entry[4]))):
+      servers.append({"name":entry[0],
+                      "type":entry[1],
+                      "host":entry[2],
+                      "port":entry[3],
+                      "pid":int(entry[4]),
+                      "role":role})
+  return (servers)
+
+#################################################################################
+#################################################################################
+def _isProcessAlive(pid_):
+  try:
+    os.kill(pid_, 0)
+    return (True)
+  except OSError as error:
+    # EPERM means the process exists but belongs to someone else
+    return (error.errno == errno.EPERM)
 
 #################################################################################
 #################################################################################
@@ -1755,6 +2499,7 @@ def _loadConfigFile():
   global _gTitle
   global _gBanner
   global _gTcpTimeout
+  global _gAbstractNamespace
   configFile1 = ""
   configPath = os.getenv('PSHELL_CONFIG_DIR')
   if (configPath != None):
@@ -1796,6 +2541,12 @@ def _loadConfigFile():
               _gServerType = value[1].lower()
           elif ((option[1].lower() == "timeout") and (value[1].isdigit())):
             _gTcpTimeout = int(value[1])
+          elif (option[1].lower() == "abstract"):
+            _gAbstractNamespace = _getBool(value[1])
+          elif (option[1].lower() == "multicast"):
+            group = value[1].split(":")
+            if ((len(group) in (2, 3)) and group[1].isdigit()):
+              _joinMulticastGroup(group[0], group[1], (group[2] if (len(group) == 3) else ANYHOST))
   file.close()
   return
 
@@ -1876,6 +2627,10 @@ def _flush():
   global _gMsgTypes
   if ((_gCommandInteractive == True) and
       (_gPshellMsg["msgType"] != _gMsgTypes["controlCommand"]) and
+      (_gPshellMsg["msgType"] != _gMsgTypes["batch"]) and
+      (_gPshellMsg["msgType"] != _gMsgTypes["conditional"]) and
+      (_gPshellMsg["msgType"] != _gMsgTypes["subscribe"]) and
+      (_gPshellMsg["msgType"] != _gMsgTypes["subscriptionData"]) and
       ((_gServerType == UDP) or (_gServerType == UNIX))):
     _reply()
     _gPshellMsg["payload"] = ""
@@ -1927,9 +2682,11 @@ def _printLog(message_):
 _gCommandHelp = ('?', '-h', '--h', '-help', '--help')
 _gListHelp = ('?', 'help')
 _gCommandList = []
+_gCommandNames = []
+_gCommandIndex = {}
 _gMaxLength = 0
 
-_gServerVersion = "1"
+_gServerVersion = "2"
 _gServerName = None
 _gServerType = None
 _gServerMode = None
@@ -1949,6 +2706,22 @@ _gLockFile = None
 _gLockFileExtension = ".lock"
 _gUnixLockFileId = "unix"+_gLockFileExtension
 _gLockFd = None
+# when set, UNIX servers are bound in the Linux abstract namespace
+_gAbstractNamespace = False
+# single file listing all the running servers on the host, one entry per
+# line of the format name:type:host:port:pid
+_gRegistryFile = _gFileSystemPath+"pshell.registry"
+_gRegistered = False
+# optional IP multicast group a UDP server also receives commands on
+_gMulticastGroup = None
+_gMulticastPort = None
+_gMulticastInterface = ANYHOST
+_gMulticastSocketFd = None
+_gMulticastRequest = False
+# active subscriptions keyed by (command, interval), each with its subscribers
+# keyed by their address
+_gSubscriptions = {}
+_MIN_SUBSCRIPTION_INTERVAL = 100
 _gRunning = False
 _gCommandDispatched = False
 _gCommandInteractive = True
@@ -1978,7 +2751,16 @@ _gMsgTypes = {"commandSuccess": 0,
               "queryBanner":9,
               "queryTitle":10,
               "queryPrompt":11,
-              "controlCommand":12}
+              "controlCommand":12,
+              "queryAll":13,
+              "queryCatalogVersion":14,
+              "discover":15,
+              "batch":16,
+              "conditional":17,
+              "notModified":18,
+              "subscribe":19,
+              "unsubscribe":20,
+              "subscriptionData":21}
 
 # fields of PshellMsg, we use this definition to unpack the received PshellMsg
 # response from the server into a corresponding OrderedDict in the PshellControl
@@ -1989,6 +2771,8 @@ _PshellMsg = namedtuple('PshellMsg', 'msgType respNeeded dataNeeded pad seqNum p
 # packing/unpacking the PshellMessage to/from an OrderedDict into a packed binary
 # structure that can be transmitted over-the-wire via a socket
 _gPshellMsgHeaderFormat = "4BI"
+# the largest payload of a UDP datagram
+_gMaxDatagramSize = 65507
 
 # default PshellMsg payload length, used to receive responses
 _gPshellMsgPayloadLength = 1024*64
@@ -2028,6 +2812,13 @@ _gLogLevel = LOG_LEVEL_DEFAULT
 _gLogFunction = None
 
 _MAX_BIND_ATTEMPTS = 1000
+_MAX_PORT = 65535
+
+# number of ports, starting at the requested port, that are tried when binding a
+# UDP/TCP server, and whether to fall back to a kernel assigned ephemeral port
+# when all of them are taken
+_gPortRange = _MAX_BIND_ATTEMPTS
+_gEphemeralPort = False
 
 ##############################
 #
@@ -113,7 +113,7 @@ def setLogFunction(function):
 
 #################################################################################
 #################################################################################
-def addCommand(function, command, description, usage = None, minArgs = 0, maxArgs = 0, showUsage = True):
+def addCommand(function, command, description, usage = None, minArgs = 0, maxArgs = 0, showUsage = True, expectedDuration = None):
   """
   Stub function, set PshellServer.py softlink to PshellServer-full.py for full functionality
   """
@@ -146,6 +146,30 @@ def runCommand(command):
   """
   None
 
+#################################################################################
+#################################################################################
+def setPortRange(numPorts, ephemeralFallback = False):
+  """
+  Stub function, set PshellServer.py softlink to PshellServer-full.py for full functionality
+  """
+  None
+
+#################################################################################
+#################################################################################
+def setAbstractNamespace(enable):
+  """
+  Stub function, set PshellServer.py softlink to PshellServer-full.py for full functionality
+  """
+  None
+
+#################################################################################
+#################################################################################
+def joinMulticastGroup(groupAddress, port, interface = ANYHOST):
+  """
+  Stub function, set PshellServer.py softlink to PshellServer-full.py for full functionality
+  """
+  None
+
 #################################################################################
 #################################################################################
 def printf(message = "", newline = True):
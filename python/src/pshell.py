@@ -97,8 +97,6 @@ Usage: pshell -s | -n | {{{<hostName | ipAddr>} {<portNum> | <udpServerName>}} |
 
 # import all our necessary module
 import os
-import fnmatch
-import fcntl
 import sys
 import signal
 import time
@@ -109,9 +107,6 @@ import PshellReadline
 _gSid = None
 _gHelp = ('?', '-h', '--h', '-help', '--help', 'help')
 
-_gFileSystemPath = "/tmp/.pshell/"
-_gLockFileExtension = ".lock"
-_gUnixLockFileId = "unix"+_gLockFileExtension
 _gActiveServers = []
 
 #################################################################################
@@ -170,6 +165,34 @@ def _showHelp():
   print("")
 
 #################################################################################
+#################################################################################
+def _sendBatchFile(file_):
+  global _gSid
+  global _gHelp
+  # the same local help and catalog validation as _comandDispatcher, but every
+  # command that needs to go to the server is sent in a single batch request,
+  # the outputs are then displayed in the order of the batch file
+  outputs = []
+  commands = []
+  for line in file_:
+    # skip comments
+    line = line.strip()
+    if ((len(line) > 0) and (line[0] != "#")):
+      if line.split()[0] in _gHelp:
+        outputs.append(PshellControl.extractCommands(_gSid, includeName=False))
+      else:
+        (retCode, command, results) = PshellControl.validateCommand(_gSid, line)
+        if len(results) > 0:
+          outputs.append(results)
+        else:
+          outputs.append(None)
+          commands.append(command)
+  replies = PshellControl.sendBatch(_gSid, commands)
+  for output in outputs:
+    if output == None:
+      (output, retCode) = replies.pop(0)
+    sys.stdout.write(output)
+
 #################################################################################
 def _processCommand(command_):
   global _gSid
@@ -186,13 +209,33 @@ def _comandDispatcher(args_):
   global _gInteractive
   global _gTimeout
   results = None
-  timeout = PshellServer._gPshellClientTimeout
+  command = ' '.join(args_)
+  # an explicit per-command -t<timeout> always wins, otherwise use the duration
+  # the server advertises for the command, falling back to the global timeout
+  timeout = PshellControl.ONE_SEC*PshellServer._gPshellClientTimeout
   if PshellServer._gClientTimeoutOverride:
     if len(PshellServer._gClientTimeoutOverride) > 2:
-      timeout = int(PshellServer._gClientTimeoutOverride[2:])
-  command = ' '.join(args_)
+      timeout = PshellControl.ONE_SEC*int(PshellServer._gClientTimeoutOverride[2:])
+  else:
+    timeout = PshellControl.getCommandTimeout(_gSid, command, timeout)
+  if _gInteractive == True:
+    # our local server has already resolved any abbreviation and validated
+    # the arg count against the remote command catalog, send the full name
+    if PshellServer._gFoundCommand != None:
+      args_[0] = PshellServer._gFoundCommand["name"]
+      command = ' '.join(args_)
+  elif args_[0] not in _gHelp:
+    # command line or batch mode, resolve the command against the cached
+    # remote catalog, anything it rejects is never sent to the server
+    (retCode, command, results) = PshellControl.validateCommand(_gSid, command)
+    if len(results) == 0:
+      results = None
+      args_ = command.split()
   if args_[0] in _gHelp:
     results = PshellControl.extractCommands(_gSid, includeName=False)
+  elif results != None:
+    # the usage or error was generated locally from the catalog, nothing to send
+    None
   elif timeout == 0:
     # if they asked for command help, go ahead and dispatch the command and
     # extract the results, otherwise, just send command with no extraction
@@ -211,6 +254,32 @@ def _comandDispatcher(args_):
       # command line mode
       sys.stdout.write(results)
 
+#################################################################################
+#################################################################################
+def _subscribeCommand(args_):
+  global _gSid
+  global _gHelp
+  global _gRate
+  global _gClear
+  # rather than polling the server every rate seconds, have it push the
+  # output to us, returns False if the command must be polled instead
+  if ((args_[0] in _gHelp) or ("-t" in args_[0])):
+    return (False)
+  (retCode, command, results) = PshellControl.validateCommand(_gSid, ' '.join(args_))
+  if len(results) > 0:
+    return (False)
+  (results, retCode) = PshellControl.subscribe(_gSid, command, PshellControl.ONE_SEC*_gRate)
+  if retCode != PshellControl.COMMAND_SUCCESS:
+    return (False)
+  data = [{"results":results}]
+  while (True):
+    for output in data:
+      if (_gClear != False):
+        sys.stdout.write(_gClear)
+      sys.stdout.write(output["results"])
+    sys.stdout.flush()
+    data = PshellControl.getSubscriptionData(_gSid, PshellControl.ONE_MINUTE)
+
 #################################################################################
 #################################################################################
 def _getIpAddress():
@@ -238,6 +307,8 @@ def _processCommandLine():
   command = _gCommand.split()
   if _gRate > 0 and _gRepeat == 0:
     sys.stdout.write("\033]0;%s: %s[%s], Mode: COMMAND LINE[%s], Rate: %d SEC\007" % (_gTitle, _gServerName, _getIpAddress(), _gCommand, _gRate))
+    if ((_gTimeout > 0) and _subscribeCommand(command)):
+      return
   while (True):
     if (_gRepeat > 0):
       _gIteration += 1
@@ -307,12 +378,16 @@ def _processBatchFile():
                        _gRate,
                        _gIteration,
                        _gRepeat))
-    for line in file:
-      # skip comments
-      line = line.strip()
-      if ((len(line) > 0) and (line[0] != "#")):
-        command = line.split()
-        _comandDispatcher(command)
+    if ((_gRate == 0) and (_gClear == False) and (_gTimeout > 0)):
+      # nothing to pace or redraw between the commands, send them all in one request
+      _sendBatchFile(file)
+    else:
+      for line in file:
+        # skip comments
+        line = line.strip()
+        if ((len(line) > 0) and (line[0] != "#")):
+          command = line.split()
+          _comandDispatcher(command)
     if _gRepeat > 0 and _gIteration == _gRepeat:
       break
     elif (_gRate > 0):
@@ -325,13 +400,14 @@ def _processBatchFile():
 #################################################################################
 def _configureLocalServer():
   global _gSid
+  global _gServerInfo
   global _gRemoteServer
   global _gTimeout
   global _gPort
 
   # need to set the first arg position to 0 so we can pass
   # through the exact command to our remote server for dispatching
-  PshellServer._gFirstArgPos = 0
+  PshellServer._setFirstArgPos(0)
   # we tell the local server we are the special UDP/UNIX command
   # line client so it can process commands correctly and display
   # the correct banner  information
@@ -344,21 +420,34 @@ def _configureLocalServer():
   PshellControl._gSupressInvalidArgCountMessage = True
   # extract information from our remote server via the special
   # "private" control API so we can feed the info to our local
-  # pshell server to make it look like a remote server
+  # pshell server to make it look like a remote server, a newer
+  # server gives us everything in the single queryAll reply
 
-  prompt = PshellControl._extractPrompt(_gSid)
+  if (_gServerInfo != None):
+    prompt = _gServerInfo["prompt"]
+  else:
+    prompt = PshellControl._extractPrompt(_gSid)
   if (len(prompt) > 0):
     PshellServer._gPromptOverride = prompt
 
-  title = PshellControl._extractTitle(_gSid)
+  if (_gServerInfo != None):
+    title = _gServerInfo["title"]
+  else:
+    title = PshellControl._extractTitle(_gSid)
   if (len(title) > 0):
     PshellServer._gTitleOverride = title
 
-  serverName = PshellControl._extractName(_gSid)
+  if (_gServerInfo != None):
+    serverName = _gServerInfo["name"]
+  else:
+    serverName = PshellControl._extractName(_gSid)
   if (len(serverName) > 0):
     PshellServer._gServerNameOverride = serverName
 
-  banner = PshellControl._extractBanner(_gSid)
+  if (_gServerInfo != None):
+    banner = _gServerInfo["banner"]
+  else:
+    banner = PshellControl._extractBanner(_gSid)
   if (len(banner) > 0):
     PshellServer._gBannerOverride = banner
 
@@ -445,47 +534,22 @@ def _loadServers():
 #####################################################
 #####################################################
 def _cleanupFileSystemResources():
-  global _gFileSystemPath
-  global _gLockFileExtension
+  global _gActiveServers
+  # the lookup also removes any stale socket and lock files
+  for server in PshellServer._getActiveServers():
+    _addActiveServer(server["name"], server["type"], server["host"], server["port"])
+  _gActiveServers.sort(key=lambda server: (server["name"], server["type"], server["host"], server["port"]))
+
+#####################################################
+#####################################################
+def _addActiveServer(name, type, host, port):
   global _gActiveServers
   global _gMaxHostnameLength
   global _gMaxActiveServerLength
-  global _gUnixLockFileId
-  if not os.path.isdir(_gFileSystemPath):
-    os.system("mkdir %s" % _gFileSystemPath)
-    os.system("chmod 777 %s" % _gFileSystemPath)
-  lockFiles = fnmatch.filter(os.listdir(_gFileSystemPath), "*"+_gLockFileExtension)
-  lockFiles.sort()
-  for file in lockFiles:
-    try:
-      fd = open(_gFileSystemPath+file, "r")
-      try:
-        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        # we got the lock, delete any socket file and lock file and don't print anything
-        try:
-          # unix temp socket file
-          if _gUnixLockFileId in file:
-            os.unlink(_gFileSystemPath+file.split("-")[0])
-        except:
-          None
-        try:
-          # lockfile
-          os.unlink(_gFileSystemPath+file)
-        except:
-          None
-      except:
-        # file handle is in use and locked by another process, print it
-        if "-control" not in file:
-          server = file.split(".")[0]
-          server = server.split("-")
-          _gMaxActiveServerLength = max(len(server[0]), _gMaxActiveServerLength)
-          if len(server) == 2:
-            _gActiveServers.append({"name":server[0], "type":server[1], "host":"N/A", "port":"N/A"})
-          elif len(server) == 4:
-            _gActiveServers.append({"name":server[0], "type":server[1], "host":server[2], "port":server[3]})
-            _gMaxHostnameLength = max(len(server[2]), _gMaxHostnameLength)
-    except:
-      None
+  _gMaxActiveServerLength = max(len(name), _gMaxActiveServerLength)
+  _gActiveServers.append({"name":name, "type":type, "host":host, "port":port})
+  if host != "N/A":
+    _gMaxHostnameLength = max(len(host), _gMaxHostnameLength)
 
 #####################################################
 #####################################################
@@ -576,6 +640,36 @@ def _showActiveServers():
     print("")
   exit(0)
 
+#####################################################
+#####################################################
+def _showDiscoveredServers(args_):
+  global _gTimeout
+  if ((len(args_) < 2) or (len(args_) > 3) or
+      (not args_[1].isdigit()) or
+      ((len(args_) == 3) and (not args_[2].isdigit()))):
+    _showUsage()
+  numPorts = 1
+  if (len(args_) == 3):
+    numPorts = int(args_[2])
+  servers = PshellControl.discoverServers(args_[0], int(args_[1]), PshellControl.ONE_SEC, numPorts)
+  maxNameLength = max([len("Server Name")] + [len(str(server["name"])) for server in servers])
+  maxHostLength = max([len("Host")] + [len(server["host"]) for server in servers])
+  print("")
+  print("*******************************************")
+  print("*   Discovered PSHELL Servers On Subnet   *")
+  print("*******************************************")
+  print("")
+  if len(servers) > 0:
+    print("Index   %s   %s   Port    Version" % ("Server Name".ljust(maxNameLength), "Host".ljust(maxHostLength)))
+    print("=====   %s   %s   =====   =======" % ("="*maxNameLength, "="*maxHostLength))
+  for index, server in enumerate(servers):
+    print("%-5d   %s   %s   %-5d   %s" % (index+1, str(server["name"]).ljust(maxNameLength), server["host"].ljust(maxHostLength), server["port"], server["version"]))
+  if len(servers) > 0:
+    print("")
+    print("Connect to UDP server with: pshell <host> <port>")
+  print("")
+  exit(0)
+
 #####################################################
 #####################################################
 def _showNamedServers():
@@ -599,10 +693,12 @@ def _showUsage():
   print("")
   print("Usage: %s -s | -n | {{{<hostName> | <ipAddr>} {<portNum> | <udpServerName>}} | <unixServerName> | <serverIndex>} [-t<timeout>]" % os.path.basename(sys.argv[0]))
   print("                           [{{-c <command> | -f <filename>} [rate=<seconds>] [repeat=<count>] [clear]}]")
+  print("       %s -d <bcastAddr> <portNum> [<numPorts>]" % os.path.basename(sys.argv[0]))
   print("")
   print("  where:")
   print("    -s              - show all servers running on the local host")
   print("    -n              - show named IP server/port mappings in pshell-client.conf file")
+  print("    -d              - discover all UDP servers that answer a broadcast query on a subnet")
   print("    -c              - run command from command line")
   print("    -f              - run commands from a batch file")
   print("    -t              - change the default server response timeout")
@@ -612,6 +708,8 @@ def _showUsage():
   print("    udpServerName   - name of UDP server from pshell-client.conf file")
   print("    unixServerName  - name of UNIX server (use '-s' option to list servers)")
   print("    serverIndex     - index of local UNIX or UDP server (use '-s' option to list servers)")
+  print("    bcastAddr       - subnet broadcast address to query, e.g. 192.168.1.255")
+  print("    numPorts        - number of consecutive ports to query starting at portNum (default=1)")
   print("    timeout         - response wait timeout in sec (default=5)")
   print("    command         - optional command to execute (in double quotes, ex. -c \"myCommand arg1 arg2\")")
   print("    fileName        - optional batch file to execute")
@@ -712,6 +810,8 @@ if (__name__ == '__main__'):
     _showNamedServers()
   elif sys.argv[1] == "-s":
     _showActiveServers()
+  elif sys.argv[1] == "-d":
+    _showDiscoveredServers(sys.argv[2:])
   elif not _getActiveServer(sys.argv[1]):
     _gRemoteServer = sys.argv[1]
 
@@ -770,8 +870,19 @@ if (__name__ == '__main__'):
 
   # connect to our remote server via the control client
   _gSid = PshellControl.connectServer("pshellClient", _gRemoteServer, _gPort, PshellControl.ONE_SEC*_gTimeout)
-  _gServerName = PshellControl._extractName(_gSid)
-  _gTitle = PshellControl._extractTitle(_gSid)
+
+  # get all the server information in one round trip, fall back to the
+  # individual queries for an older server that does not support it, a
+  # broadcast address will never give us a reply so don't even try
+  _gServerInfo = None
+  if (_gIsBroadcastAddr == False):
+    _gServerInfo = PshellControl._extractAll(_gSid)
+  if (_gServerInfo != None):
+    _gServerName = _gServerInfo["name"]
+    _gTitle = _gServerInfo["title"]
+  else:
+    _gServerName = PshellControl._extractName(_gSid)
+    _gTitle = PshellControl._extractTitle(_gSid)
 
   if (_gCommand != None):
     # command line mode, execute command
@@ -786,23 +897,38 @@ if (__name__ == '__main__'):
 
     if (_gIsBroadcastAddr == False):
 
+      # configure our local server to interact with a remote server, we override the display settings
+      # (i.e. prompt, server name, banner, title etc), to make it appear that our local server is really
+      # a remote server
+
+      _configureLocalServer()
+
       # if not a broadcast server address, extract all the commands from
       # our unicast remote server and add them to our local server
-      commandList = PshellControl.extractCommands(_gSid)
-      if (len(commandList) > 0):
-        commandList = commandList.split("\n")
+      if (_gServerInfo != None):
+        # register the remote commands with their real usage and arg counts so our local server
+        # can resolve abbreviations, validate the args and show the usage without a round trip,
+        # the command name itself is counted as an arg since our first arg position is 0
+        commandList = _gServerInfo["commands"]
         for command in commandList:
+          PshellServer.addCommand(_comandDispatcher,
+                                  command["name"],
+                                  command["description"],
+                                  command["usage"],
+                                  command["minArgs"]+1,
+                                  command["maxArgs"]+1,
+                                  command["showUsage"])
+      else:
+        # older server, we only know the names and descriptions, pass everything through
+        commandList = []
+        for command in PshellControl.extractCommands(_gSid).split("\n"):
           splitCommand = command.split("-")
           if (len(splitCommand ) >= 2):
-            commandName = splitCommand[0].strip()
-            description = splitCommand[1].strip()
-            PshellServer.addCommand(_comandDispatcher, commandName, description, "[<arg1> ... <arg20>]", 0, 20)
-
-        # configure our local server to interact with a remote server, we override the display settings
-        # (i.e. prompt, server name, banner, title etc), to make it appear that our local server is really
-        # a remote server
+            commandList.append({"name":splitCommand[0].strip(), "description":splitCommand[1].strip()})
+        for command in commandList:
+          PshellServer.addCommand(_comandDispatcher, command["name"], command["description"], "[<arg1> ... <arg20>]", 0, 21, False)
 
-        _configureLocalServer()
+      if (len(commandList) > 0):
 
         # now start our local server which will interact with a remote server via the pshell control machanism
         PshellServer.startServer("pshellServer", PshellServer.LOCAL, PshellServer.BLOCKING)
@@ -41,11 +41,50 @@ servers.  The consolidation point a local pshell server.
 This is a generic dynamic aggregator, i.e. it is server agnostic.  Servers can
 be added to the aggregation via the 'add server' command either at startup via
 the pshellAggregator.startup file or interactively via the interactive command
-line.
+line.  All the UDP servers on a subnet can be added in one step with the 'add
+subnet' command, which discovers them with a single broadcast query.  All the
+UDP and UNIX servers running on the local host can be added with the 'add
+discovered' command, after which servers that start or exit on the local host
+are added or removed automatically.  A large set of servers can be added from a
+server list file with the 'add file' command, which connects to all of them
+together and reports the servers that did not reply.
+
+Servers and multicast groups can be taken out of the aggregation again with the
+'remove' command.
+
+The commands of a server can also be imported with the 'import' command, each
+command of the server's catalog is then registered locally as
+<localName>.<command>, so tab completion, abbreviations and the usage and arg
+count checks are all done locally and only valid commands are sent to the
+server.
+
+With the 'lazy' command servers are only connected when they are first used,
+and are disconnected again once they have been idle for a while, they are
+reconnected the next time they are used, so an aggregator of thousands of
+mostly idle servers only holds sockets for the servers that are in use.
+
+The 'show health' command lists the reachability, response times and errors of
+every aggregated server, measured from the commands that are sent to them, the
+'ping' command adds background pings of the servers that have not otherwise
+replied recently.
 
 This program can also create multicast groups commands via the 'add multicast'
 command (also at startup or interactively).  The multicast commands can then be
-distributed to multiple aggregated servers.
+distributed to multiple aggregated servers.  The command is sent to all the
+servers of the group at once and each server's output is displayed in its own
+labelled section as soon as it arrives, so the time taken by a group is that of
+its slowest server.  The 'watch' command reruns a multicast command at a fixed
+interval and only shows the servers whose output changed since the previous
+round, as a diff of the two outputs.
+
+For very large sets of servers, aggregators can be arranged in a tree.  An
+aggregator started as a UDP or UNIX server (see the -udp and -unix options) can
+be added to another aggregator with the 'add aggregator' command.  A multicast
+group of the parent that contains a child aggregator forwards the command to
+the child, which runs it on its own group of the same keyword and sends back
+the gathered replies of all its servers in one reply, so the parent only waits
+on its direct children.  Each reply is labelled with the path of local names
+that leads to the server that sent it.
 
 The aggregation and multicast functionality can be useful to manually drive a set
 of processes that use the pshell control mechanism as a control plane IPC.
@@ -54,14 +93,71 @@ of processes that use the pshell control mechanism as a control plane IPC.
 # import all our necessary modules
 import sys
 import os
+import time
+import bisect
 import signal
+import threading
+import json
+import difflib
+from collections import OrderedDict
 import PshellServer
 import PshellControl
 
-# list of dictionaries that contains a control structure for each control client
-_gPshellServers = []
+# dictionary that contains a control structure for each control client keyed by
+# its local name, in the order they were added, it is also indexed by its remote
+# (server, port) and by its sorted local names, so an abbreviated name can be
+# found with a binary search, all these lookups stay fast with thousands of servers
+_gPshellServers = OrderedDict()
+_gServerAddresses = {}
+_gSortedNames = []
+
+# multicast groups keyed by keyword, in the order they were added, along with
+# their sorted keywords, each group's servers are keyed by local name
+_gMulticast = OrderedDict()
+_gSortedKeywords = []
+
+# local servers added with 'add discovered', keyed by the (type, name, host, port)
+# of the running server, with the local name they were added under, once added
+# the pshell directory and registry are polled for changes by a background thread
+_gDiscovered = {}
+_gDiscoverThread = None
+_gDiscoverMtimes = None
+_gDiscoverInterval = 1.0
+# a server that exits without cleaning up does not change the directory, so all
+# the servers are checked anyway every this many polls
+_gDiscoverRescanPolls = 10
+
+# the discovery thread adds and removes servers while commands are dispatched
+_gLock = threading.RLock()
 
-_gMulticast = []
+# the imported remote commands, keyed by their local <localName>.<command> name,
+# with the (localName, command) they are sent to, when all servers are imported
+# the servers added afterwards are imported as well
+_gImportedCommands = {}
+_gImportAll = False
+
+# lazy connections, a server is connected when first used and disconnected
+# after it has been idle for the idle timeout (in seconds, 0 never), the
+# thread that disconnects the idle servers is started by the first lazy command
+_gLazy = False
+_gIdleTimeout = 0
+_gIdleThread = None
+_gIdlePollInterval = 1.0
+
+# set by the SIGINT handler that is installed while the watch command runs
+_gWatchStopped = False
+
+# background pings of the aggregated servers, the interval is in seconds, None
+# means no pings, the thread is started by the first ping command
+_gPingThread = None
+_gPingInterval = None
+_gPingTimeout = PshellControl.ONE_SEC
+_gPingPollInterval = 0.5
+
+# the replies that a child aggregator gathers for a forwarded multicast go back
+# to its parent in a single message, so they are cut down to fit, this leaves
+# room for the message header within the largest UDP datagram
+_gMaxTreeReplySize = PshellServer._gPshellMsgPayloadLength-1024
 
 _gLocalNameLabel = "Local Server Name"
 _gRemoteNameLabel = "Remote Server"
@@ -74,27 +170,39 @@ _gMaxMulticastKeyword = len(_gKeywordLabel)
 #################################################################################
 def _getMulticast(keyword):
   global _gMulticast
-  for multicast in _gMulticast:
-    if (keyword == multicast["keyword"]):
-      return (multicast)
-  return (None)
+  return (_gMulticast.get(keyword))
 
 #################################################################################
 #################################################################################
 def _getServer(localName):
   global _gPshellServers
-  for server in _gPshellServers:
-    if (PshellServer.isSubString(localName, server["localName"])):
-      return (server)
+  global _gSortedNames
+  server = _gPshellServers.get(localName)
+  if ((server != None) or (len(localName) == 0)):
+    return (server)
+  # an abbreviated name must match exactly one server, all the names it
+  # abbreviates are adjacent in the sorted list
+  index = bisect.bisect_left(_gSortedNames, localName)
+  if ((index < len(_gSortedNames)) and
+      (_gSortedNames[index].startswith(localName)) and
+      ((index+1 == len(_gSortedNames)) or (not _gSortedNames[index+1].startswith(localName)))):
+    return (_gPshellServers[_gSortedNames[index]])
   return (None)
 
 #################################################################################
 #################################################################################
-def _controlServer(argv):
+def _getTimeout():
+  # server response timeout in seconds, an explicit per-command -t<timeout> wins
   timeout = PshellServer._gPshellClientTimeout
   if PshellServer._gClientTimeoutOverride:
     if len(PshellServer._gClientTimeoutOverride) > 2:
       timeout = int(PshellServer._gClientTimeoutOverride[2:])
+  return (timeout)
+
+#################################################################################
+#################################################################################
+def _controlServer(argv):
+  timeout = _getTimeout()
   server = _getServer(argv[0])
   if (server != None):
     # see if they asked for help
@@ -106,25 +214,544 @@ def _controlServer(argv):
         (argv[1] == "--help") or
         (argv[1] == "?")):
       # user asked for help, display all the registered commands of the remote server
-      PshellServer.printf(PshellControl.extractCommands(server["sid"]), newline=False)
+      PshellServer.printf(PshellControl.extractCommands(_getSid(server)), newline=False)
     elif timeout == 0:
       print("PSHELL_INFO: Command sent fire-and-forget, no response requested")
-      PshellControl.sendCommand1(server["sid"], ' '.join(argv[1:]))
+      PshellControl.sendCommand1(_getSid(server), ' '.join(argv[1:]))
+    elif (server["isAggregator"]):
+      # an aggregator counts the command itself as one of its arguments, so its
+      # catalog cannot be used to check the command, it checks it itself
+      (results, retCode) = PshellControl.sendCommand4(_getSid(server), PshellControl.ONE_SEC*timeout, ' '.join(argv[1:]))
+      _showResults(server, ' '.join(argv[1:]), results, retCode)
     else:
-      # reconstitute and dispatch original command to remote server minus the first keyword
-      (results, retCode) = PshellControl.sendCommand4(server["sid"], timeout, ' '.join(argv[1:]))
-      # good return, display results back to user
-      if (retCode == PshellControl.COMMAND_SUCCESS):
+      # reconstitute the original command minus the first keyword and check it against the
+      # remote server's catalog, only a valid command is dispatched to the remote server
+      (retCode, command, results) = PshellControl.validateCommand(_getSid(server), ' '.join(argv[1:]))
+      if (len(results) > 0):
+        # usage or error generated locally from the catalog
         PshellServer.printf(results, newline=False)
+      else:
+        (results, retCode) = PshellControl.sendCommand4(_getSid(server), PshellControl.ONE_SEC*timeout, command)
+        _showResults(server, command, results, retCode)
+
+#################################################################################
+#################################################################################
+def _importedCommand(argv):
+  global _gImportedCommands
+  global _gPshellServers
+  # the command has already been resolved, and its args checked, by our local
+  # server against the imported catalog, so it is sent without any checks
+  (localName, command) = _gImportedCommands[PshellServer._gFoundCommand["name"]]
+  server = _gPshellServers[localName]
+  command = ' '.join([command]+argv[1:])
+  timeout = _getTimeout()
+  if (timeout == 0):
+    print("PSHELL_INFO: Command sent fire-and-forget, no response requested")
+    PshellControl.sendCommand1(_getSid(server), command)
+  else:
+    (results, retCode) = PshellControl.sendCommand4(_getSid(server), PshellControl.ONE_SEC*timeout, command)
+    _showResults(server, command, results, retCode)
+
+#################################################################################
+#################################################################################
+def _showResults(server_, command_, results_, retCode_):
+  # PshellControl only returns the output of a successful command, it logs any
+  # error on our own console, which is only the user's when we run interactively,
+  # so a remote client has the error reported back to it here
+  if (retCode_ == PshellControl.COMMAND_SUCCESS):
+    PshellServer.printf(results_, newline=False)
+  elif (PshellServer._gServerType != PshellServer.LOCAL):
+    PshellServer.printf("PSHELL_ERROR: Remote pshell command: '%s', server: %s, %s" % (command_,
+                                                                                     server_["localName"],
+                                                                                     PshellControl.getResponseString(retCode_)))
+
+#################################################################################
+#################################################################################
+def _importServer(server_):
+  if (len(server_["imported"]) > 0):
+    return (True)
+  # ask the server now rather than trust the outcome of the last request to it,
+  # so we don't wait on the catalog of a server that is down
+  sid = _getSid(server_)
+  if (PshellControl.probeServers([sid], PshellControl.ONE_SEC*_getTimeout()).get(sid) != PshellControl.COMMAND_SUCCESS):
+    PshellServer.printf("ERROR: Server: %s is not reachable, not imported" % server_["localName"])
+    return (False)
+  return (_importCatalog(server_))
+
+#################################################################################
+#################################################################################
+def _importCatalog(server_):
+  global _gImportedCommands
+  # the catalog is only fetched once, it is cached by PshellControl
+  catalog = PshellControl.getCatalog(_getSid(server_))
+  if (len(catalog) == 0):
+    PshellServer.printf("ERROR: Server: %s has no command catalog, not imported" % server_["localName"])
+    return (False)
+  for command in catalog:
+    name = server_["localName"]+"."+command["name"]
+    # the command name itself is counted as an arg since our first arg position is 0
+    PshellServer.addCommand(_synchronized(_importedCommand),
+                            name,
+                            command["description"],
+                            command["usage"],
+                            command["minArgs"]+1,
+                            command["maxArgs"]+1,
+                            command["showUsage"])
+    _gImportedCommands[name] = (server_["localName"], command["name"])
+    server_["imported"].append(name)
+  # the server's own command is dropped, its name would otherwise be an
+  # ambiguous abbreviation of all of the imported commands
+  PshellServer._removeCommand(server_["localName"])
+  return (True)
+
+#################################################################################
+#################################################################################
+def _import(argv):
+  global _gPshellServers
+  global _gImportAll
+  if (PshellServer.isHelp()):
+    PshellServer.printf()
+    PshellServer.showUsage()
+    PshellServer.printf()
+    PshellServer.printf("  where:")
+    PshellServer.printf("    <localName> - Local logical name of the server")
+    PshellServer.printf()
+    PshellServer.printf("  Register each command of a server locally as <localName>.<command>,")
+    PshellServer.printf("  in place of the <localName> command, 'import all' imports all the")
+    PshellServer.printf("  servers, including those added later, the commands of an aggregator")
+    PshellServer.printf("  cannot be imported")
+    PshellServer.printf()
+  elif (PshellServer.isSubString(argv[1], "all") and (len(argv) == 2)):
+    _gImportAll = True
+    servers = [server for server in _gPshellServers.values() if ((not server["isAggregator"]) and (len(server["imported"]) == 0))]
+    # probe them all together first so we never wait on each unreachable
+    # server in turn, this also loads the catalogs that are already cached
+    results = PshellControl.probeServers([_getSid(server) for server in servers], PshellControl.ONE_SEC*_getTimeout())
+    for server in servers:
+      if (results.get(_getSid(server)) == PshellControl.COMMAND_SUCCESS):
+        _importCatalog(server)
+      else:
+        PshellServer.printf("ERROR: Server: %s is not reachable, not imported" % server["localName"])
+  elif (PshellServer.isSubString(argv[1], "server") and (len(argv) == 3)):
+    server = _getServer(argv[2])
+    if (server == None):
+      PshellServer.printf("ERROR: Local name: %s not found" % argv[2])
+    elif (server["isAggregator"]):
+      PshellServer.printf("ERROR: Server: %s is an aggregator, not imported" % server["localName"])
+    else:
+      _importServer(server)
+  else:
+    PshellServer.showUsage()
 
 #################################################################################
 #################################################################################
 def _isDuplicate(localName_, remoteServer_, port_):
   global _gPshellServers
-  for server in _gPshellServers:
-    if ((localName_ == server["localName"]) or ((remoteServer_ == server["remoteServer"]) and (port_ == server["port"]))):
-      return (True)
-  return (False)
+  global _gServerAddresses
+  return ((localName_ in _gPshellServers) or ((remoteServer_, port_) in _gServerAddresses))
+
+#################################################################################
+#################################################################################
+def _addServer(localName_, remoteServer_, port_, sid_ = None, isAggregator_ = False):
+  global _gPshellServers
+  global _gImportAll
+  global _gLazy
+  global _gMaxLocalName
+  global _gMaxRemoteName
+  global _gRemoteNameLabel
+  global _gLocalNameLabel
+  if (_isDuplicate(localName_, remoteServer_, port_)):
+    PshellServer.printf("ERROR: Local name: %s, remote server: %s, port: %s already exists" % (localName_, remoteServer_, port_))
+    return (False)
+  if (len(localName_) > _gMaxLocalName):
+    _gMaxLocalName = max(len(localName_), len(_gLocalNameLabel))
+  if (len(remoteServer_) > _gMaxRemoteName):
+    _gMaxRemoteName = max(len(remoteServer_), len(_gRemoteNameLabel))
+  _gPshellServers[localName_] = {"localName":localName_,
+                                 "remoteServer":remoteServer_,
+                                 "port":port_,
+                                 "sid":sid_,
+                                 "connected":(sid_ != None),
+                                 "lastUsed":time.time(),
+                                 "isAggregator":isAggregator_,
+                                 "imported":[]}
+  if ((sid_ == None) and (not _gLazy)):
+    _getSid(_gPshellServers[localName_])
+  _gServerAddresses[(remoteServer_, port_)] = _gPshellServers[localName_]
+  bisect.insort(_gSortedNames, localName_)
+  PshellServer.addCommand(_synchronized(_controlServer),
+                          localName_,
+                          "control the remote " + localName_ + " process",
+                          "[<command> | ? | -h]",
+                          0,
+                          30,
+                          False)
+  if (_gImportAll and (not isAggregator_)):
+    _importServer(_gPshellServers[localName_])
+  return (True)
+
+#################################################################################
+#################################################################################
+def _getSid(server_):
+  # in lazy mode a server is not connected until it is first used, or after it
+  # has been disconnected for being idle, the connect is local, nothing is sent,
+  # a server that was connected before is reconnected under the same sid so it
+  # keeps its statistics
+  if (server_["sid"] == None):
+    sid = PshellControl.connectServer(server_["localName"], server_["remoteServer"], server_["port"], PshellControl.ONE_SEC*5)
+    if (sid == PshellControl.INVALID_SID):
+      return (sid)
+    server_["sid"] = sid
+  elif ((not server_["connected"]) and (not PshellControl.reconnectServer(server_["sid"]))):
+    return (PshellControl.INVALID_SID)
+  server_["connected"] = True
+  server_["lastUsed"] = time.time()
+  return (server_["sid"])
+
+#################################################################################
+#################################################################################
+def _lazy(argv):
+  global _gLazy
+  global _gIdleTimeout
+  global _gIdleThread
+  if (PshellServer.isHelp()):
+    PshellServer.printf()
+    PshellServer.showUsage()
+    PshellServer.printf()
+    PshellServer.printf("  where:")
+    PshellServer.printf("    <idleTimeout> - Seconds a server can be idle before it is disconnected,")
+    PshellServer.printf("                    0 to leave the servers connected once used")
+    PshellServer.printf()
+    PshellServer.printf("  Only connect the servers when they are first used, and disconnect them")
+    PshellServer.printf("  again when they are idle, they are reconnected when they are next used,")
+    PshellServer.printf("  with no arguments the current setting is shown")
+    PshellServer.printf()
+  elif (len(argv) == 1):
+    if (not _gLazy):
+      PshellServer.printf("Lazy connections: off")
+    else:
+      PshellServer.printf("Lazy connections: on, idle timeout: %s second(s)" % _gIdleTimeout)
+  elif (PshellServer.isSubString(argv[1], "off")):
+    # the servers are connected when they are next used, not all at once
+    _gLazy = False
+  elif ((PshellServer.isDec(argv[1]) or PshellServer.isFloat(argv[1])) and (float(argv[1]) >= 0)):
+    _gLazy = True
+    _gIdleTimeout = float(argv[1])
+    if (_gIdleThread == None):
+      _gIdleThread = threading.Thread(target=_watchIdle)
+      _gIdleThread.daemon = True
+      _gIdleThread.start()
+  else:
+    PshellServer.showUsage()
+
+#################################################################################
+#################################################################################
+def _watchIdle():
+  global _gLazy
+  global _gIdleTimeout
+  global _gIdlePollInterval
+  global _gLock
+  while (True):
+    time.sleep(_gIdlePollInterval)
+    if (_gLazy and (_gIdleTimeout > 0)):
+      with _gLock:
+        _disconnectIdleServers(_gIdleTimeout)
+
+#################################################################################
+#################################################################################
+def _disconnectIdleServers(idleTimeout_):
+  global _gPshellServers
+  now = time.time()
+  for server in _gPshellServers.values():
+    if (server["connected"] and (now-server["lastUsed"] >= idleTimeout_)):
+      PshellControl.disconnectServer(server["sid"])
+      server["connected"] = False
+
+#################################################################################
+#################################################################################
+def _removeServer(localName_):
+  global _gPshellServers
+  global _gServerAddresses
+  global _gSortedNames
+  global _gMulticast
+  global _gImportedCommands
+  server = _getServer(localName_)
+  if (server == None):
+    PshellServer.printf("ERROR: Local name: %s not found" % localName_)
+    return
+  if (server["connected"]):
+    PshellControl.disconnectServer(server["sid"])
+  del _gPshellServers[server["localName"]]
+  del _gServerAddresses[(server["remoteServer"], server["port"])]
+  del _gSortedNames[bisect.bisect_left(_gSortedNames, server["localName"])]
+  for keyword in list(_gMulticast.keys()):
+    _removeMulticast(keyword, [server["localName"]])
+  PshellServer._removeCommand(server["localName"])
+  for name in server["imported"]:
+    PshellServer._removeCommand(name)
+    del _gImportedCommands[name]
+
+#################################################################################
+#################################################################################
+def _addMulticast(keyword_, localNames_):
+  global _gMulticast
+  global _gSortedKeywords
+  global _gMaxMulticastKeyword
+  global _gKeywordLabel
+  multicast = _getMulticast(keyword_)
+  if (multicast == None):
+    # new keyword
+    if (len(keyword_) > _gMaxMulticastKeyword):
+      _gMaxMulticastKeyword = max(len(keyword_), len(_gKeywordLabel))
+    multicast = {"keyword":keyword_, "servers":OrderedDict()}
+    _gMulticast[keyword_] = multicast
+    bisect.insort(_gSortedKeywords, keyword_)
+  # add servers to this keyword
+  for localName in localNames_:
+    server = _getServer(localName)
+    if (server != None):
+      multicast["servers"][server["localName"]] = server
+    else:
+      PshellServer.printf("ERROR: Local name: %s not found" % localName)
+  if (len(multicast["servers"]) == 0):
+    _removeMulticast(keyword_, [])
+
+#################################################################################
+#################################################################################
+def _removeMulticast(keyword_, localNames_):
+  global _gMulticast
+  global _gSortedKeywords
+  # remove the given servers from the group, or the whole group if none are
+  # given, a group that is left with no servers is removed
+  multicast = _getMulticast(keyword_)
+  if (multicast == None):
+    return
+  for localName in localNames_:
+    multicast["servers"].pop(localName, None)
+  if ((len(localNames_) == 0) or (len(multicast["servers"]) == 0)):
+    del _gMulticast[keyword_]
+    del _gSortedKeywords[bisect.bisect_left(_gSortedKeywords, keyword_)]
+
+#################################################################################
+#################################################################################
+def _addSubnet(broadcastAddress_, port_, numPorts_):
+  global _gPshellServers
+  servers = PshellControl.discoverServers(broadcastAddress_, port_, PshellControl.ONE_SEC, numPorts_)
+  numAdded = 0
+  for server in servers:
+    port = str(server["port"])
+    if (_isDuplicate(None, server["host"], port)):
+      # already aggregated, probably from a previous subnet scan
+      continue
+    localName = _getUniqueName(str(server["name"]), server["host"], port)
+    if ((localName != None) and _addServer(localName, server["host"], port)):
+      numAdded += 1
+  PshellServer.printf("Discovered %d server(s), added %d new server(s)" % (len(servers), numAdded))
+
+#################################################################################
+#################################################################################
+def _addFile(filename_):
+  global _gPshellServers
+  global _gMaxLocalName
+  global _gLazy
+  # the servers are all connected in one call and then probed together, so
+  # the time taken is about that of the slowest server rather than the sum
+  servers = _readServerFile(filename_)
+  if (servers == None):
+    PshellServer.printf("ERROR: Could not open server file: %s" % filename_)
+    return
+  newServers = []
+  names = set()
+  addresses = set()
+  for (localName, remoteServer, port) in servers:
+    if (_isDuplicate(localName, remoteServer, port) or
+        (localName in names) or ((remoteServer, port) in addresses)):
+      PshellServer.printf("ERROR: Local name: %s, remote server: %s, port: %s already exists" % (localName, remoteServer, port))
+    else:
+      newServers.append((localName, remoteServer, port))
+      names.add(localName)
+      addresses.add((remoteServer, port))
+  if (_gLazy):
+    # nothing is connected, or probed, until it is used
+    numAdded = len([server for server in newServers if _addServer(*server)])
+    PshellServer.printf("Added %d server(s), not connected" % numAdded)
+    return
+  sids = PshellControl.connectServers(newServers, PshellControl.ONE_SEC*5)
+  results = PshellControl.probeServers(sids, PshellControl.ONE_SEC*_getTimeout())
+  unreachable = []
+  numAdded = 0
+  for ((localName, remoteServer, port), sid) in zip(newServers, sids):
+    if (sid == PshellControl.INVALID_SID):
+      unreachable.append((localName, remoteServer, port))
+    elif (_addServer(localName, remoteServer, port, sid)):
+      numAdded += 1
+      if (results.get(sid, PshellControl.COMMAND_SUCCESS) != PshellControl.COMMAND_SUCCESS):
+        # still added, it can be used when it comes up
+        unreachable.append((localName, remoteServer, port))
+  PshellServer.printf("Added %d server(s), %d unreachable" % (numAdded, len(unreachable)))
+  for (localName, remoteServer, port) in unreachable:
+    PshellServer.printf("  %-*s  %s[%s]" % (_gMaxLocalName, localName, remoteServer, port))
+
+#################################################################################
+#################################################################################
+def _readServerFile(filename_):
+  # one '<localName> <remoteServer> [<port>]' server per line, the file is
+  # looked for as given and then in the pshell config directories
+  configPath = os.getenv('PSHELL_CONFIG_DIR')
+  filenames = [filename_]
+  if (not os.path.isabs(filename_)):
+    if (configPath != None):
+      filenames.append(os.path.join(configPath, filename_))
+    filenames.append(os.path.join(PshellControl._PSHELL_CONFIG_DIR, filename_))
+  for filename in filenames:
+    if (os.path.isfile(filename)):
+      break
+  else:
+    return (None)
+  servers = []
+  try:
+    file = open(filename, "r")
+  except:
+    return (None)
+  for line in file:
+    # skip comments and blank lines
+    line = line.split("#")[0].split()
+    if ((len(line) == 2) or (len(line) == 3)):
+      port = PshellServer.UNIX
+      if (len(line) == 3):
+        port = line[2]
+      servers.append((line[0], line[1], port))
+    elif (len(line) > 0):
+      PshellServer.printf("ERROR: Invalid server entry: %s" % " ".join(line))
+  file.close()
+  return (servers)
+
+#################################################################################
+#################################################################################
+def _getUniqueName(name_, host_, port_):
+  global _gPshellServers
+  # the same server name can be running on more than one host, or on more
+  # than one port of the same host
+  for localName in (name_, name_+"@"+host_, name_+"@"+host_+":"+port_):
+    if (localName not in _gPshellServers):
+      return (localName)
+  return (None)
+
+#################################################################################
+#################################################################################
+def _addDiscovered():
+  global _gDiscoverThread
+  global _gDiscoverMtimes
+  _gDiscoverMtimes = _getDiscoverMtimes()
+  (numServers, numAdded, numRemoved) = _syncDiscovered()
+  PshellServer.printf("Discovered %d local server(s), added %d new server(s)" % (numServers, numAdded))
+  if (_gDiscoverThread == None):
+    _gDiscoverThread = threading.Thread(target=_watchDiscovered)
+    _gDiscoverThread.daemon = True
+    _gDiscoverThread.start()
+
+#################################################################################
+#################################################################################
+def _getDiscoveredServers():
+  # all the running local servers we can aggregate, keyed by (type, name, host,
+  # port), with the (remoteServer, port) to connect to them, we skip our own
+  # server, and any other aggregator, they would forward multicasts back to
+  # the servers we already have, or back to us
+  servers = {}
+  for server in PshellServer._getActiveServers():
+    key = (server["type"], server["name"], server["host"], server["port"])
+    if (_isOwnServer(server) or (server["role"] == "client")):
+      continue
+    elif (server["type"] == PshellServer.UNIX):
+      servers[key] = (server["name"], PshellServer.UNIX)
+    elif ((server["type"] == PshellServer.UDP) and (server["host"] != PshellServer.ANYBCAST)):
+      if (server["host"] == PshellServer.ANYHOST):
+        servers[key] = (PshellServer.LOCALHOST, server["port"])
+      else:
+        servers[key] = (server["host"], server["port"])
+  return (servers)
+
+#################################################################################
+#################################################################################
+def _isOwnServer(server_):
+  if (server_["pid"] != None):
+    return (server_["pid"] == os.getpid())
+  # found by its lock file, which we cannot tell apart from another process
+  # by its lock, so go by the name and port it was started with
+  return ((server_["name"] == PshellServer._gServerName) and
+          (server_["type"] == PshellServer._gServerType) and
+          ((server_["type"] == PshellServer.UNIX) or (server_["port"] == str(PshellServer._gPort))))
+
+#################################################################################
+#################################################################################
+def _syncDiscovered():
+  global _gDiscovered
+  global _gPshellServers
+  # only the servers that have started or exited since the last sync are added
+  # or removed, the others are left connected as they are
+  servers = _getDiscoveredServers()
+  numAdded = 0
+  numRemoved = 0
+  for key in list(_gDiscovered.keys()):
+    if (key not in servers):
+      # the server has exited, unless it was already removed by hand
+      if (_gDiscovered[key] in _gPshellServers):
+        _removeServer(_gDiscovered[key])
+        numRemoved += 1
+      del _gDiscovered[key]
+  for key in servers:
+    if (key not in _gDiscovered):
+      (remoteServer, port) = servers[key]
+      if (_isDuplicate(None, remoteServer, port)):
+        # already aggregated by hand
+        continue
+      localName = _getUniqueName(key[1], remoteServer, port)
+      if ((localName != None) and _addServer(localName, remoteServer, port)):
+        _gDiscovered[key] = localName
+        numAdded += 1
+  return (len(servers), numAdded, numRemoved)
+
+#################################################################################
+#################################################################################
+def _getDiscoverMtimes():
+  # a server creates or removes its lock file, or updates the registry, when it
+  # starts or exits, either of which changes one of these modification times
+  mtimes = []
+  for path in (PshellServer._gFileSystemPath, PshellServer._gRegistryFile):
+    try:
+      mtimes.append(os.stat(path).st_mtime)
+    except:
+      mtimes.append(None)
+  return (mtimes)
+
+#################################################################################
+#################################################################################
+def _watchDiscovered():
+  global _gDiscoverMtimes
+  global _gDiscoverInterval
+  global _gDiscoverRescanPolls
+  global _gLock
+  numPolls = 0
+  while (True):
+    time.sleep(_gDiscoverInterval)
+    numPolls += 1
+    mtimes = _getDiscoverMtimes()
+    if ((mtimes != _gDiscoverMtimes) or ((numPolls % _gDiscoverRescanPolls) == 0)):
+      with _gLock:
+        # taken before the sync so a change made during the sync is seen on the next poll
+        _gDiscoverMtimes = mtimes
+        _syncDiscovered()
+
+#################################################################################
+#################################################################################
+def _synchronized(function_):
+  global _gLock
+  # the discovery thread adds and removes servers while commands are being
+  # dispatched, so every command callback holds the lock
+  def synchronized(argv):
+    with _gLock:
+      function_(argv)
+  return (synchronized)
 
 #################################################################################
 #################################################################################
@@ -142,52 +769,71 @@ def _add(argv):
     PshellServer.showUsage()
     PshellServer.printf()
     PshellServer.printf("  where:")
-    PshellServer.printf("    <localName>    - Local logical name of the server, must be unique")
+    PshellServer.printf("    <localName>    - Local logical name of the server or aggregator, must be unique")
     PshellServer.printf("    <remoteServer> - Hostname or IP address of UDP server or name of UNIX server")
     PshellServer.printf("    <port>         - UDP port number or 'unix' for UNIX server (can be omitted for UNIX)")
     PshellServer.printf("    <keyword>      - Multicast group keyword, must be valid registered remote command")
+    PshellServer.printf("    <bcastAddr>    - Subnet broadcast address to discover UDP servers on")
+    PshellServer.printf("    <numPorts>     - Number of consecutive ports to query (default=1)")
+    PshellServer.printf("    <filename>     - Server list file, one '<localName> <remoteServer> [<port>]'")
+    PshellServer.printf("                     per line, looked for as given and then in the")
+    PshellServer.printf("                     $PSHELL_CONFIG_DIR and %s directories" % PshellControl._PSHELL_CONFIG_DIR)
     PshellServer.printf()
-  elif (PshellServer.isSubString(argv[1], "server")):
+    PshellServer.printf("  'add discovered' adds all the UDP and UNIX servers running on the local")
+    PshellServer.printf("  host and keeps adding and removing them as they start and exit")
+    PshellServer.printf()
+    PshellServer.printf("  'add aggregator' adds a child pshellAggregator that was started as a UDP")
+    PshellServer.printf("  or UNIX server, multicast commands are forwarded to its own multicast")
+    PshellServer.printf("  group of the same keyword")
+    PshellServer.printf()
+  elif (PshellServer.isSubString(argv[1], "discovered") and (len(argv) == 2)):
+    _addDiscovered()
+  elif (PshellServer.isSubString(argv[1], "file") and (len(argv) == 3)):
+    _addFile(argv[2])
+  elif (len(argv) < 4):
+    PshellServer.showUsage()
+  elif (PshellServer.isSubString(argv[1], "server") or PshellServer.isSubString(argv[1], "aggregator")):
+    if (len(argv) > 5):
+      PshellServer.showUsage()
+      return
     # default port
     port = PshellServer.UNIX
     if (len(argv) == 5):
       port = argv[4]
-    if (not _isDuplicate(argv[2], argv[3], port)):
-      if (len(argv[2]) > _gMaxLocalName):
-        _gMaxLocalName = max(len(argv[2]), len(_gLocalNameLabel))
-      if (len(argv[3]) > _gMaxRemoteName):
-        _gMaxRemoteName = max(len(argv[3]), len(_gRemoteNameLabel))
-      _gPshellServers.append({"localName":argv[2],
-                              "remoteServer":argv[3],
-                              "port":port,
-                              "sid":PshellControl.connectServer(argv[2],
-                                                                argv[3],
-                                                                port,
-                                                                PshellControl.ONE_SEC*5)})
-      PshellServer.addCommand(_controlServer,
-                              argv[2],
-                              "control the remote " + argv[2] + " process",
-                              "[<command> | ? | -h]",
-                              0,
-                              30,
-                              False)
-      PshellServer._addTabCompletions()
-    else:
-      PshellServer.printf("ERROR: Local name: %s, remote server: %s, port: %s already exists" % (argv[2], argv[3], argv[4]))
+    _addServer(argv[2], argv[3], port, None, PshellServer.isSubString(argv[1], "aggregator"))
+  elif (PshellServer.isSubString(argv[1], "subnet")):
+    if ((len(argv) > 5) or (not argv[3].isdigit()) or
+        ((len(argv) == 5) and (not argv[4].isdigit()))):
+      PshellServer.showUsage()
+      return
+    numPorts = 1
+    if (len(argv) == 5):
+      numPorts = int(argv[4])
+    _addSubnet(argv[2], int(argv[3]), numPorts)
+  elif (PshellServer.isSubString(argv[1], "multicast")):
+    _addMulticast(argv[2], argv[3:])
+  else:
+    PshellServer.showUsage()
+
+#################################################################################
+#################################################################################
+def _remove(argv):
+  if (PshellServer.isHelp()):
+    PshellServer.printf()
+    PshellServer.showUsage()
+    PshellServer.printf()
+    PshellServer.printf("  where:")
+    PshellServer.printf("    <localName> - Local logical name of the server")
+    PshellServer.printf("    <keyword>   - Multicast group keyword, the whole group is removed")
+    PshellServer.printf("                  if no servers are given")
+    PshellServer.printf()
+  elif ((PshellServer.isSubString(argv[1], "server")) and (len(argv) == 3)):
+    _removeServer(argv[2])
   elif (PshellServer.isSubString(argv[1], "multicast")):
-    multicast = _getMulticast(argv[2])
-    if (multicast == None):
-      # new keyword
-      if (len(argv[2]) > _gMaxMulticastKeyword):
-        _gMaxMulticastKeyword = max(len(argv[2]), len(_gKeywordLabel))
-      _gMulticast.append({"keyword":argv[2], "servers":[]})
-      multicast = _gMulticast[-1]
-    # add servers to this keyword
-    for localName in argv[3:]:
-      server = _getServer(localName)
-      if (server != None):
-        PshellControl.addMulticast(server["sid"], argv[2])
-        multicast["servers"].append(server)
+    if (_getMulticast(argv[2]) == None):
+      PshellServer.printf("ERROR: Multicast keyword: %s not found" % argv[2])
+    else:
+      _removeMulticast(argv[2], [server["localName"] for server in map(_getServer, argv[3:]) if (server != None)])
   else:
     PshellServer.showUsage()
 
@@ -202,7 +848,9 @@ def _show(argv):
   global _gRemoteNameLabel
   global _gLocalNameLabel
   global _gKeywordLabel
-  if (PshellServer.isSubString(argv[1], "server")):
+  if (PshellServer.isSubString(argv[1], "health")):
+    _showHealth()
+  elif (PshellServer.isSubString(argv[1], "server")):
     PshellServer.printf()
     PshellServer.printf("*************************************************")
     PshellServer.printf("*           AGGREGATED REMOTE SERVERS           *")
@@ -212,8 +860,13 @@ def _show(argv):
                                                 _gRemoteNameLabel.ljust(_gMaxRemoteName)))
     PshellServer.printf("%s    %s    ======" % ("=".ljust(_gMaxLocalName, "="),
                                                   "=".ljust(_gMaxRemoteName, "=")))
-    for server in _gPshellServers:
-      PshellServer.printf("%s    %s    %s" % (server["localName"].ljust(_gMaxLocalName), server["remoteServer"].ljust(_gMaxRemoteName), server["port"]))
+    for server in _gPshellServers.values():
+      PshellServer.printf("%s    %s    %s" % (server["localName"].ljust(_gMaxLocalName), server["remoteServer"].ljust(_gMaxRemoteName), server["port"]), newline=False)
+      if (server["isAggregator"]):
+        PshellServer.printf(" (aggregator)", newline=False)
+      if (not server["connected"]):
+        PshellServer.printf(" (not connected)", newline=False)
+      PshellServer.printf()
     PshellServer.printf()
   elif (PshellServer.isSubString(argv[1], "multicast")):
     PshellServer.printf()
@@ -227,9 +880,9 @@ def _show(argv):
     PshellServer.printf("%s    %s    %s    ======" % ("=".ljust(_gMaxMulticastKeyword, "="),
                                                         "=".ljust(_gMaxLocalName, "="),
                                                         "=".ljust(_gMaxRemoteName, "=")))
-    for multicast in _gMulticast:
+    for multicast in _gMulticast.values():
       PshellServer.printf("%s    " % multicast["keyword"].ljust(_gMaxMulticastKeyword), newline=False)
-      for index, server in enumerate(multicast["servers"]):
+      for index, server in enumerate(multicast["servers"].values()):
         if (index > 0):
           PshellServer.printf("%s    " % " ".ljust(_gMaxMulticastKeyword, " "), newline=False)
         PshellServer.printf("%s    %s    %s" % (server["localName"].ljust(_gMaxLocalName),
@@ -239,6 +892,147 @@ def _show(argv):
   else:
     PshellServer.showUsage()
 
+#################################################################################
+#################################################################################
+def _showHealth():
+  global _gPshellServers
+  global _gMaxLocalName
+  global _gMaxRemoteName
+  global _gRemoteNameLabel
+  global _gLocalNameLabel
+  global _gPingInterval
+  now = time.time()
+  health = []
+  for server in _gPshellServers.values():
+    if (server["sid"] == None):
+      # never connected in lazy mode, there is nothing to show until it is used,
+      # a server disconnected for being idle still has its statistics
+      stats = {"reachable":None,
+               "latency":{"count":0, "last":0.0, "p99":0.0},
+               "failures":0,
+               "lastError":None,
+               "lastErrorTime":None}
+    else:
+      stats = PshellControl.getStats(server["sid"])
+    if (stats == None):
+      # the connect failed
+      stats = {"reachable":False,
+               "latency":{"count":0, "last":0.0, "p99":0.0},
+               "failures":0,
+               "lastError":PshellControl.getResponseString(PshellControl.SOCKET_NOT_CONNECTED),
+               "lastErrorTime":None}
+    health.append((server, stats))
+  # the unreachable servers first and then the slowest, these are the servers
+  # that hold up the multicast commands
+  health.sort(key=lambda entry: ((entry[1]["reachable"] != False), -entry[1]["latency"]["p99"]))
+  PshellServer.printf()
+  PshellServer.printf("*************************************************")
+  PshellServer.printf("*           AGGREGATED SERVER HEALTH            *")
+  PshellServer.printf("*************************************************")
+  PshellServer.printf()
+  PshellServer.printf("%s    %s    Port      Reachable    Last RTT     p99 RTT    Failures    Last Error" % (_gLocalNameLabel.ljust(_gMaxLocalName),
+                                                                                                                _gRemoteNameLabel.ljust(_gMaxRemoteName)))
+  PshellServer.printf("%s    %s    ======    =========    ========    ========    ========    ==========" % ("=".ljust(_gMaxLocalName, "="),
+                                                                                                                "=".ljust(_gMaxRemoteName, "=")))
+  for (server, stats) in health:
+    reachable = {True:"yes", False:"no", None:"unknown"}[stats["reachable"]]
+    lastRtt = "-"
+    p99Rtt = "-"
+    if (stats["latency"]["count"] > 0):
+      lastRtt = "%.2fms" % stats["latency"]["last"]
+      p99Rtt = "%.2fms" % stats["latency"]["p99"]
+    lastError = "-"
+    if (stats["lastError"] != None):
+      lastError = stats["lastError"]
+      if (stats["lastErrorTime"] != None):
+        lastError += ", %ds ago" % int(now-stats["lastErrorTime"])
+    PshellServer.printf("%s    %s    %-6s    %-9s    %8s    %8s    %8d    %s" % (server["localName"].ljust(_gMaxLocalName),
+                                                                              server["remoteServer"].ljust(_gMaxRemoteName),
+                                                                              server["port"],
+                                                                              reachable,
+                                                                              lastRtt,
+                                                                              p99Rtt,
+                                                                              stats["failures"],
+                                                                              lastError))
+  PshellServer.printf()
+  if (_gPingInterval == None):
+    PshellServer.printf("Background pings: off")
+  else:
+    PshellServer.printf("Background pings: every %s second(s)" % _gPingInterval)
+  PshellServer.printf()
+
+#################################################################################
+#################################################################################
+def _ping(argv):
+  global _gPingThread
+  global _gPingInterval
+  if (PshellServer.isHelp()):
+    PshellServer.printf()
+    PshellServer.showUsage()
+    PshellServer.printf()
+    PshellServer.printf("  where:")
+    PshellServer.printf("    <interval> - Seconds between the pings of each server")
+    PshellServer.printf()
+    PshellServer.printf("  Ping the aggregated servers in the background, a server that replied")
+    PshellServer.printf("  to a command within the interval is not pinged, the results are shown")
+    PshellServer.printf("  by 'show health', with no arguments the current setting is shown")
+    PshellServer.printf()
+  elif (len(argv) == 1):
+    if (_gPingInterval == None):
+      PshellServer.printf("Background pings: off")
+    else:
+      PshellServer.printf("Background pings: every %s second(s)" % _gPingInterval)
+  elif (PshellServer.isSubString(argv[1], "off")):
+    _gPingInterval = None
+  elif ((PshellServer.isDec(argv[1]) or PshellServer.isFloat(argv[1])) and (float(argv[1]) > 0)):
+    _gPingInterval = float(argv[1])
+    if (_gPingThread == None):
+      _gPingThread = threading.Thread(target=_pingServers)
+      _gPingThread.daemon = True
+      _gPingThread.start()
+  else:
+    PshellServer.showUsage()
+
+#################################################################################
+#################################################################################
+def _pingServers():
+  global _gPingInterval
+  global _gPingPollInterval
+  global _gLock
+  # polled so a change of the interval, or turning the pings off, takes
+  # effect straight away
+  lastPing = 0
+  while (True):
+    time.sleep(_gPingPollInterval)
+    interval = _gPingInterval
+    if ((interval != None) and (time.time()-lastPing >= interval)):
+      lastPing = time.time()
+      _pingIdleServers(interval)
+
+#################################################################################
+#################################################################################
+def _pingIdleServers(interval_):
+  global _gPshellServers
+  global _gPingTimeout
+  global _gLock
+  # a server that replied within the interval, e.g. to a multicast command,
+  # already has a recent measurement, so only the other servers are pinged,
+  # all of them at once with a single wait for their replies, the lock is
+  # only held to pick the servers and to send and read the pings, commands
+  # are not held up while we wait
+  now = time.time()
+  sids = []
+  with _gLock:
+    for server in _gPshellServers.values():
+      if (not server["connected"]):
+        # not connected in lazy mode, a ping does not count as a use
+        continue
+      stats = PshellControl.getStats(server["sid"])
+      if ((stats != None) and ((stats["lastReplyTime"] == None) or (now-stats["lastReplyTime"] >= interval_))):
+        sids.append(server["sid"])
+  if (len(sids) > 0):
+    PshellControl.probeServers(sids, _gPingTimeout, _gLock)
+
 #################################################################################
 #################################################################################
 def _multicast(argv):
@@ -249,9 +1043,314 @@ def _multicast(argv):
     PshellServer.printf("  Send a registered multicast command to the associated")
     PshellServer.printf("  multicast remote server group")
     _show(('show', 'multicast'))
+  elif (argv[1] == "-tree"):
+    # a command forwarded by a parent aggregator, the replies of all our servers,
+    # including those gathered by our own child aggregators, are sent back as a
+    # single structured reply
+    if (len(argv) < 3):
+      PshellServer.showUsage()
+      return
+    replies = []
+    def addReply(path_, remoteServer_, results_, retCode_, truncated_):
+      replies.append({"path":path_, "remoteServer":remoteServer_, "results":results_, "retCode":retCode_, "truncated":truncated_})
+    (numReplies, numServers) = _gatherMulticast(_getMulticastServers(argv[2]), ' '.join(argv[2:]), _getTimeout(), addReply)
+    PshellServer.printf(_encodeMulticastReplies(replies, numReplies, numServers), newline=False)
   else:
     # reconstitute the original command
-    PshellControl.sendMulticast(' '.join(argv[1:]))
+    command = ' '.join(argv[1:])
+    servers = _getMulticastServers(argv[1])
+    if (len(servers) == 0):
+      PshellServer.printf("PSHELL_ERROR: Multicast command: '%s', not found" % argv[1])
+    elif (_getTimeout() == 0):
+      print("PSHELL_INFO: Command sent fire-and-forget, no response requested")
+      for sid in sorted(servers):
+        if (servers[sid]["isAggregator"]):
+          PshellControl.sendCommand2(sid, PshellControl.NO_WAIT, "-t0 multicast "+command)
+        else:
+          PshellControl.sendCommand2(sid, PshellControl.NO_WAIT, command)
+    else:
+      numShown = [0]
+      def showReply(path_, remoteServer_, results_, retCode_, truncated_):
+        numShown[0] += 1
+        _showMulticastReply(path_, remoteServer_, results_, retCode_, truncated_)
+      (numReplies, numServers) = _gatherMulticast(servers, command, _getTimeout(), showReply)
+      PshellServer.printf()
+      PshellServer.printf("Multicast command: '%s', %d of %d server(s) replied" % (command, numReplies, numServers))
+      if (numShown[0] < numServers):
+        PshellServer.printf("PSHELL_WARNING: %d server(s) not shown, the reply of a child aggregator was too large" % (numServers-numShown[0]))
+
+#################################################################################
+#################################################################################
+def _getMulticastServers(command_):
+  global _gMulticast
+  global _gSortedKeywords
+  # all the servers of every group whose keyword the command abbreviates, the
+  # same match that is done by PshellControl.sendMulticast, keyed by sid so a
+  # server in more than one matching group only gets the command once, the
+  # keywords it abbreviates are adjacent in the sorted list
+  servers = {}
+  index = bisect.bisect_left(_gSortedKeywords, command_)
+  while ((index < len(_gSortedKeywords)) and (_gSortedKeywords[index].startswith(command_))):
+    for server in _gMulticast[_gSortedKeywords[index]]["servers"].values():
+      sid = _getSid(server)
+      if (sid != PshellControl.INVALID_SID):
+        servers[sid] = server
+    index += 1
+  return (servers)
+
+#################################################################################
+#################################################################################
+def _gatherMulticast(servers_, command_, timeout_, showReply_):
+  # send the command to every server before waiting on any of them, each server
+  # has its own deadline, which is the duration it advertises for the command if
+  # we have its catalog, otherwise the timeout, each reply is passed to the
+  # showReply_ function, returns the number of servers that replied and the
+  # number of servers that the command reached, including those of our child
+  # aggregators
+  deadlines = {}
+  numReplies = 0
+  numServers = 0
+  startTime = time.time()
+  for sid in sorted(servers_):
+    if (servers_[sid]["isAggregator"]):
+      # each level of the tree gives its children one second less than it was
+      # given so their replies get back to us in time, this also limits the
+      # depth of the tree, and ends a loop of aggregators that add each other
+      if (timeout_ <= 1):
+        retCode = PshellControl.SOCKET_TIMEOUT
+      else:
+        retCode = PshellControl.send(sid, "-t%d multicast -tree %s" % (timeout_-1, command_))
+      timeout = PshellControl.ONE_SEC*timeout_
+    else:
+      retCode = PshellControl.send(sid, command_)
+      timeout = PshellControl.getCommandTimeout(sid, command_, PshellControl.ONE_SEC*timeout_)
+    if (retCode == PshellControl.COMMAND_SUCCESS):
+      deadlines[sid] = startTime+float(timeout)/1000.0
+    else:
+      numServers += _dispatchMulticastReply(servers_[sid], "", retCode, showReply_)[1]
+  while (len(deadlines) > 0):
+    timeout = max(min(deadlines.values())-time.time(), 0)
+    (sid, results, retCode) = PshellControl.waitAny(list(deadlines.keys()), PshellControl.ONE_SEC*timeout)
+    if (sid != PshellControl.INVALID_SID):
+      del deadlines[sid]
+      replies = [(sid, results, retCode)]
+    else:
+      # stop waiting on the servers whose own deadline has passed
+      expired = [sid for sid in deadlines if (deadlines[sid] <= time.time())]
+      replies = []
+      for (sid, (results, retCode)) in sorted(PshellControl.waitAll(expired, PshellControl.NO_WAIT).items()):
+        del deadlines[sid]
+        replies.append((sid, results, retCode))
+    for (sid, results, retCode) in replies:
+      (numReplied, numReached) = _dispatchMulticastReply(servers_[sid], results, retCode, showReply_)
+      numReplies += numReplied
+      numServers += numReached
+  return (numReplies, numServers)
+
+#################################################################################
+#################################################################################
+def _dispatchMulticastReply(server_, results_, retCode_, showReply_):
+  # the reply of a child aggregator holds the replies of the servers that it
+  # reached, each one is passed on with our local name of the child added to
+  # the front of its path, returns the number of servers that replied and the
+  # number of servers the reply is for, which includes any replies the child
+  # had to leave off to fit its reply in a single message
+  if (server_["isAggregator"] and (retCode_ == PshellControl.COMMAND_SUCCESS)):
+    try:
+      reply = json.loads(results_)
+    except:
+      reply = None
+    if (isinstance(reply, dict) and ("replies" in reply)):
+      for child in reply["replies"]:
+        showReply_([server_["localName"]]+child["path"], child["remoteServer"], child["results"], child["retCode"], child["truncated"])
+      return (reply["numReplies"], reply["numServers"])
+    # not a reply we can use, e.g. it was cut short, it is never passed on as
+    # the output of the child
+    (results_, retCode_) = ("", PshellControl.SOCKET_RECEIVE_FAILURE)
+  showReply_([server_["localName"]], server_["remoteServer"], results_, retCode_, 0)
+  if (retCode_ == PshellControl.COMMAND_SUCCESS):
+    return (1, 1)
+  return (0, 1)
+
+#################################################################################
+#################################################################################
+def _encodeMulticastReplies(replies_, numReplies_, numServers_):
+  # the reply of a forwarded multicast, when the replies do not all fit in
+  # a single message the longest outputs are cut down first, each one is
+  # marked with its original length, and if the replies without their outputs
+  # still do not fit, the last ones are left off, the counts always cover all
+  # the servers that were reached
+  encoded = json.dumps({"replies":replies_, "numReplies":numReplies_, "numServers":numServers_})
+  if (len(encoded) <= _gMaxTreeReplySize):
+    return (encoded)
+  available = _gMaxTreeReplySize-len(json.dumps({"replies":[], "numReplies":numReplies_, "numServers":numServers_}))
+  replies = []
+  for reply in replies_:
+    truncated = max(reply["truncated"], len(reply["results"]))
+    size = len(json.dumps(dict(reply, results="", truncated=truncated)))+len(", ")
+    if (size > available):
+      break
+    available -= size
+    replies.append(reply)
+  sizes = [len(json.dumps(reply["results"]))-len('""') for reply in replies]
+  share = _getFairShare(sizes, available)
+  for index, reply in enumerate(replies):
+    if (sizes[index] > share):
+      replies[index] = dict(reply,
+                            results=_truncateResults(reply["results"], share),
+                            truncated=max(reply["truncated"], len(reply["results"])))
+  return (json.dumps({"replies":replies, "numReplies":numReplies_, "numServers":numServers_}))
+
+#################################################################################
+#################################################################################
+def _getFairShare(sizes_, available_):
+  # the largest size that every output can be cut down to so they all fit in
+  # the available space, outputs smaller than that are left whole and the space
+  # they do not use is shared by the rest
+  remaining = available_
+  numLeft = len(sizes_)
+  for size in sorted(sizes_):
+    if (size*numLeft > remaining):
+      return (remaining//numLeft)
+    remaining -= size
+    numLeft -= 1
+  return (max(sizes_ + [0]))
+
+#################################################################################
+#################################################################################
+def _truncateResults(results_, maxSize_):
+  # cut the output down until it encodes in no more than maxSize_ characters,
+  # each character encodes to at least one, so we never cut off too much
+  length = min(len(results_), maxSize_)
+  size = len(json.dumps(results_[:length]))-len('""')
+  while (size > maxSize_):
+    length -= (size-maxSize_)
+    size = len(json.dumps(results_[:length]))-len('""')
+  return (results_[:length])
+
+#################################################################################
+#################################################################################
+def _showMulticastReply(path_, remoteServer_, results_, retCode_, truncated_ = 0):
+  PshellServer.printf()
+  if (retCode_ == PshellControl.COMMAND_SUCCESS):
+    PshellServer.printf("***** %s[%s] *****" % ("/".join(path_), remoteServer_))
+    PshellServer.printf(results_, newline=False)
+    if (truncated_ > 0):
+      if (not results_.endswith("\n")):
+        PshellServer.printf()
+      PshellServer.printf("***** output truncated, %d of %d characters shown *****" % (len(results_), truncated_))
+  else:
+    PshellServer.printf("***** %s[%s]: %s *****" % ("/".join(path_),
+                                                   remoteServer_,
+                                                   PshellControl.getResponseString(retCode_)))
+
+#################################################################################
+#################################################################################
+def _watch(argv):
+  global _gLock
+  global _gWatchStopped
+  if (PshellServer.isHelp()):
+    PshellServer.printf()
+    PshellServer.showUsage()
+    PshellServer.printf()
+    PshellServer.printf("  where:")
+    PshellServer.printf("    <interval> - Seconds from the start of one round to the start of the next")
+    PshellServer.printf("    <command>  - Registered multicast command and its arguments")
+    PshellServer.printf()
+    PshellServer.printf("  Rerun a multicast command and only show the servers whose output")
+    PshellServer.printf("  changed since the previous round, type Ctrl-C to stop")
+    PshellServer.printf()
+    return
+  elif (((not PshellServer.isDec(argv[1])) and (not PshellServer.isFloat(argv[1]))) or (float(argv[1]) <= 0)):
+    PshellServer.showUsage()
+    return
+  elif (PshellServer._gServerType != PshellServer.LOCAL):
+    PshellServer.printf("PSHELL_ERROR: The watch command can only be run interactively")
+    return
+  elif (_getTimeout() == 0):
+    PshellServer.printf("PSHELL_ERROR: The watch command needs a response timeout")
+    return
+  with _gLock:
+    servers = _getMulticastServers(argv[2])
+  if (len(servers) == 0):
+    PshellServer.printf("PSHELL_ERROR: Multicast command: '%s', not found" % argv[2])
+    return
+  command = ' '.join(argv[2:])
+  interval = float(argv[1])
+  timeout = _getTimeout()
+  previous = {}
+  numRounds = 0
+  PshellServer.printf("Watching multicast command: '%s' every %s second(s), type Ctrl-C to stop" % (command, argv[1]))
+  _gWatchStopped = False
+  signal.signal(signal.SIGINT, _stopWatch)
+  try:
+    nextTime = time.time()
+    while (not _gWatchStopped):
+      numRounds += 1
+      # the lock is only held for a round, so servers can still be discovered
+      # between rounds, the group is looked up again for each round
+      with _gLock:
+        (numReplies, numServers, numChanged) = _watchRound(argv[2], command, timeout, previous)
+      if (numChanged > 0):
+        PshellServer.printf()
+        PshellServer.printf("Round %d at %s: %d of %d server(s) replied, %d changed" % (numRounds,
+                                                                                    time.strftime("%H:%M:%S"),
+                                                                                    numReplies,
+                                                                                    numServers,
+                                                                                    numChanged))
+      # a round that takes longer than the interval is never overlapped or
+      # followed by a burst of catch up rounds, the ticks it overran are skipped
+      nextTime += interval
+      if (nextTime < time.time()):
+        numSkipped = int((time.time()-nextTime)/interval)+1
+        nextTime += numSkipped*interval
+        PshellServer.printf("PSHELL_WARNING: Round %d took longer than the interval, skipped %d round(s)" % (numRounds, numSkipped))
+      while ((not _gWatchStopped) and (time.time() < nextTime)):
+        time.sleep(max(min(nextTime-time.time(), 0.1), 0))
+  finally:
+    signal.signal(signal.SIGINT, _signalHandler)
+  PshellServer.printf("Stopped watching multicast command: '%s' after %d round(s)" % (command, numRounds))
+
+#################################################################################
+#################################################################################
+def _watchRound(keyword_, command_, timeout_, previous_):
+  # previous_ holds the last (retCode, results) of each server keyed by its
+  # path, returns the number of servers that replied, the number of servers
+  # the command reached and the number of servers whose reply changed
+  replies = []
+  def addReply(path_, remoteServer_, results_, retCode_, truncated_):
+    replies.append((path_, remoteServer_, results_, retCode_, truncated_))
+  (numReplies, numServers) = _gatherMulticast(_getMulticastServers(keyword_), command_, timeout_, addReply)
+  numChanged = 0
+  for (path, remoteServer, results, retCode, truncated) in replies:
+    key = "/".join(path)
+    if (previous_.get(key) == (retCode, results)):
+      continue
+    numChanged += 1
+    if ((key in previous_) and (retCode == PshellControl.COMMAND_SUCCESS) and
+        (previous_[key][0] == PshellControl.COMMAND_SUCCESS)):
+      _showWatchDiff(path, remoteServer, previous_[key][1], results)
+    else:
+      # first reply, or the server stopped or started replying
+      _showMulticastReply(path, remoteServer, results, retCode, truncated)
+    previous_[key] = (retCode, results)
+  return (numReplies, numServers, numChanged)
+
+#################################################################################
+#################################################################################
+def _showWatchDiff(path_, remoteServer_, previous_, results_):
+  PshellServer.printf()
+  PshellServer.printf("***** %s[%s]: changed *****" % ("/".join(path_), remoteServer_))
+  # skip the two file header lines, only the hunks are shown
+  for line in list(difflib.unified_diff(previous_.splitlines(), results_.splitlines(), lineterm="", n=0))[2:]:
+    PshellServer.printf(line)
+
+#################################################################################
+#################################################################################
+def _stopWatch(signal, frame):
+  global _gWatchStopped
+  print("")
+  _gWatchStopped = True
 
 #################################################################################
 #################################################################################
@@ -293,16 +1392,48 @@ def _registerSignalHandlers():
 ##############################
 if (__name__ == '__main__'):
 
-  # verify usage
-  if (len(sys.argv) != 1):
+  # verify usage, by default we run as an interactive local server, we can also
+  # be run as a UDP or UNIX server so we can be added to a parent aggregator
+  serverName = "pshellAggregator"
+  serverType = PshellServer.LOCAL
+  hostnameOrIpAddr = None
+  port = 0
+  isValid = True
+  index = 1
+  while (isValid and (index < len(sys.argv))):
+    if ((sys.argv[index] == "-udp") and (index+1 < len(sys.argv)) and sys.argv[index+1].isdigit()):
+      serverType = PshellServer.UDP
+      port = int(sys.argv[index+1])
+      hostnameOrIpAddr = PshellServer.ANYHOST
+      index += 2
+      if ((index < len(sys.argv)) and (sys.argv[index][0] != "-")):
+        hostnameOrIpAddr = sys.argv[index]
+        index += 1
+    elif (sys.argv[index] == "-unix"):
+      serverType = PshellServer.UNIX
+      index += 1
+    elif ((sys.argv[index] == "-n") and (index+1 < len(sys.argv))):
+      serverName = sys.argv[index+1]
+      index += 2
+    else:
+      isValid = False
+  if (not isValid):
     print("")
-    print("Usage: %s" % os.path.basename(sys.argv[0]))
+    print("Usage: %s [{-udp <port> [<host>]} | -unix] [-n <serverName>]" % os.path.basename(sys.argv[0]))
     print("")
     print("  Client program that will allow for the aggregation of multiple remote")
     print("  UDP/UNIX pshell servers into one consolidated client shell.  This program")
     print("  can also create multicast groups for sets of remote servers.  The remote")
     print("  servers and multicast groups can be added interactively via the 'add'")
-    print("  command or at startup via the 'pshellAggregator.startup' file.")
+    print("  command or at startup via the '<serverName>.startup' file.")
+    print("")
+    print("  where:")
+    print("    -udp <port> [<host>] - run as a UDP server (default host=anyhost)")
+    print("    -unix                - run as a UNIX server")
+    print("    -n <serverName>      - server name (default=pshellAggregator)")
+    print("")
+    print("  An aggregator run as a UDP or UNIX server can be added to a parent")
+    print("  aggregator with the parent's 'add aggregator' command.")
     print("")
     exit (0)
 
@@ -323,23 +1454,31 @@ if (__name__ == '__main__'):
   PshellControl._gSupressInvalidArgCountMessage = True
 
   # register our callback commands
-  PshellServer.addCommand(_add,
+  PshellServer.addCommand(_synchronized(_add),
                           "add",
                           "add a new remote server or multicast group entry",
-                          "{server <localName> <remoteServer> [<port>]} | {multicast <keyword> <localName1> [<localName2>...<localNameN>]}",
-                          4,
+                          "{server | aggregator <localName> <remoteServer> [<port>]} | {subnet <bcastAddr> <port> [<numPorts>]} | {multicast <keyword> <localName1> [<localName2>...<localNameN>]} | {file <filename>} | discovered",
+                          2,
                           30,
                           False)
 
-  PshellServer.addCommand(_show,
+  PshellServer.addCommand(_synchronized(_remove),
+                          "remove",
+                          "remove a remote server or multicast group entry",
+                          "{server <localName>} | {multicast <keyword> [<localName1>...<localNameN>]}",
+                          3,
+                          30,
+                          False)
+
+  PshellServer.addCommand(_synchronized(_show),
                           "show",
-                          "show aggregated servers or multicast group info",
-                          "servers | multicast",
+                          "show aggregated servers, their health or multicast group info",
+                          "servers | health | multicast",
                           2,
                           2,
                           True)
 
-  PshellServer.addCommand(_multicast,
+  PshellServer.addCommand(_synchronized(_multicast),
                           "multicast",
                           "send multicast command to registered server group",
                           "<command>",
@@ -347,8 +1486,42 @@ if (__name__ == '__main__'):
                           30,
                           False)
 
+  PshellServer.addCommand(_synchronized(_import),
+                          "import",
+                          "register the commands of remote servers locally",
+                          "{server <localName>} | all",
+                          2,
+                          3,
+                          False)
+
+  PshellServer.addCommand(_synchronized(_lazy),
+                          "lazy",
+                          "only connect the servers when they are used",
+                          "[<idleTimeout> | off]",
+                          1,
+                          2,
+                          False)
+
+  PshellServer.addCommand(_synchronized(_ping),
+                          "ping",
+                          "ping the aggregated servers in the background",
+                          "[<interval> | off]",
+                          1,
+                          2,
+                          False)
+
+  # the watch command takes the lock itself for each round rather than for
+  # the whole time it runs
+  PshellServer.addCommand(_watch,
+                          "watch",
+                          "rerun a multicast command and show the servers whose output changed",
+                          "<interval> <command>",
+                          3,
+                          30,
+                          False)
+
   # start our local pshell server
-  PshellServer.startServer("pshellAggregator", PshellServer.LOCAL, PshellServer.BLOCKING)
+  PshellServer.startServer(serverName, serverType, PshellServer.BLOCKING, hostnameOrIpAddr, port)
 
   # disconnect all our remote control servers
   PshellControl.disconnectAllServers()